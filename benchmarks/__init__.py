@@ -0,0 +1,13 @@
+"""
+Benchmarks of excel_magic on synthetic workbooks.
+
+Run every scenario and write the results as json, to compare two commits:
+
+    python -m benchmarks --rows 20000 --output before.json
+    python -m benchmarks --rows 20000 --output after.json
+    python -m benchmarks compare before.json after.json
+"""
+from benchmarks.generate import WorkbookSpec, make_workbook
+from benchmarks.run import SCENARIOS, run, compare
+
+__all__ = ['WorkbookSpec', 'make_workbook', 'SCENARIOS', 'run', 'compare']
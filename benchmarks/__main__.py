@@ -0,0 +1,68 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.generate import KINDS, WorkbookSpec
+from benchmarks.run import SCENARIOS, compare, run
+
+
+def _run(args) -> None:
+    spec = WorkbookSpec(rows=args.rows, cols=args.cols, sheets=args.sheets, kinds=tuple(args.kinds.split(',')),
+                        formulas=args.formulas, images=args.images, seed=args.seed)
+    scenarios = None if args.only is None else args.only.split(',')
+
+    def progress(name: str, result: dict):
+        memory = f', {result["peak_memory"] / (1 << 20):.1f} MB peak' if 'peak_memory' in result else ''
+        print(f'{name:<18} {result["min"]:.4f} s best, {result["median"]:.4f} s median{memory}', file=sys.stderr)
+
+    results = run(spec, args.directory, scenarios, args.repeat, not args.no_memory, progress)
+    if args.output == '-':
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+def _compare(args) -> None:
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    for name, ratios in compare(before, after).items():
+        memory = f'  memory x{ratios["memory"]:.2f}' if ratios.get('memory') is not None else ''
+        time = f'x{ratios["time"]:.2f}' if ratios['time'] is not None else '-'
+        print(f'{name:<18} {ratios["before"]:.4f} s -> {ratios["after"]:.4f} s  {time}{memory}')
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='benchmarks of excel_magic')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--cols', type=int, default=8)
+    parser.add_argument('--sheets', type=int, default=1)
+    parser.add_argument('--kinds', default=','.join(KINDS), help='kinds of the generated columns: ' + ', '.join(KINDS))
+    parser.add_argument('--formulas', type=int, default=0, help='formula columns')
+    parser.add_argument('--images', type=int, default=0, help='images in the first sheet')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', help='comma separated scenarios: ' + ', '.join(SCENARIOS))
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory measures')
+    parser.add_argument('--directory', default=os.path.join(tempfile.gettempdir(), 'excel_magic_benchmarks'),
+                        help='where workbooks are generated')
+    parser.add_argument('--output', default='-', help='json file of the results, - for stdout')
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) != 0 and argv[0] == 'compare':
+        compare_parser = argparse.ArgumentParser(prog='python -m benchmarks compare',
+                                                 description='compare two results of python -m benchmarks')
+        compare_parser.add_argument('before')
+        compare_parser.add_argument('after')
+        _compare(compare_parser.parse_args(argv[1:]))
+    else:
+        _run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
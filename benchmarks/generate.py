@@ -0,0 +1,126 @@
+import datetime
+import os
+import random
+from io import BytesIO
+from typing import List, Tuple
+
+import xlsxwriter
+from PIL import Image
+
+# kinds of generated columns, used in turn after the Id and Name columns
+KINDS = ('int', 'float', 'text', 'date', 'datetime', 'bool')
+# creation time written in the file, a fixed one keeps files of the same spec identical
+CREATED = datetime.datetime(2020, 1, 1)
+
+
+class WorkbookSpec:
+    """
+    Parameters of a synthetic workbook, the same spec always gives the same file
+    :param rows: data rows of every sheet
+    :param cols: columns of every sheet, including Id and Name
+    :param sheets: number of sheets
+    :param kinds: kinds of the other columns, taken in turn
+    :param formulas: columns holding a formula on the Id column, added after the others
+    :param images: images inserted in the first sheet, below the data
+    :param seed: seed of the random values
+    """
+
+    def __init__(self, rows: int = 10000, cols: int = 8, sheets: int = 1, kinds: Tuple[str, ...] = KINDS,
+                 formulas: int = 0, images: int = 0, seed: int = 0):
+        for kind in kinds:
+            if kind not in KINDS:
+                raise ValueError(f'unknown column kind {kind}')
+        if cols < 2:
+            raise ValueError('at least 2 columns are required')
+        self.rows = rows
+        self.cols = cols
+        self.sheets = sheets
+        self.kinds = tuple(kinds)
+        self.formulas = formulas
+        self.images = images
+        self.seed = seed
+
+    def fields(self) -> List[str]:
+        result = ['Id', 'Name']
+        for i in range(self.cols - 2):
+            result.append(f'{self.kinds[i % len(self.kinds)].capitalize()}{i}')
+        result.extend(f'Formula{i}' for i in range(self.formulas))
+        return result
+
+    def filename(self) -> str:
+        return f'bench_{self.rows}r_{self.cols}c_{self.sheets}s_{"-".join(self.kinds)}' \
+               f'_{self.formulas}f_{self.images}i_{self.seed}.xlsx'
+
+    def as_dict(self) -> dict:
+        return {'rows': self.rows, 'cols': self.cols, 'sheets': self.sheets, 'kinds': list(self.kinds),
+                'formulas': self.formulas, 'images': self.images, 'seed': self.seed}
+
+
+def make_image(seed: int, size: int = 32) -> BytesIO:
+    """
+    small png filled with a color taken from the seed
+    """
+    rng = random.Random(seed)
+    image = Image.new('RGB', (size, size), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    data = BytesIO()
+    image.save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+def _value(rng: random.Random, kind: str, row: int):
+    if kind == 'int':
+        return rng.randrange(-1000000, 1000000)
+    elif kind == 'float':
+        return round(rng.uniform(-1000, 1000), 3)
+    elif kind == 'text':
+        return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randrange(3, 16)))
+    elif kind == 'date':
+        return datetime.date(2000, 1, 1) + datetime.timedelta(days=rng.randrange(10000))
+    elif kind == 'datetime':
+        return datetime.datetime(2000, 1, 1) + datetime.timedelta(seconds=rng.randrange(10000 * 86400))
+    else:
+        return row % 2 == 0
+
+
+def make_workbook(spec: WorkbookSpec, directory: str) -> str:
+    """
+    write the workbook of a spec in a directory, an existing file of the same spec is reused
+    :return: path of the file
+    """
+    path = os.path.join(directory, spec.filename())
+    if os.path.exists(path):
+        return path
+    os.makedirs(directory, exist_ok=True)
+    temp = path + '.tmp'
+    workbook = xlsxwriter.Workbook(temp, {'constant_memory': True})
+    workbook.set_properties({'created': CREATED})
+    date_format = workbook.add_format({'num_format': 'yyyy/mm/dd'})
+    datetime_format = workbook.add_format({'num_format': 'yyyy/mm/dd hh:mm:ss'})
+    fields = spec.fields()
+    kinds = ['int', 'text'] + [spec.kinds[i % len(spec.kinds)] for i in range(spec.cols - 2)]
+    rng = random.Random(spec.seed)
+    # a few hundred names, find and diff have repeated values to look for
+    names = [f'name{i}' for i in range(max(spec.rows // 50, 1))]
+    for number in range(spec.sheets):
+        sheet = workbook.add_worksheet(f'Sheet{number + 1}')
+        sheet.write_row(0, 0, fields)
+        for row in range(1, spec.rows + 1):
+            sheet.write_number(row, 0, row)
+            sheet.write_string(row, 1, rng.choice(names))
+            for col in range(2, len(kinds)):
+                value = _value(rng, kinds[col], row)
+                if kinds[col] == 'date':
+                    sheet.write_datetime(row, col, value, date_format)
+                elif kinds[col] == 'datetime':
+                    sheet.write_datetime(row, col, value, datetime_format)
+                else:
+                    sheet.write(row, col, value)
+            for i in range(spec.formulas):
+                sheet.write_formula(row, len(kinds) + i, f'=A{row + 1}*{i + 2}', None, row * (i + 2))
+        if number == 0:
+            for i in range(spec.images):
+                sheet.insert_image(spec.rows + 2 + i * 3, 0, f'image{i}.png', {'image_data': make_image(spec.seed + i)})
+    workbook.close()
+    os.replace(temp, path)
+    return path
@@ -0,0 +1,238 @@
+import gc
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Union
+
+from excel_magic.dataset import Dataset, ImageCell, Sheet
+from excel_magic.diff import diff, strict_diff
+from benchmarks.generate import WorkbookSpec, make_image, make_workbook
+
+# version of the json written by run, bumped when its layout changes
+FORMAT = 1
+
+
+class Context:
+    """
+    Workbook of a run and the data shared by the scenarios, the dataset is loaded once
+    """
+
+    def __init__(self, spec: WorkbookSpec, path: str, directory: str):
+        self.spec = spec
+        self.path = path
+        self.directory = directory
+        self._dataset: Union[Dataset, None] = None
+
+    def sheet(self) -> Sheet:
+        if self._dataset is None:
+            self._dataset = Dataset(self.path, suppress_warning=True)
+        return self._dataset.get_sheet_by_index(0)
+
+    def names(self, count: int = 100) -> List[str]:
+        return [f'name{i}' for i in range(0, max(self.spec.rows // 50, 1), max(self.spec.rows // 50 // count, 1))]
+
+    def working_copy(self) -> str:
+        """
+        copy of the workbook which can be saved over
+        """
+        path = os.path.join(self.directory, 'save_' + self.spec.filename())
+        shutil.copy(self.path, path)
+        return path
+
+
+# a scenario prepares its data and returns the operation to measure, it is called again before every run
+
+def bench_load(context: Context) -> Callable[[], Any]:
+    return lambda: Dataset(context.path, suppress_warning=True)
+
+
+def bench_load_columnar(context: Context) -> Callable[[], Any]:
+    return lambda: Dataset(context.path, suppress_warning=True, columnar=True)
+
+
+def bench_find(context: Context) -> Callable[[], Any]:
+    sheet = context.sheet()
+    sheet.indexes.clear()
+    names = context.names()
+    return lambda: [sheet.find(Name=name) for name in names]
+
+
+def bench_find_indexed(context: Context) -> Callable[[], Any]:
+    sheet = context.sheet()
+    sheet.indexes.clear()
+    sheet.create_index('Name')
+    names = context.names()
+    # the index is built by the first find
+    sheet.find(Name=names[0])
+    return lambda: [sheet.find(Name=name) for name in names]
+
+
+def bench_query(context: Context) -> Callable[[], Any]:
+    sheet = context.sheet()
+    sheet.indexes.clear()
+    expression = f"Id > {context.spec.rows // 2} and Name != 'name0' or Name in ('name1', 'name2')"
+    return lambda: sheet.query(expression)
+
+
+def bench_sort_by(context: Context) -> Callable[[], Any]:
+    sheet = context.sheet().copy()
+    return lambda: sheet.sort_by(['Name', 'Id'], desc=[False, True])
+
+
+def _changed_copy(sheet: Sheet, remove: bool = True) -> Sheet:
+    """
+    copy with one row in a hundred changed and, if remove, one in two hundred removed
+    """
+    result = sheet.copy()
+    rows = result.data_rows
+    for i in range(0, len(rows), 100):
+        rows[i]['Name'].value = 'changed'
+    if remove:
+        result.data_rows = [r for i, r in enumerate(rows) if i % 200 != 199]
+    return result
+
+
+def bench_diff(context: Context) -> Callable[[], Any]:
+    sheet = context.sheet()
+    other = _changed_copy(sheet)
+    return lambda: diff(sheet, other)
+
+
+def bench_diff_keyed(context: Context) -> Callable[[], Any]:
+    sheet = context.sheet()
+    other = _changed_copy(sheet)
+    return lambda: diff(sheet, other, key=['Id'])
+
+
+def bench_strict_diff(context: Context) -> Callable[[], Any]:
+    sheet = context.sheet()
+    # rows are compared by position, both sheets keep the same length
+    other = _changed_copy(sheet, remove=False)
+    return lambda: strict_diff(sheet, other)
+
+
+def bench_save(context: Context) -> Callable[[], Any]:
+    dataset = Dataset(context.working_copy(), suppress_warning=True)
+    dataset.get_sheet_by_index(0).data_rows[0]['Name'].value = 'changed'
+    return lambda: dataset.save(backup=False, incremental=False)
+
+
+def bench_save_incremental(context: Context) -> Callable[[], Any]:
+    dataset = Dataset(context.working_copy(), suppress_warning=True)
+    dataset.get_sheet_by_index(0).data_rows[0]['Name'].value = 'changed'
+    return lambda: dataset.save(backup=False, incremental=True)
+
+
+def bench_save_images(context: Context) -> Callable[[], Any]:
+    dataset = Dataset(context.working_copy(), suppress_warning=True)
+    sheet = dataset.get_sheet_by_index(0)
+    rows = sheet.data_rows
+    count = min(max(context.spec.images, 10), len(rows))
+    for i in range(count):
+        path = os.path.join(context.directory, f'image{i % 10}.png')
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(make_image(context.spec.seed + i % 10).getvalue())
+        rows[i * len(rows) // count]['Name'] = ImageCell(path)
+    return lambda: dataset.save(backup=False)
+
+
+SCENARIOS: Dict[str, Callable[[Context], Callable[[], Any]]] = {
+    'load'            : bench_load,
+    'load_columnar'   : bench_load_columnar,
+    'find'            : bench_find,
+    'find_indexed'    : bench_find_indexed,
+    'query'           : bench_query,
+    'sort_by'         : bench_sort_by,
+    'diff'            : bench_diff,
+    'diff_keyed'      : bench_diff_keyed,
+    'strict_diff'     : bench_strict_diff,
+    'save'            : bench_save,
+    'save_incremental': bench_save_incremental,
+    'save_images'     : bench_save_images,
+}
+
+
+def _commit() -> Union[str, None]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _measure(scenario: Callable[[Context], Callable[[], Any]], context: Context, repeat: int,
+             memory: bool) -> dict:
+    seconds = []
+    for _ in range(repeat):
+        action = scenario(context)
+        gc.collect()
+        start = time.perf_counter()
+        action()
+        seconds.append(time.perf_counter() - start)
+    result = {'seconds': seconds, 'min': min(seconds), 'median': statistics.median(seconds)}
+    if memory:
+        # measured in a run of its own, tracing slows the operation down
+        action = scenario(context)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            action()
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run(spec: WorkbookSpec, directory: str, scenarios: Union[List[str], None] = None, repeat: int = 3,
+        memory: bool = True, progress: Union[Callable[[str, dict], None], None] = None) -> dict:
+    """
+    measure scenarios on the workbook of a spec
+    :param directory: where workbooks are generated and saved, generated ones are reused by later runs
+    :param scenarios: names of the scenarios to run, all of them by default
+    :param repeat: timed runs of every scenario
+    :param memory: also measure the peak memory allocated by python in one more run
+    :param progress: called with the name and the result of every finished scenario
+    :return: results with the spec and the environment, can be dumped as json
+    """
+    names = list(SCENARIOS) if scenarios is None else scenarios
+    for name in names:
+        if name not in SCENARIOS:
+            raise NameError(f'scenario {name} not found')
+    context = Context(spec, make_workbook(spec, directory), directory)
+    results = {}
+    for name in names:
+        results[name] = _measure(SCENARIOS[name], context, repeat, memory)
+        if progress is not None:
+            progress(name, results[name])
+    return {
+        'format'     : FORMAT,
+        'spec'       : spec.as_dict(),
+        'environment': {'python': sys.version.split()[0], 'platform': platform.platform(),
+                        'machine': platform.machine(), 'cpus': os.cpu_count(), 'commit': _commit()},
+        'repeat'     : repeat,
+        'results'    : results,
+    }
+
+
+def compare(before: dict, after: dict) -> Dict[str, dict]:
+    """
+    ratios after / before of the best time and of the peak memory of the scenarios in both results
+    """
+    if before['spec'] != after['spec']:
+        raise ValueError('results were measured on different workbooks')
+    result = {}
+    for name, old in before['results'].items():
+        new = after['results'].get(name)
+        if new is None:
+            continue
+        ratios = {'before': old['min'], 'after': new['min'], 'time': new['min'] / old['min'] if old['min'] else None}
+        if 'peak_memory' in old and 'peak_memory' in new:
+            ratios['memory'] = new['peak_memory'] / old['peak_memory'] if old['peak_memory'] else None
+        result[name] = ratios
+    return result
@@ -1,20 +1,50 @@
+import ast
 import datetime
+import operator
 import re
 import zipfile
+from xml.etree import ElementTree
 from collections.abc import MutableMapping
+import collections.abc
+from array import array
 from copy import copy
+from itertools import compress, repeat
 import sqlite3
-from io import BytesIO
+import struct
+from io import BytesIO, TextIOWrapper
 import xlrd
-from typing import Callable, Union, List, Any, Tuple, Dict
+import xlrd.xlsx
+from typing import Callable, Union, List, Any, Tuple, Dict, Iterable, Iterator, Sequence
 import os
+import posixpath
 import shutil
+import sys
+import threading
 import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
 import csv
+import heapq
+import concurrent.futures
+import hashlib
+import pickle
+import time
+import tempfile
 import json
+import contextlib
+import cProfile
+import pstats
 from PIL import Image
+try:
+    import resource
+except ImportError:
+    # not available on windows
+    resource = None
 
-__all__ = ['Sheet', 'Dataset', 'open_file']
+__all__ = ['Sheet', 'Dataset', 'Filter', 'WorkbookCache', 'DatasetCache', 'Timer', 'MemoryBudget', 'open_file', 'open_shared', 'iter_rows']
+
+SPREADSHEET_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_RELATIONSHIP_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
 
 
 class Pointer:
@@ -43,7 +73,20 @@ class VerticalAlignment:
     BOTTOM = 'bottom'
 
 
+def _restore_style(key: tuple, frozen: bool) -> 'Style':
+    style = Style(*key[:8])
+    style.num_format = key[8]
+    return Style.shared(style) if frozen else style
+
+
 class Style:
+    __slots__ = ('horizontal_alignment', 'vertical_alignment', 'bold', 'underline', 'font_color', 'font_name',
+                 'font_size', 'fill_color', 'num_format', '_frozen', '_changed')
+    # interned read-only styles by key
+    _pool: Dict[tuple, 'Style'] = {}
+    # bumped whenever a style is changed, _changed holds its value after the last change of a style
+    edits = 0
+
     def __init__(self, horizontal_alignment='left',
                  vertical_alignment='top',
                  bold=False,
@@ -61,6 +104,37 @@ class Style:
         self.font_size = font_size
         self.fill_color = fill_color
         self.num_format = ''
+        self._frozen = False
+
+    def __setattr__(self, key, value):
+        if getattr(self, '_frozen', False):
+            raise AttributeError('shared styles can not be changed, change a copy of it instead')
+        object.__setattr__(self, key, value)
+        Style.edits += 1
+        object.__setattr__(self, '_changed', Style.edits)
+
+    def __reduce__(self):
+        return _restore_style, (self.key(), self._frozen)
+
+    @property
+    def frozen(self) -> bool:
+        return self._frozen
+
+    @staticmethod
+    def shared(style: Union['Style', None] = None) -> 'Style':
+        """
+        get the interned read-only style having the same attributes, cells share it until their style is changed
+        :param style: attributes to use, default style if None
+        """
+        if style is None:
+            style = Style()
+        key = style.key()
+        result = Style._pool.get(key)
+        if result is None:
+            result = copy(style)
+            object.__setattr__(result, '_frozen', True)
+            Style._pool[key] = result
+        return result
 
     def __copy__(self):
         result = Style(self.horizontal_alignment,
@@ -88,8 +162,322 @@ class Style:
             attr['num_format'] = self.num_format
         return attr
 
+    def key(self) -> tuple:
+        """
+        hashable snapshot of every attribute, two styles with the same key produce the same format
+        """
+        return (self.horizontal_alignment,
+                self.vertical_alignment,
+                self.bold,
+                self.underline,
+                self.font_color,
+                self.font_name,
+                self.font_size,
+                self.fill_color,
+                self.num_format)
+
+
+DEFAULT_STYLE = Style.shared()
+
+
+class _CellStyle(Style):
+    """
+    Copy of the read-only style of a cell given by Cell.style, the cell only takes it when it is changed,
+    reading the style of a cell does not change the cell
+    """
+    __slots__ = ('_cell', '_shared')
+
+    def __init__(self, cell: 'Cell', shared: Style):
+        for name in Style.__slots__:
+            object.__setattr__(self, name, getattr(shared, name))
+        object.__setattr__(self, '_frozen', False)
+        object.__setattr__(self, '_cell', cell)
+        object.__setattr__(self, '_shared', shared)
+
+    def __setattr__(self, key, value):
+        object.__setattr__(self, key, value)
+        self._cell._adopt_style(self, self._shared)
+
+
+def _date_style() -> Style:
+    style = Style()
+    style.num_format = 'yyyy/mm/dd'
+    return Style.shared(style)
+
+
+DATE_STYLE = _date_style()
+
+
+class Phase:
+    """
+    Duration of one step of loading or saving, with the rows and cells it handled
+    """
+    __slots__ = ('name', 'sheet', 'seconds', 'rows', 'cells')
+
+    def __init__(self, name: str, sheet: str = '', seconds: float = 0.0, rows: int = 0, cells: int = 0):
+        self.name = name
+        self.sheet = sheet
+        self.seconds = seconds
+        self.rows = rows
+        self.cells = cells
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def cells_per_second(self) -> float:
+        return self.cells / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        where = f' [{self.sheet}]' if self.sheet != '' else ''
+        result = f'{self.name}{where}: {self.seconds:.4f} s'
+        if self.rows != 0:
+            result += f', {self.rows} rows ({self.rows_per_second:.0f}/s)'
+        if self.cells != 0:
+            result += f', {self.cells} cells ({self.cells_per_second:.0f}/s)'
+        return result
+
+
+# given to code timing its phases when there is no timer, nothing is recorded
+_UNTIMED = contextlib.nullcontext(Phase(''))
+
+
+class Timer:
+    """
+    Records the phases of loading and saving a Dataset: opening the file, parsing, converting and
+    catching formulas of every sheet, then writing sheets, creating formats and probing images on save.
+    callback is called with every finished Phase. With profile, the phases also run under cProfile.
+    """
+
+    def __init__(self, callback: Union[Callable[[Phase], None], None] = None, profile: bool = False):
+        self.callback = callback
+        self.phases: List[Phase] = []
+        self.profiler: Union[cProfile.Profile, None] = cProfile.Profile() if profile else None
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def phase(self, name: str, sheet: str = '', rows: int = 0, cells: int = 0) -> Iterator[Phase]:
+        """
+        time the body of a with statement, rows and cells can be set on the yielded phase
+        """
+        record = Phase(name, sheet, rows=rows, cells=cells)
+        if self.profiler is not None and self._depth == 0:
+            self.profiler.enable()
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self._depth -= 1
+            if self.profiler is not None and self._depth == 0:
+                self.profiler.disable()
+            self.add(record)
+
+    def add(self, record: Phase) -> None:
+        """
+        record a phase timed by the caller, like the sum of many short steps
+        """
+        self.phases.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def totals(self) -> Dict[str, float]:
+        """
+        seconds spent in every phase, summed over the sheets
+        """
+        result = {}
+        for record in self.phases:
+            result[record.name] = result.get(record.name, 0.0) + record.seconds
+        return result
+
+    def stats(self) -> pstats.Stats:
+        if self.profiler is None:
+            raise ValueError('Timer was created without profile')
+        return pstats.Stats(self.profiler)
+
+    def report(self) -> str:
+        return '\n'.join(str(record) for record in self.phases)
+
+
+def _resident_memory() -> Union[int, None]:
+    """
+    resident memory of the process in bytes, None where it can not be read
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_memory() -> Union[int, None]:
+    """
+    highest resident memory the process ever had in bytes
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryBudget:
+    """
+    Limit on the resident memory of the process, checked while sheets are loaded and files merged,
+    so that a workbook too big for the process stops it with a MemoryError before it is killed.
+    :param limit: bytes
+    :param action: 'raise' a MemoryError, or 'warn' once
+    :param every: rows loaded or merged between two checks
+    Where the current resident memory can not be read (no /proc, like on macOS or windows) nothing is raised,
+    warnings compare the peak memory of the process instead, which does not go down once memory is freed.
+    """
+
+    def __init__(self, limit: int, action: str = 'raise', every: int = 10000):
+        if action not in ('raise', 'warn'):
+            raise ValueError(f'unknown action {action}')
+        self.limit = limit
+        self.action = action
+        self.every = every
+        self.warned = False
+
+    def check(self, where: str) -> None:
+        used = _resident_memory()
+        kind = 'used'
+        if used is None and self.action == 'warn':
+            used = _peak_memory()
+            kind = 'used at the peak'
+        if used is None or used <= self.limit:
+            return
+        message = f'memory budget of {self.limit >> 20} MB exceeded {where}, {used >> 20} MB {kind}'
+        if self.action == 'raise':
+            raise MemoryError(message)
+        if not self.warned:
+            self.warned = True
+            print(f'Warning: {message}')
+
+
+# sizes of images by content digest, and digests of image files by (path, mtime, size)
+_image_sizes: Dict[bytes, Tuple[int, int]] = {}
+_image_digests: Dict[Tuple[str, int, int], bytes] = {}
+# entries kept before the caches are cleared
+IMAGE_CACHE_SIZE = 1 << 16
+
+
+def _image_digest(data: Union[BytesIO, str]) -> bytes:
+    """
+    digest of the content of an image, files are only read again when they change
+    """
+    if isinstance(data, str):
+        stat = os.stat(data)
+        key = (os.path.abspath(data), stat.st_mtime_ns, stat.st_size)
+        digest = _image_digests.get(key)
+        if digest is None:
+            with open(data, 'rb') as f:
+                digest = hashlib.blake2b(f.read(), digest_size=20).digest()
+            if len(_image_digests) >= IMAGE_CACHE_SIZE:
+                _image_digests.clear()
+            _image_digests[key] = digest
+        return digest
+    return hashlib.blake2b(data.getbuffer(), digest_size=20).digest()
+
+
+def _image_size(data: Union[BytesIO, str], digest: bytes) -> Tuple[int, int]:
+    """
+    width and height of an image, read from its header once per content
+    """
+    size = _image_sizes.get(digest)
+    if size is None:
+        if not isinstance(data, str):
+            # probing moves the position, a shared buffer may be probed by several threads
+            data = BytesIO(data.getbuffer())
+        # PIL reads the header when opening, pixels are only decoded on use
+        with Image.open(data) as img:
+            size = img.size
+        if len(_image_sizes) >= IMAGE_CACHE_SIZE:
+            _image_sizes.clear()
+        _image_sizes[digest] = size
+    return size
+
+
+class _ImageTable:
+    """
+    Images of a workbook being written. Identical images are inserted from the first of them,
+    so one copy is kept until the workbook is closed, and each content is probed once.
+    """
+
+    def __init__(self):
+        # first source of every content
+        self.sources: Dict[bytes, Union[BytesIO, str]] = {}
+        # digests by id of the sources, which are alive while the workbook is written
+        self.digests: Dict[int, Tuple[Union[BytesIO, str], bytes]] = {}
+
+    def _digest(self, data: Union[BytesIO, str]) -> bytes:
+        known = self.digests.get(id(data))
+        if known is not None and known[0] is data:
+            return known[1]
+        digest = _image_digest(data)
+        self.digests[id(data)] = (data, digest)
+        return digest
+
+    def get(self, data: Union[BytesIO, str]) -> Tuple[Union[BytesIO, str], Tuple[int, int]]:
+        """
+        source to insert for an image and its size
+        """
+        digest = self._digest(data)
+        source = self.sources.setdefault(digest, data)
+        return source, _image_size(source, digest)
+
+    def probe(self, images: Iterable[Union[BytesIO, str]], workers: int) -> None:
+        """
+        hash and probe distinct images in a thread pool, the file reads, hashes and header parsing
+        of PIL mostly run without the GIL
+        """
+        distinct = {}
+        for data in images:
+            distinct.setdefault(data if isinstance(data, str) else id(data), data)
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            digests = list(pool.map(_image_digest, distinct.values()))
+            todo = {}
+            for data, digest in zip(distinct.values(), digests):
+                self.digests[id(data)] = (data, digest)
+                self.sources.setdefault(digest, data)
+                if digest not in _image_sizes:
+                    todo.setdefault(digest, data)
+            list(pool.map(_image_size, todo.values(), todo.keys()))
+
+
+class FormatCache:
+    def __init__(self, workbook: xlsxwriter.Workbook, timer: Union[Timer, None] = None):
+        self.workbook = workbook
+        self.formats: Dict[tuple, Any] = {}
+        # images of the workbook, written once like formats
+        self.images = _ImageTable()
+        # time spent creating formats, only measured with a timer
+        self.timer = timer
+        self.seconds = 0.0
+
+    def get(self, style: Style):
+        """
+        get the workbook format of a style, identical styles share one format
+        :param style: cell style
+        :return: xlsxwriter format
+        """
+        key = style.key()
+        fmt = self.formats.get(key)
+        if fmt is None:
+            start = time.perf_counter() if self.timer is not None else 0.0
+            fmt = self.workbook.add_format(style.attr())
+            self.formats[key] = fmt
+            if self.timer is not None:
+                self.seconds += time.perf_counter() - start
+        return fmt
+
 
 class Header:
+    __slots__ = ('value', 'style', 'width')
+
     def __init__(self, value: str, style: Style, width: int = 20):
         self.value = value
         self.style = style
@@ -97,32 +485,88 @@ class Header:
 
 
 class Cell:
+    __slots__ = ('_value', '_style', '_modified', '_row')
+    # bumped on every value change, checked by indexes holding a cell shared by several rows
+    generation = 0
+    # bumped whenever a cell is marked modified, lets sheets skip looking for modified cells
+    edits = 0
+
     def __init__(self, value: Any = '', style: Style = None):
+        # whole floats are stored as int once instead of being checked on every read
+        if type(value) is float and value.is_integer():
+            value = int(value)
         self._value = value
+        self._modified = False
+        # row of the cell while an index covers its field, told of value changes
+        self._row = None
         if style is None:
-            self.style = Style()
+            self._style = DEFAULT_STYLE
         else:
-            self.style = style
+            self._style = style
 
     @property
     def value(self):
-        if isinstance(self._value, float) and self._value % 1 == 0:
-            return int(self._value)
-        else:
-            return self._value
+        return self._value
 
     @value.setter
     def value(self, value):
+        if type(value) is float and value.is_integer():
+            value = int(value)
+        old = self._value
         self._value = value
+        Cell.generation += 1
+        self._modified = True
+        Cell.edits += 1
+        if self._row is not None:
+            self._row._cell_changed(self, old)
+
+    @property
+    def style(self) -> Style:
+        if self._style.frozen:
+            # copy on write, the cell takes the copy when it is changed
+            return _CellStyle(self, self._style)
+        return self._style
+
+    @style.setter
+    def style(self, style: Style):
+        self._style = style
+        self._modified = True
+        Cell.edits += 1
+
+    def _adopt_style(self, style: Style, shared: Style) -> None:
+        """
+        called when a style given by the style property is changed
+        """
+        if self._style is shared:
+            self._style = style
+        if self._style is style:
+            self._modified = True
+            Cell.edits += 1
+
+    def _effective_style(self) -> Style:
+        """
+        style of the cell without copying a shared one
+        """
+        return self._style
 
     def __copy__(self):
         return Cell(self.value)
 
+    def __getstate__(self):
+        # the row watched by an index is left out, it would take its whole sheet along
+        return {k: getattr(self, k) for c in type(self).__mro__ for k in c.__dict__.get('__slots__', ())
+                if k != '_row' and hasattr(self, k)}
+
+    def __setstate__(self, state: dict):
+        self._row = None
+        for k, v in state.items():
+            setattr(self, k, v)
+
     def set_style(self, style: Style):
         self.style = style
 
     def attr(self):
-        return self.style.attr()
+        return self._effective_style().attr()
 
     def __str__(self):
         return str(self.value)
@@ -132,7 +576,7 @@ class Cell:
             return self.value == other
         elif isinstance(other, Cell):
             return self.value == other.value and \
-                   self.style == other.style
+                   self._effective_style().key() == other._effective_style().key()
         else:
             if isinstance(self.value, type(other)):
                 return self.value == other
@@ -143,54 +587,164 @@ class Cell:
 
 
 class ImageCell(Cell):
+    __slots__ = ('data',)
+
     def __init__(self, data: Union[BytesIO, str]):
         super().__init__()
         self.data = data
-        self.value = ''
+        self._value = ''
 
     def __copy__(self):
         return ImageCell(self.data)
 
 
 class FormulaCell(Cell):
+    __slots__ = ('formula',)
+
     def __init__(self, value: Any = '', formula: str = '', style: Style = None):
-        super().__init__()
+        super().__init__(value, style)
         self.formula = formula
 
     def __copy__(self):
-        return FormulaCell(formula=self.formula)
+        return FormulaCell(self.value, self.formula)
 
 
-class Row(MutableMapping):
+class Schema:
+    """
+    Positions of fields, shared by the rows of a sheet
+    """
+    __slots__ = ('fields', 'positions', 'size')
+
     def __init__(self, fields: List[str]):
         self.fields = fields
-        self.raw: Dict[Cell] = {}
+        self.positions: Dict[str, int] = {}
+        self.size = -1
+
+    def position(self, field: str) -> Union[int, None]:
+        if self.size != len(self.fields):
+            # fields were appended
+            self.positions = {f: i for i, f in enumerate(self.fields)}
+            self.size = len(self.fields)
+        return self.positions.get(field)
+
+
+class Row(MutableMapping):
+    __slots__ = ('schema', 'cells', 'extra', 'sheet')
+
+    def __init__(self, fields: List[str], schema: Union[Schema, None] = None):
+        self.schema = Schema(fields) if schema is None else schema
+        # cells by field position, None if missing
+        self.cells: List[Union[Cell, None]] = []
+        # cells of keys which are not fields
+        self.extra: Union[Dict[str, Cell], None] = None
+        # sheet holding the row, notified when a cell is replaced
+        self.sheet: Union['Sheet', None] = None
+
+    @property
+    def fields(self) -> List[str]:
+        return self.schema.fields
+
+    @fields.setter
+    def fields(self, fields: List[str]):
+        raw = self.raw
+        self.schema = Schema(fields)
+        self.cells = []
+        self.extra = None
+        for k in raw:
+            self._set(k, raw[k])
+
+    @property
+    def raw(self) -> Dict[str, Cell]:
+        result = {}
+        for f, c in zip(self.schema.fields, self.cells):
+            if c is not None:
+                result[f] = c
+        if self.extra is not None:
+            result.update(self.extra)
+        return result
 
     def __getitem__(self, item):
-        return self.raw[item]
+        pos = self.schema.position(item)
+        if pos is not None and pos < len(self.cells):
+            c = self.cells[pos]
+            if c is not None:
+                return c
+        if self.extra is not None and item in self.extra:
+            return self.extra[item]
+        raise KeyError(item)
+
+    def _set(self, key, value: Cell):
+        pos = self.schema.position(key)
+        if pos is None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        else:
+            cells = self.cells
+            if pos >= len(cells):
+                cells.extend([None] * (pos + 1 - len(cells)))
+            cells[pos] = value
 
     def __setitem__(self, key, value):
+        old = None
+        if self.sheet is not None and len(self.sheet.indexes) != 0 and key in self:
+            old = self[key]
         if isinstance(value, Cell):
-            self.raw[key] = value
+            self._set(key, value)
         else:
-            self.raw[key] = Cell(value)
+            self._set(key, Cell(value))
+        if self.sheet is not None:
+            self.sheet._changed(self, key, old)
 
     def __iter__(self):
         return self.fields.__iter__()
 
     def __delitem__(self, key):
-        del self.raw[key]
+        pos = self.schema.position(key)
+        if pos is not None and pos < len(self.cells) and self.cells[pos] is not None:
+            self.cells[pos] = None
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+        if self.sheet is not None:
+            self.sheet._changed(self, key, None)
+
+    def _cell_changed(self, cell: Cell, old: Any) -> None:
+        """
+        called by a cell watched by an index when its value changes
+        """
+        if self.sheet is None:
+            return
+        fields = [f for f, c in zip(self.schema.fields, self.cells) if c is cell]
+        if len(fields) == 1:
+            self.sheet._value_changed(self, fields[0], old)
+        elif len(fields) > 1:
+            # the cell is in several fields of the row, the old keys are unknown
+            for f in fields:
+                self.sheet._changed(self, f, None)
 
     def __len__(self):
-        return len(self.raw)
+        count = 0
+        for c in self.cells:
+            if c is not None:
+                count += 1
+        if self.extra is not None:
+            count += len(self.extra)
+        return count
 
     def __contains__(self, item):
-        return item in self.raw
+        try:
+            self[item]
+        except KeyError:
+            return False
+        return True
 
     def __copy__(self):
-        result = Row(self.fields)
-        for i in self.raw:
-            result[i] = copy(self.raw[i])
+        result = Row(self.fields, self.schema)
+        raw = self.raw
+        for i in raw:
+            result[i] = copy(raw[i])
         return result
 
     def filter_fields(self, cols: List[str]) -> 'Row':
@@ -199,13 +753,14 @@ class Row(MutableMapping):
             if col in cols:
                 row.fields.append(col)
         for col in row.fields:
-            row[col] = copy(self.raw[col])
+            row[col] = copy(self[col])
         return row
 
     def __str__(self):
         result = '{'
-        for i in self.raw:
-            result += f'"{i}": {self.raw[i].value}; '
+        raw = self.raw
+        for i in raw:
+            result += f'"{i}": {raw[i].value}; '
         result += '}'
         return result
 
@@ -216,11 +771,11 @@ class Row(MutableMapping):
         if isinstance(other, Row):
             if self.fields == other.fields:
                 for i in self.fields:
-                    if not ((i in self.raw and i in other.raw) or (i not in self.raw and i not in other.raw)):
-                        return False
-                    else:
-                        if self.raw[i].value != other.raw[i].value:
+                    if i in self and i in other:
+                        if self[i].value != other[i].value:
                             return False
+                    elif i in self or i in other:
+                        return False
                 else:
                     return True
             else:
@@ -231,19 +786,22 @@ class Row(MutableMapping):
     def _intersect(self, b: 'Row'):
         result = Row([])
 
-        for i in self.raw:
-            if i in b.raw:
+        raw = self.raw
+        for i in raw:
+            if i in b:
                 result.fields.append(i)
-                result[i] = self[i]
+                result[i] = raw[i]
         return result
 
     def _union(self, b: 'Row'):
         result = Row([])
-        for i in self.raw:
-            result[i] = copy(self.raw[i])
-        for i in b.raw:
-            if i not in result.raw:
-                result[i] = copy(b.raw[i])
+        raw = self.raw
+        for i in raw:
+            result[i] = copy(raw[i])
+        raw = b.raw
+        for i in raw:
+            if i not in result:
+                result[i] = copy(raw[i])
 
         return result
 
@@ -278,18 +836,842 @@ class Row(MutableMapping):
         return self.fields
 
 
-class Sheet:
-    def __init__(self, suppress_warning: bool = False, sheet: Union[xlrd.sheet.Sheet, str] = ''):
+# day 0 of the two excel date systems, as ordinals
+_DATE_EPOCHS = (datetime.date(1899, 12, 30).toordinal(), datetime.date(1904, 1, 1).toordinal())
+# first day which is not a valid date, see xlrd.xldate
+_DAYS_TOO_LARGE = (2958466, 2958466 - 1462)
+
+
+def _date_parts(value: float, datemode: int) -> Union[Tuple[int, int], None]:
+    """
+    split an excel date number in days and seconds like xlrd,
+    None for numbers xlrd rejects or which fall in the 1900 leap year bug
+    """
+    days = int(value)
+    seconds = int(round((value - days) * 86400.0))
+    if seconds == 86400:
+        seconds = 0
+        days += 1
+    if value < 0 or days >= _DAYS_TOO_LARGE[datemode] or (datemode == 0 and 0 < days < 61):
+        return None
+    return days, seconds
+
+
+def _time_of(seconds: int) -> datetime.time:
+    minutes, second = divmod(seconds, 60)
+    hour, minute = divmod(minutes, 60)
+    return datetime.time(hour, minute, second)
+
+
+def _convert_date(value: float, datemode: int) -> Union[datetime.date, datetime.time, datetime.datetime]:
+    """
+    convert an excel date number to a time, a date or a datetime
+    """
+    parts = _date_parts(value, datemode)
+    if parts is not None:
+        days, seconds = parts
+        if days == 0:
+            return _time_of(seconds)
+        day = datetime.date.fromordinal(_DATE_EPOCHS[datemode] + days)
+        if seconds == 0:
+            return day
+        return datetime.datetime.combine(day, _time_of(seconds))
+    dt = [*xlrd.xldate_as_tuple(value, datemode)]
+    try:
+        if dt[0] == 0 or dt[1] == 0 or dt[2] == 0:
+            return datetime.time(dt[3], dt[4], dt[5])
+        elif dt[3] == 0 and dt[4] == 0 and dt[5] == 0:
+            return datetime.date(dt[0], dt[1], dt[2])
+        else:
+            return datetime.datetime(*dt)
+    except:
+        return datetime.datetime(*dt)
+
+
+def _convert_column(values: List[Any], types: List[int], datemode: int) -> Tuple[List[Any], str]:
+    """
+    convert the values of a xlrd column at once, its kind is decided from the cell types of the whole column
+    :return: the values and the kind: empty, int, float, date, datetime, time, text or mixed
+    """
+    kinds = set(types)
+    kinds.discard(xlrd.XL_CELL_EMPTY)
+    kinds.discard(xlrd.XL_CELL_BLANK)
+    if len(kinds) == 0:
+        return ['' if v is None else v for v in values], 'empty'
+    if len(kinds) > 1:
+        # date and number cells are converted one by one
+        result = []
+        for v, t in zip(values, types):
+            if t == xlrd.XL_CELL_DATE:
+                v = _convert_date(v, datemode)
+            elif t == xlrd.XL_CELL_NUMBER and v.is_integer():
+                v = int(v)
+            result.append(v)
+        return result, 'mixed'
+    kind = kinds.pop()
+    if kind == xlrd.XL_CELL_NUMBER:
+        if all(t != xlrd.XL_CELL_NUMBER or v.is_integer() for v, t in zip(values, types)):
+            return [int(v) if t == xlrd.XL_CELL_NUMBER else v for v, t in zip(values, types)], 'int'
+        return [int(v) if t == xlrd.XL_CELL_NUMBER and v.is_integer() else v for v, t in zip(values, types)], 'float'
+    if kind != xlrd.XL_CELL_DATE:
+        return values, 'text' if kind == xlrd.XL_CELL_TEXT else 'mixed'
+
+    parts = [_date_parts(v, datemode) if t == xlrd.XL_CELL_DATE else None for v, t in zip(values, types)]
+    dates = [p for p in parts if p is not None]
+    if all(days == 0 for days, _ in dates):
+        kind = 'time'
+    elif all(seconds == 0 and days != 0 for days, seconds in dates):
+        kind = 'date'
+    else:
+        kind = 'datetime'
+    epoch = _DATE_EPOCHS[datemode]
+    fromordinal = datetime.date.fromordinal
+    combine = datetime.datetime.combine
+    result = []
+    for v, t, p in zip(values, types, parts):
+        if p is not None:
+            days, seconds = p
+            if kind == 'time':
+                v = _time_of(seconds)
+            elif kind == 'date':
+                v = fromordinal(epoch + days)
+            else:
+                v = combine(fromordinal(epoch + days), _time_of(seconds))
+        elif t == xlrd.XL_CELL_DATE:
+            # left to xlrd, which raises for invalid numbers
+            v = _convert_date(v, datemode)
+        result.append(v)
+    return result, kind
+
+
+class Index:
+    """
+    Hash index of a sheet, maps the values of one or more fields to the rows having them.
+    The index is kept up to date by the sheet: appended and removed rows, replaced cells and values
+    assigned to the cells of the indexed fields move rows between buckets, buckets stay in sheet order.
+    """
+
+    def __init__(self, fields: Tuple[str, ...]):
+        self.fields = fields
+        self.table: Dict[tuple, List[Row]] = {}
+        self.stale = True
+        self.usable = True
+        # a cell of the index is also in another row, its changes only show in Cell.generation
+        self.shared = False
+        self.generation = -1
+        # rows the index was built on
+        self.rows: Union[List[Row], None] = None
+        self.length = 0
+        # positions of the rows by id, built when a row moves to another bucket
+        self.positions: Union[Dict[int, int], None] = None
+
+    def key(self, row: Row) -> tuple:
+        return tuple(row[f].value for f in self.fields)
+
+    def build(self, rows: List[Row]) -> None:
+        self.table = {}
+        self.usable = True
+        self.shared = False
+        self.positions = None
+        try:
+            for row in rows:
+                self.add(row)
+        except TypeError:
+            # unhashable cell value, find falls back to scanning
+            self.table = {}
+            self.usable = False
+        self.stale = False
+        self.generation = Cell.generation
+        self.rows = rows
+        self.length = len(rows)
+
+    def is_valid(self, rows: List[Row]) -> bool:
+        return not self.stale \
+               and self.rows is rows \
+               and self.length == len(rows) \
+               and (not self.shared or self.generation == Cell.generation)
+
+    def _watch(self, row: Row, cell: Cell) -> None:
+        if type(cell) is CellView:
+            # views tell their sheet directly
+            return
+        if cell._row is None:
+            cell._row = row
+        elif cell._row is not row:
+            self.shared = True
+
+    def add(self, row: Row) -> None:
+        k = self.key(row)
+        bucket = self.table.get(k)
+        if bucket is None:
+            self.table[k] = [row]
+        else:
+            bucket.append(row)
+        for f in self.fields:
+            self._watch(row, row[f])
+
+    def append(self, row: Row) -> None:
+        """
+        add a row appended to the sheet
+        """
+        self.add(row)
+        if self.positions is not None:
+            self.positions[id(row)] = self.length
+        self.length += 1
+
+    def remove(self, row: Row) -> None:
+        k = self.key(row)
+        bucket = self.table[k]
+        for i in range(len(bucket)):
+            if bucket[i] is row:
+                del bucket[i]
+                break
+        if len(bucket) == 0:
+            del self.table[k]
+        for f in self.fields:
+            c = row[f]
+            if type(c) is not CellView and c._row is row:
+                c._row = None
+        self.length -= 1
+        # later rows moved up
+        self.positions = None
+
+    def _position(self, row: Row) -> int:
+        if isinstance(row, RowView):
+            return row.position
+        if self.positions is None:
+            self.positions = {id(r): i for i, r in enumerate(self.rows)}
+        return self.positions[id(row)]
+
+    def update(self, row: Row, field: str, old: Any) -> None:
+        """
+        move a row to the bucket of its new key after the value of one of its fields changed from old
+        """
+        if not self.usable:
+            # the new value may be hashable
+            self.stale = True
+            return
+        new = self.key(row)
+        old_key = tuple(old if f == field else v for f, v in zip(self.fields, new))
+        try:
+            bucket = self.table.get(old_key)
+            if bucket is None:
+                return
+            for i in range(len(bucket)):
+                if bucket[i] is row:
+                    del bucket[i]
+                    break
+            else:
+                # not a row of the index
+                return
+            if len(bucket) == 0:
+                del self.table[old_key]
+            bucket = self.table.setdefault(new, [])
+        except TypeError:
+            self.stale = True
+            return
+        # binary search of the place of the row in sheet order
+        position = self._position(row)
+        low, high = 0, len(bucket)
+        while low < high:
+            middle = (low + high) // 2
+            if self._position(bucket[middle]) < position:
+                low = middle + 1
+            else:
+                high = middle
+        bucket.insert(low, row)
+
+    def replace(self, row: Row, field: str, old: Cell) -> None:
+        """
+        update the index after the cell of a field was replaced, old is the previous cell
+        """
+        if type(old) is not CellView and old._row is row:
+            old._row = None
+        self._watch(row, row[field])
+        self.update(row, field, old.value)
+
+    def lookup(self, values: tuple) -> List[Row]:
+        return self.table.get(values, [])
+
+
+def _sample(items: Sequence, count: int) -> Sequence:
+    """
+    count items spread over a sequence, all of them if count is 0 or the sequence is shorter
+    """
+    if count <= 0 or len(items) <= count:
+        return items
+    step = len(items) / count
+    return [items[int(i * step)] for i in range(count)]
+
+
+def _memory_report(length: int, rows: int, columns: Dict[str, Dict[str, int]], styles: int, indexes: int) -> dict:
+    """
+    memory report of a sheet from its bytes by field and category, see Sheet.memory_report
+    """
+    categories = {'rows': rows, 'cells': 0, 'strings': 0, 'values': 0, 'styles': styles, 'indexes': indexes}
+    for usage in columns.values():
+        for category, size in usage.items():
+            categories[category] += size
+        usage['total'] = sum(usage.values())
+    return {'total': sum(categories.values()), 'rows': length, 'categories': categories, 'columns': columns}
+
+
+def _join_pairs(left: List[tuple], right: List[tuple], how: str) -> List[Tuple[Union[int, None], Union[int, None]]]:
+    """
+    positions of the joined rows of two sheets from their keys, in the order of the left rows.
+    The smaller side is put in a hash table, keys with an empty value never match.
+    """
+    result = []
+    if len(right) <= len(left):
+        table: Dict[tuple, List[int]] = {}
+        for j, key in enumerate(right):
+            if not any(_is_empty(v) for v in key):
+                table.setdefault(key, []).append(j)
+        matched = set()
+        for i, key in enumerate(left):
+            found = table.get(key)
+            if found is not None and not any(_is_empty(v) for v in key):
+                result.extend((i, j) for j in found)
+                matched.add(key)
+            elif how != 'inner':
+                result.append((i, None))
+        if how == 'outer':
+            result.extend((None, j) for j, key in enumerate(right) if key not in matched)
+        return result
+
+    table: Dict[tuple, List[int]] = {}
+    for i, key in enumerate(left):
+        if not any(_is_empty(v) for v in key):
+            table.setdefault(key, []).append(i)
+    matches: List[Union[List[int], None]] = [None] * len(left)
+    unmatched = []
+    for j, key in enumerate(right):
+        found = table.get(key)
+        if found is None:
+            unmatched.append(j)
+            continue
+        for i in found:
+            if matches[i] is None:
+                matches[i] = []
+            matches[i].append(j)
+    for i, found in enumerate(matches):
+        if found is not None:
+            result.extend((i, j) for j in found)
+        elif how != 'inner':
+            result.append((i, None))
+    if how == 'outer':
+        result.extend((None, j) for j in unmatched)
+    return result
+
+
+def _row_cells(table: 'Sheet', row: Row, fields: List[str], positions: List[int]) -> List[Cell]:
+    """
+    cells of some fields of a row, read at their positions in the sheet schema when the row has it
+    """
+    if type(row) is Row and row.schema is table.schema:
+        cells = row.cells
+        if len(cells) == len(table.schema.fields):
+            result = [cells[p] for p in positions]
+            # "None in" would compare cells with Cell.__eq__
+            if not any(c is None for c in result):
+                return result
+    return [row[f] for f in fields]
+
+
+def _detached_cell(cell: Cell) -> Cell:
+    """
+    copy of a cell which can be added to another sheet
+    """
+    if isinstance(cell, CellView):
+        style = cell._effective_style()
+        return Cell(cell.value, style if style.frozen else copy(style))
+    return _copy_cell(cell)
+
+
+def _detached_cells(cells: List[Cell]) -> List[Cell]:
+    # plain cells with a shared style are the common case
+    return [Cell(c._value, c._style) if type(c) is Cell and c._style.frozen else _detached_cell(c) for c in cells]
+
+
+def _image_cells(table: 'Sheet') -> Iterator[ImageCell]:
+    if isinstance(table, ColumnarSheet):
+        # image cells are kept apart from the columns
+        yield from (c for c in table.cells.values() if isinstance(c, ImageCell))
+        return
+    for row in table.data_rows:
+        for c in row.cells:
+            if isinstance(c, ImageCell):
+                yield c
+
+
+def _copy_cell(cell: Cell) -> Cell:
+    """
+    copy of a cell keeping its style, shared styles stay shared
+    """
+    style = cell._style if cell._style.frozen else copy(cell._style)
+    if type(cell) is Cell:
+        return Cell(cell._value, style)
+    result = copy(cell)
+    result._style = style
+    return result
+
+
+def _sort_value(value: Any, desc: bool = False) -> tuple:
+    """
+    comparable key of a cell value: numbers < dates < times < strings < others, empty cells always last
+    """
+    if value == '' or value is None:
+        return (0, 0, 0) if desc else (1, 0, 0)
+    empty = 1 if desc else 0
+    if isinstance(value, (bool, int, float)):
+        return empty, 0, value
+    if isinstance(value, datetime.datetime):
+        return empty, 1, value
+    if isinstance(value, datetime.date):
+        return empty, 1, datetime.datetime(value.year, value.month, value.day)
+    if isinstance(value, datetime.time):
+        return empty, 2, value
+    if isinstance(value, str):
+        return empty, 3, value
+    return empty, 4, str(value)
+
+
+class SortKey:
+    """
+    multi field sort key where every field has its own direction
+    """
+
+    def __init__(self, parts: tuple, desc: tuple):
+        self.parts = parts
+        self.desc = desc
+
+    def __lt__(self, other: 'SortKey'):
+        for a, b, d in zip(self.parts, other.parts, self.desc):
+            if a != b:
+                return a > b if d else a < b
+        return False
+
+    def __eq__(self, other: 'SortKey'):
+        return self.parts == other.parts
+
+
+def _read_run(f) -> Iterator:
+    f.seek(0)
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
+
+def external_sort(items: Iterable, chunk_size: int) -> Iterator:
+    """
+    sort items that do not fit in memory, sorted runs of chunk_size items are spilled to temporary files
+    and merged back
+    :param items: picklable and comparable items
+    :param chunk_size: max number of items kept in memory while building runs
+    :return: iterator of the sorted items
+    """
+    runs = []
+    chunk = []
+    try:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                runs.append(_spill(chunk))
+                chunk = []
+        if len(runs) == 0:
+            chunk.sort()
+            yield from chunk
+            return
+        if len(chunk) != 0:
+            runs.append(_spill(chunk))
+        chunk = []
+        yield from heapq.merge(*[_read_run(f) for f in runs])
+    finally:
+        for f in runs:
+            f.close()
+
+
+def _spill(chunk: list):
+    chunk.sort()
+    f = tempfile.TemporaryFile()
+    for item in chunk:
+        pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+    return f
+
+
+class Aggregation:
+    """
+    Streaming aggregation of one field over a group: count, sum, min, max, mean, first, last,
+    or a callable reducer(accumulated, value) starting from the first value. Empty cells are
+    skipped by everything but count, first and last.
+    """
+    NAMES = ('count', 'sum', 'min', 'max', 'mean', 'first', 'last')
+
+    def __init__(self, field: str, how: Union[str, Callable[[Any, Any], Any]]):
+        if isinstance(how, str) and how not in Aggregation.NAMES:
+            raise ValueError(f'Unknown aggregation {how}')
+        self.field = field
+        self.how = how
+
+    def start(self) -> list:
+        # [accumulated value, number of values]
+        return [None, 0]
+
+    def step(self, state: list, value: Any) -> None:
+        how = self.how
+        if how == 'count':
+            state[1] += 1
+            return
+        if how == 'first':
+            if state[1] == 0:
+                state[0] = value
+            state[1] += 1
+            return
+        if how == 'last':
+            state[0] = value
+            state[1] += 1
+            return
+        if value == '' or value is None:
+            return
+        if state[1] == 0:
+            state[0] = value
+        elif how == 'sum' or how == 'mean':
+            state[0] += value
+        elif how == 'min':
+            if value < state[0]:
+                state[0] = value
+        elif how == 'max':
+            if value > state[0]:
+                state[0] = value
+        else:
+            state[0] = how(state[0], value)
+        state[1] += 1
+
+    def finish(self, state: list) -> Any:
+        if self.how == 'count':
+            return state[1]
+        if state[1] == 0:
+            return 0 if self.how == 'sum' else ''
+        if self.how == 'mean':
+            return state[0] / state[1]
+        return state[0]
+
+
+COMPARISONS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le,
+               '>': operator.gt, '>=': operator.ge}
+FILTER_OPERATORS = (*COMPARISONS, 'in', 'not in', 'between', 'null', 'not null')
+_AST_COMPARISONS = {ast.Eq: '==', ast.NotEq: '!=', ast.Lt: '<', ast.LtE: '<=', ast.Gt: '>', ast.GtE: '>=',
+                    ast.In: 'in', ast.NotIn: 'not in'}
+_FLIPPED = {'==': '==', '!=': '!=', '<': '>', '<=': '>=', '>': '<', '>=': '<='}
+_FILTER_CONSTRUCTORS = {'date': datetime.date, 'datetime': datetime.datetime, 'time': datetime.time}
+
+
+def _is_empty(value: Any) -> bool:
+    return value is None or value == ''
+
+
+def _safe_test(test: Callable[[Any], bool]) -> Callable[[Any], bool]:
+    def safe(value):
+        try:
+            return test(value)
+        except TypeError:
+            # not comparable, for example a number with a string
+            return False
+    return safe
+
+
+class Filter:
+    """
+    A predicate compiled once and evaluated column by column.
+
+    As a dict, keys are fields and values are either a value to compare with, a list of values or
+    a dict of operators ({'Age': {'>=': 18, '<': 30}, 'Name': ['John', 'Emma'], 'Email': None}),
+    and 'and', 'or' and 'not' combine expressions ({'or': [{...}, {...}]}).
+
+    As a string, a python-like expression:
+    "18 <= Age < 30 and Name in ('John', 'Emma') and not Email is None", fields that are not
+    identifiers are written field('First Name'), dates date(2020, 1, 31).
+    Empty cells are null, comparisons between values of different types are false.
+    """
+
+    def __init__(self, expression: Union[str, dict]):
+        self.expression = expression
+        if isinstance(expression, str):
+            try:
+                tree = ast.parse(expression.strip(), mode='eval')
+            except SyntaxError as e:
+                raise ValueError(f'invalid filter expression: {e.msg}')
+            self.tree = self._compile_ast(tree.body)
+        elif isinstance(expression, dict):
+            self.tree = self._compile_dict(expression)
+        else:
+            raise TypeError('Expected str or dict')
         self.fields = []
+        self._collect_fields(self.tree)
+
+    def _collect_fields(self, node: tuple) -> None:
+        if node[0] == 'leaf':
+            if node[1] not in self.fields:
+                self.fields.append(node[1])
+        elif node[0] == 'not':
+            self._collect_fields(node[1])
+        else:
+            for child in node[1]:
+                self._collect_fields(child)
+
+    @staticmethod
+    def _leaf(field: str, op: str, operand: Any) -> tuple:
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f'Unknown operator {op}')
+        if op in ('==', '!=') and operand is None:
+            return 'leaf', field, 'null' if op == '==' else 'not null', None
+        if op in ('in', 'not in'):
+            operand = [*operand]
+        if op == 'between':
+            if len(operand) != 2:
+                raise ValueError('between expects [low, high]')
+            operand = tuple(operand)
+        return 'leaf', field, op, operand
+
+    def _compile_dict(self, expression: dict) -> tuple:
+        parts = []
+        for key, value in expression.items():
+            if key == 'and' or key == 'or':
+                if not isinstance(value, list):
+                    raise ValueError(f'{key} expects a list of expressions')
+                parts.append((key, [self._compile_dict(v) for v in value]))
+            elif key == 'not':
+                parts.append(('not', self._compile_dict(value)))
+            elif isinstance(value, dict):
+                for op, operand in value.items():
+                    if op == 'null' or op == 'not null':
+                        if operand is True or operand is False:
+                            op = op if operand else ('not null' if op == 'null' else 'null')
+                        parts.append(self._leaf(key, op, None))
+                    else:
+                        parts.append(self._leaf(key, op, operand))
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                parts.append(self._leaf(key, 'in', value))
+            else:
+                parts.append(self._leaf(key, '==', value))
+        if len(parts) == 0:
+            raise ValueError('empty filter expression')
+        return parts[0] if len(parts) == 1 else ('and', parts)
+
+    @staticmethod
+    def _ast_field(node: ast.expr) -> Union[str, None]:
+        if isinstance(node, ast.Name):
+            return node.id
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'field' \
+                and len(node.args) == 1 and isinstance(node.args[0], ast.Constant) \
+                and isinstance(node.args[0].value, str):
+            return node.args[0].value
+        return None
+
+    @staticmethod
+    def _ast_value(node: ast.expr) -> Any:
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) \
+                and node.func.id in _FILTER_CONSTRUCTORS and len(node.keywords) == 0:
+            return _FILTER_CONSTRUCTORS[node.func.id](*[Filter._ast_value(a) for a in node.args])
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            return [Filter._ast_value(e) for e in node.elts]
+        try:
+            return ast.literal_eval(node)
+        except ValueError:
+            raise ValueError(f'invalid value in filter expression: {ast.dump(node)}')
+
+    def _compile_ast(self, node: ast.expr) -> tuple:
+        if isinstance(node, ast.BoolOp):
+            return 'and' if isinstance(node.op, ast.And) else 'or', [self._compile_ast(v) for v in node.values]
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return 'not', self._compile_ast(node.operand)
+        if isinstance(node, ast.Compare):
+            parts = []
+            left = node.left
+            for op, right in zip(node.ops, node.comparators):
+                parts.append(self._compile_comparison(left, op, right))
+                left = right
+            return parts[0] if len(parts) == 1 else ('and', parts)
+        raise ValueError(f'unsupported filter expression: {ast.dump(node)}')
+
+    def _compile_comparison(self, left: ast.expr, op: ast.cmpop, right: ast.expr) -> tuple:
+        if isinstance(op, (ast.Is, ast.IsNot)):
+            field = self._ast_field(left)
+            if field is None or not (isinstance(right, ast.Constant) and right.value is None):
+                raise ValueError('"is" only compares a field with None')
+            return self._leaf(field, 'null' if isinstance(op, ast.Is) else 'not null', None)
+        name = _AST_COMPARISONS[type(op)]
+        field = self._ast_field(left)
+        if field is not None:
+            return self._leaf(field, name, self._ast_value(right))
+        field = self._ast_field(right)
+        if field is None or name in ('in', 'not in'):
+            raise ValueError('a comparison needs a field and a value')
+        return self._leaf(field, _FLIPPED[name], self._ast_value(left))
+
+    def _leaf_mask(self, values: Sequence, op: str, operand: Any) -> Iterable[bool]:
+        if op == 'null':
+            return map(_is_empty, values)
+        if op == 'not null':
+            return [not _is_empty(v) for v in values]
+        if op == 'between':
+            low, high = operand
+            test = lambda v: low <= v <= high
+        elif op == 'in' or op == 'not in':
+            try:
+                members = frozenset(operand)
+                contains = members.__contains__
+            except TypeError:
+                contains = operand.__contains__
+            if op == 'in':
+                test = contains
+            else:
+                test = lambda v: not contains(v)
+        else:
+            compare = COMPARISONS[op]
+            try:
+                return list(map(compare, values, repeat(operand)))
+            except TypeError:
+                test = lambda v: compare(v, operand)
+        try:
+            return list(map(test, values))
+        except TypeError:
+            return list(map(_safe_test(test), values))
+
+    def _evaluate(self, node: tuple, load: Callable[[str, Union[List[int], None]], Sequence],
+                  positions: Union[List[int], None],
+                  length: int) -> List[int]:
+        """
+        positions of the rows matching the node, among the given positions or all rows when None
+        """
+        kind = node[0]
+        if kind == 'and':
+            for child in node[1]:
+                positions = self._evaluate(child, load, positions, length)
+                if len(positions) == 0:
+                    break
+            return positions if positions is not None else [*range(length)]
+        if kind == 'or':
+            matched = set()
+            for child in node[1]:
+                matched.update(self._evaluate(child, load, positions, length))
+            return sorted(matched)
+        if kind == 'not':
+            matched = set(self._evaluate(node[1], load, positions, length))
+            return [i for i in (range(length) if positions is None else positions) if i not in matched]
+
+        _, field, op, operand = node
+        # values at the positions, or a whole typed column
+        values = load(field, positions)
+        base = range(length) if positions is None else positions
+        if isinstance(values, Column):
+            column = values
+            fast = column.encode_filter(op, operand)
+            if fast is not None:
+                data, op, operand, guard = fast
+                values = data if positions is None else [data[i] for i in positions]
+                mask = self._leaf_mask(values, op, operand)
+                if guard is not None:
+                    mask = [m and guard(v) for m, v in zip(mask, values)]
+                return [*compress(base, mask)]
+            values = column if positions is None else [column[i] for i in positions]
+        return [*compress(base, self._leaf_mask(values, op, operand))]
+
+    @staticmethod
+    def _loader(sheet: 'Sheet', rows: List[Row]) -> Callable[[str, Union[List[int], None]], Sequence]:
+        columns = {}
+        columnar = isinstance(sheet, ColumnarSheet) and rows is sheet.data_rows
+
+        def load(field, positions):
+            if field in columns:
+                values = columns[field]
+            elif columnar:
+                values = columns[field] = sheet.get_col_values(field)
+            elif positions is None:
+                values = columns[field] = sheet._values(field, rows)
+            else:
+                # only read the rows still matching
+                return sheet._values(field, [rows[i] for i in positions])
+            if positions is None or isinstance(values, Column):
+                return values
+            return [values[i] for i in positions]
+        return load
+
+    def _index_lookup(self, sheet: 'Sheet') -> Union[Tuple[List[Row], Union[tuple, None]], None]:
+        """
+        candidate rows from an index of the sheet covering equality tests of the top level conjunction,
+        and the rest of the expression
+        """
+        if len(sheet.indexes) == 0:
+            return None
+        node = self.tree
+        parts = node[1] if node[0] == 'and' else [node]
+        equal = {}
+        for p in parts:
+            if p[0] == 'leaf' and p[2] == '==' and p[1] not in equal:
+                equal[p[1]] = p[3]
+        index = sheet._get_index(equal) if len(equal) != 0 else None
+        if index is None:
+            return None
+        try:
+            rows = index.lookup(tuple(equal[f] for f in index.fields))
+        except TypeError:
+            return None
+        rest = [p for p in parts
+                if not (p[0] == 'leaf' and p[2] == '==' and p[1] in index.fields and equal[p[1]] == p[3])]
+        if len(rest) == 0:
+            return rows, None
+        return rows, rest[0] if len(rest) == 1 else ('and', rest)
+
+    def rows(self, sheet: 'Sheet') -> List[Row]:
+        """
+        rows of the sheet matching the filter, in sheet order
+        """
+        for f in self.fields:
+            if f not in sheet.fields:
+                raise NameError(f'field {f} not found')
+
+        found = self._index_lookup(sheet)
+        if found is not None:
+            rows, rest = found
+            if rest is None:
+                return [*rows]
+            return [rows[i] for i in self._evaluate(rest, self._loader(sheet, rows), None, len(rows))]
+
+        data_rows = sheet.data_rows
+        return [data_rows[i] for i in self._evaluate(self.tree, self._loader(sheet, data_rows), None, len(data_rows))]
+
+
+class Sheet:
+    def __init__(self, suppress_warning: bool = False, sheet: Union[xlrd.sheet.Sheet, str] = '',
+                 budget: Union[MemoryBudget, None] = None):
+        self.schema = Schema([])
         self.data_rows: List[Row] = []
+        self.indexes: Dict[Tuple[str, ...], Index] = {}
         self.header_style: Style = Style()
         self.suppress_warning = suppress_warning
+        # changes since the sheet was loaded or saved, see is_dirty
+        self._dirty = True
+        self._saved: Union[tuple, None] = None
+        self._edits = Cell.edits
+        self._style_edits = Style.edits
         if isinstance(sheet, str):
             self.name: str = sheet
         else:
             self.name: str = sheet.name
             self._init_fields(sheet)
-            self._init_data(sheet)
+            self._init_data(sheet, budget)
+
+    @property
+    def fields(self) -> List[str]:
+        return self.schema.fields
+
+    @fields.setter
+    def fields(self, fields: List[str]):
+        # rows created before keep the old schema, like they kept the old list
+        self.schema = Schema(fields)
 
     def __len__(self):
         return self.data_rows.__len__()
@@ -302,51 +1684,63 @@ class Sheet:
         for field in fields_row:
             self.fields.append(field.value)
 
-    def _init_data(self, sheet: xlrd.sheet.Sheet):
-        flg_first_row = True
-        for row in sheet.get_rows():
-            # skip the first row
-            if flg_first_row:
-                flg_first_row = False
-                continue
-
-            new_row = Row(self.fields)
-            for i in range(len(self.fields)):
+    def _read_cells(self, sheet: xlrd.sheet.Sheet, budget: Union[MemoryBudget, None] = None) \
+            -> Iterator[List[Union[Cell, str]]]:
+        """
+        convert the data rows of a xlrd sheet, every row has one cell per field.
+        The sheet is converted column by column, see _convert_column
+        """
+        length = sheet.nrows - 1
+        if length <= 0:
+            return
+        columns = []
+        numeric_strings = {}
+        for i in range(len(self.fields)):
+            if i >= sheet.ncols:
                 # to prevent bug when there is an empty cell
-                if i < len(row):
-                    if row[i].ctype == 3:
-                        dt = [*xlrd.xldate_as_tuple(row[i].value, sheet.book.datemode)]
-                        try:
-                            if dt[0] == 0 or dt[1] == 0 or dt[2] == 0:
-                                c = Cell(datetime.time(dt[3], dt[4], dt[5]))
-                            elif dt[3] == 0 and dt[4] == 0 and dt[5] == 0:
-                                c = Cell(datetime.date(dt[0], dt[1], dt[2]))
-                            else:
-                                c = Cell(datetime.datetime(*dt))
-                        except:
-                            c = Cell(datetime.datetime(*dt))
-                        c.style.num_format = 'yyyy/mm/dd'
-                        new_row[self.fields[i]] = c
-                    else:
-                        if isinstance(row[i].value, str):
-                            try:
-                                if row[i].value.isascii() and row[i].value.isnumeric():
-                                    if not self.suppress_warning:
-                                        print('Warning: Found a number stored in string format, converting...')
-                                    new_row[self.fields[i]] = Cell(float(row[i].value))
-                            except AttributeError:
-                                if not self.suppress_warning:
-                                    print('Warning: python3.6 compatibility mode')
-                        new_row[self.fields[i]] = Cell(row[i].value)
-                else:
-                    new_row[self.fields[i]] = ''
+                columns.append([''] * length)
+                continue
+            types = sheet.col_types(i, 1)
+            values, kind = _convert_column(sheet.col_values(i, 1), types, sheet.book.datemode)
+            if kind in ('date', 'datetime', 'time', 'mixed'):
+                values = [Cell(v, DATE_STYLE) if t == xlrd.XL_CELL_DATE else Cell(v) for v, t in zip(values, types)]
+            else:
+                values = [Cell(v) for v in values]
+            if kind in ('text', 'mixed') and not self.suppress_warning:
+                try:
+                    count = sum(1 for v, t in zip(sheet.col_values(i, 1), types)
+                                if t == xlrd.XL_CELL_TEXT and v.isascii() and v.isnumeric())
+                except AttributeError:
+                    # str.isascii is missing before python 3.7
+                    count = 0
+                if count != 0:
+                    numeric_strings[self.fields[i]] = count
+            columns.append(values)
+            if budget is not None:
+                budget.check(f'loading sheet {self.name}')
+        if len(numeric_strings) != 0:
+            counts = ', '.join(f'{field} ({count})' for field, count in numeric_strings.items())
+            print(f'Warning: Found numbers stored in string format in sheet {self.name}: {counts}')
+        for number, cells in enumerate(zip(*columns)):
+            if budget is not None and number % budget.every == 0:
+                budget.check(f'loading sheet {self.name}')
+            yield [*cells]
+
+    def _init_data(self, sheet: xlrd.sheet.Sheet, budget: Union[MemoryBudget, None] = None):
+        for cells in self._read_cells(sheet, budget):
+            new_row = Row(self.fields, self.schema)
+            for i in range(len(cells)):
+                if not isinstance(cells[i], Cell):
+                    cells[i] = Cell(cells[i])
+            new_row.cells = cells
+            new_row.sheet = self
             self.data_rows.append(new_row)
 
     def set_header_style(self, style: Style):
         self.header_style = style
 
     def duplicate(self, name: str, headers_only: bool = False):
-        result = Sheet(sheet=name)
+        result = self.__class__(sheet=name)
         result.fields = [*self.fields]
         if not headers_only:
             for row in self.data_rows:
@@ -354,6 +1748,226 @@ class Sheet:
                 result.append_row(r)
         return result
 
+    def copy(self) -> 'Sheet':
+        """
+        independent copy of the sheet, cells are copied directly instead of appending rows
+        """
+        result = Sheet(self.suppress_warning, self.name)
+        result.fields = [*self.fields]
+        result.header_style = copy(self.header_style)
+        schema = result.schema
+        rows = result.data_rows
+        for row in self.data_rows:
+            new_row = Row(schema.fields, schema)
+            new_row.cells = [None if c is None else _copy_cell(c) for c in row.cells]
+            if row.extra is not None:
+                new_row.extra = {k: _copy_cell(c) for k, c in row.extra.items()}
+            new_row.sheet = result
+            rows.append(new_row)
+        return result
+
+    def _append_cells(self, rows: Iterable[List[Cell]]) -> None:
+        """
+        append rows given as lists of new cells in field order, without the checks of append_row
+        """
+        schema = self.schema
+        data_rows = self.data_rows
+        valid = [index for index in self.indexes.values() if index.is_valid(data_rows)]
+        start = len(data_rows)
+        for cells in rows:
+            new_row = Row(schema.fields, schema)
+            new_row.cells = cells
+            new_row.sheet = self
+            data_rows.append(new_row)
+        self._dirty = True
+        for index in valid:
+            try:
+                for i in range(start, len(data_rows)):
+                    index.append(data_rows[i])
+            except TypeError:
+                index.stale = True
+
+    def memory_report(self, sample: int = 1000) -> dict:
+        """
+        estimated memory used by the sheet, by category and by field. Categories are rows (row objects and
+        their lists), cells, strings, values (other than strings), styles and indexes.
+        Strings and styles shared by several cells are counted once in the measured rows.
+        :param sample: number of rows measured, the others are estimated from them, 0 to measure every row
+        :return: {'total': bytes, 'rows': number of rows, 'categories': {category: bytes},
+                  'columns': {field: {category: bytes, 'total': bytes}}}
+        """
+        rows = self.data_rows
+        picked = _sample(rows, sample)
+        scale = len(rows) / len(picked) if len(picked) != 0 else 0
+        fields = self.fields
+        columns = {f: {'cells': 0, 'strings': 0, 'values': 0, 'styles': 0} for f in fields}
+        row_bytes = 0
+        # shared styles are counted once, not scaled to all rows
+        shared: Dict[str, Dict[int, int]] = {}
+        seen = set()
+        for row in picked:
+            row_bytes += sys.getsizeof(row) + sys.getsizeof(row.cells)
+            if row.extra is not None:
+                row_bytes += sys.getsizeof(row.extra) + sum(sys.getsizeof(c) for c in row.extra.values())
+            for field, c in zip(fields, row.cells):
+                if c is None:
+                    continue
+                usage = columns[field]
+                usage['cells'] += sys.getsizeof(c)
+                v = c._value
+                if id(v) not in seen:
+                    seen.add(id(v))
+                    usage['strings' if isinstance(v, str) else 'values'] += sys.getsizeof(v)
+                style = c._style
+                if style.frozen:
+                    shared.setdefault(field, {})[id(style)] = sys.getsizeof(style)
+                elif id(style) not in seen:
+                    seen.add(id(style))
+                    usage['styles'] += sys.getsizeof(style)
+        for field, usage in columns.items():
+            for category in usage:
+                usage[category] = int(usage[category] * scale)
+            usage['styles'] += sum(shared.get(field, {}).values())
+        return _memory_report(len(rows), int(row_bytes * scale) + sys.getsizeof(rows), columns,
+                              sys.getsizeof(self.header_style), self._index_memory())
+
+    def _index_memory(self) -> int:
+        total = 0
+        for index in self.indexes.values():
+            total += sys.getsizeof(index.table) + sys.getsizeof(index.positions)
+            for key, rows in index.table.items():
+                total += sys.getsizeof(key) + sys.getsizeof(rows)
+        return total
+
+    def create_index(self, *fields: str) -> None:
+        """
+        create a hash index used by find when the queried fields include all indexed fields
+        :param fields: one field, or several fields for a composite index
+        """
+        if len(fields) == 0:
+            raise ValueError('At least one field is required')
+        for field in fields:
+            if field not in self.fields:
+                raise NameError(f'field {field} not found')
+        if fields not in self.indexes:
+            self.indexes[fields] = Index(fields)
+
+    def drop_index(self, *fields: str) -> None:
+        del self.indexes[fields]
+
+    def _changed(self, row: Row, field: str, old: Union[Cell, None]) -> None:
+        """
+        called by rows when a cell is replaced or deleted
+        :param old: replaced cell, None if the field had no cell or the cell was deleted
+        """
+        self._dirty = True
+        if len(self.indexes) == 0:
+            return
+        rows = self.data_rows
+        for index in self.indexes.values():
+            if field in index.fields:
+                if old is None or field not in row or not index.is_valid(rows):
+                    index.stale = True
+                else:
+                    index.replace(row, field, old)
+
+    def _value_changed(self, row: Row, field: str, old: Any) -> None:
+        """
+        called when a cell of an indexed field is assigned a value
+        """
+        rows = self.data_rows
+        for index in self.indexes.values():
+            if field in index.fields and index.is_valid(rows):
+                index.update(row, field, old)
+
+    def _snapshot(self) -> tuple:
+        # catches rows and fields changed without going through the sheet
+        return id(self.data_rows), len(self.data_rows), tuple(self.fields), self.header_style.key()
+
+    def _cells_modified(self) -> bool:
+        for row in self.data_rows:
+            for c in row.cells:
+                if c is not None and c._modified:
+                    return True
+        return False
+
+    def is_dirty(self) -> bool:
+        """
+        whether rows, fields, cells or styles changed since the sheet was loaded or saved
+        """
+        if self._dirty or self._saved != self._snapshot():
+            return True
+        if self._edits != Cell.edits:
+            if self._cells_modified():
+                return True
+            # cells of other sheets were modified
+            self._edits = Cell.edits
+        if self._style_edits != Style.edits:
+            # styles used by cells may be changed in place
+            if any(style._changed > self._style_edits for style in self._own_styles()):
+                return True
+            self._style_edits = Style.edits
+        return False
+
+    def _own_styles(self) -> Iterator[Style]:
+        """
+        styles of the cells which can be changed in place
+        """
+        for row in self.data_rows:
+            for c in row.cells:
+                if c is not None and not c._style.frozen:
+                    yield c._style
+
+    def _clean_state(self) -> None:
+        self._dirty = False
+        self._saved = self._snapshot()
+        self._edits = Cell.edits
+        self._style_edits = Style.edits
+
+    def mark_clean(self) -> None:
+        """
+        forget the changes, the sheet is considered as saved
+        """
+        for row in self.data_rows:
+            for c in row.cells:
+                if c is not None:
+                    c._modified = False
+        self._clean_state()
+
+    def _get_index(self, fields) -> Union[Index, None]:
+        """
+        pick the index covering the most of the given fields, rebuild it if it is outdated
+        """
+        best: Union[Index, None] = None
+        for index in self.indexes.values():
+            if all(f in fields for f in index.fields):
+                if best is None or len(index.fields) > len(best.fields):
+                    best = index
+        if best is not None and not best.is_valid(self.data_rows):
+            best.build(self.data_rows)
+        if best is not None and not best.usable:
+            return None
+        return best
+
+    @staticmethod
+    def _match(data_row: Row, kwargs: dict) -> bool:
+        for key in kwargs.keys():
+            if isinstance(kwargs[key], int):
+                if data_row[key].value != float(kwargs[key]):
+                    return False
+                else:
+                    continue
+
+            if isinstance(kwargs[key], Cell):
+                if data_row[key].value != kwargs[key].value:
+                    return False
+                else:
+                    continue
+
+            if data_row[key].value != kwargs[key]:
+                return False
+        return True
+
     def find(self, pairs: Union[dict, None] = None, none_if_not_found=False, **kwargs) -> Union[List[Row], None]:
         result = []
         if pairs is not None:
@@ -363,23 +1977,23 @@ class Sheet:
             if kwarg not in self.fields:
                 raise NameError(f'field {kwarg} not found')
 
-        for data_row in self.data_rows:
-            for key in kwargs.keys():
-                if isinstance(kwargs[key], int):
-                    if data_row[key].value != float(kwargs[key]):
-                        break
-                    else:
-                        continue
-
-                if isinstance(kwargs[key], Cell):
-                    if data_row[key].value != kwargs[key].value:
-                        break
-                    else:
-                        continue
-
-                if data_row[key].value != kwargs[key]:
-                    break
+        candidates = self.data_rows
+        index = self._get_index(kwargs) if len(self.indexes) != 0 else None
+        if index is not None:
+            values = []
+            for f in index.fields:
+                v = kwargs[f]
+                values.append(v.value if isinstance(v, Cell) else v)
+            try:
+                candidates = index.lookup(tuple(values))
+            except TypeError:
+                # unhashable value, scan everything
+                candidates = self.data_rows
             else:
+                kwargs = {k: kwargs[k] for k in kwargs if k not in index.fields}
+
+        for data_row in candidates:
+            if self._match(data_row, kwargs):
                 result.append(data_row)
         if result.__len__() == 0 and none_if_not_found:
             return None
@@ -391,7 +2005,91 @@ class Sheet:
             for r in result:
                 self.set_row_style(r, highlight_style)
 
-    def filter(self, callback: Callable[[Row], Union[None, bool]]) -> List[Row]:
+    def query(self, expression: Union[str, dict, Filter], as_sheet: bool = False) -> Union[List[Row], 'Sheet']:
+        """
+        rows matching a filter expression, see Filter
+        :param expression: expression string, dict, or a compiled Filter
+        :param as_sheet: return a new sheet holding copies of the rows instead of the rows
+        """
+        if not isinstance(expression, Filter):
+            expression = Filter(expression)
+        rows = expression.rows(self)
+        if not as_sheet:
+            return rows
+        result = self.__class__(sheet=self.name)
+        result.fields = [*self.fields]
+        result.header_style = self.header_style
+        for row in rows:
+            result.append_row({f: _detached_cell(row[f]) for f in row})
+        return result
+
+    def join(self, other: 'Sheet', on: Union[str, List[str], Dict[str, str]], how: str = 'inner',
+             suffixes: Tuple[str, str] = ('', '_right'), name: str = '') -> 'Sheet':
+        """
+        hash join with another sheet on equal key values, in linear time: the smaller sheet is put in a hash table
+        and the other one is read once. Rows keep the order of this sheet, keys with an empty value never match.
+        :param other: sheet joined to this one
+        :param on: key field, list of key fields, or a dict of fields of this sheet to fields of the other one
+        :param how: inner keeps matching rows, left also keeps the rows of this sheet without match,
+                    outer also keeps the rows of the other sheet without match, added at the end
+        :param suffixes: added to the names of non key fields found in both sheets, for this sheet and the other one
+        :param name: name of the new sheet, the name of this sheet by default
+        :return: new sheet with the fields of this sheet followed by the non key fields of the other one
+        """
+        if how not in ('inner', 'left', 'outer'):
+            raise ValueError(f'unknown join {how}')
+        if isinstance(on, str):
+            on = [on]
+        keys = {**on} if isinstance(on, dict) else {f: f for f in on}
+        if len(keys) == 0:
+            raise ValueError('At least one key field is required')
+        for field in keys:
+            if field not in self.fields:
+                raise NameError(f'field {field} not found')
+        for field in keys.values():
+            if field not in other.fields:
+                raise NameError(f'field {field} not found')
+        other_fields = [f for f in other.fields if f not in keys.values()]
+        both = set(self.fields).intersection(other_fields)
+        fields = [f + suffixes[0] if f in both else f for f in self.fields] \
+            + [f + suffixes[1] if f in both else f for f in other_fields]
+        if len(set(fields)) != len(fields):
+            raise ValueError('fields of the joined sheets still collide with these suffixes')
+
+        rows = self.data_rows
+        other_rows = other.data_rows
+        left = list(zip(*[self._values(f, rows) for f in keys]))
+        right = list(zip(*[other._values(f, other_rows) for f in keys.values()]))
+        pairs = _join_pairs(left, right, how)
+
+        result = self.__class__(self.suppress_warning, name if name != '' else self.name)
+        result.fields = fields
+        result.header_style = self.header_style
+        # key fields of the other sheet fill the rows of the other sheet without match
+        key_fields = [keys[f] if f in keys else None for f in self.fields]
+        width = len(other_fields)
+        positions = [self.schema.position(f) for f in self.fields]
+        other_positions = [other.schema.position(f) for f in other.fields]
+        picked = [other.schema.position(f) for f in other_fields]
+
+        def joined(i: Union[int, None], j: Union[int, None]) -> List[Cell]:
+            if i is not None:
+                cells = _detached_cells(_row_cells(self, rows[i], self.fields, positions))
+            else:
+                found = dict(zip(other.fields, _row_cells(other, other_rows[j], other.fields, other_positions)))
+                cells = [Cell('') if f is None else _detached_cell(found[f]) for f in key_fields]
+            if j is not None:
+                cells.extend(_detached_cells(_row_cells(other, other_rows[j], other_fields, picked)))
+            else:
+                cells.extend(Cell('') for _ in range(width))
+            return cells
+
+        result._append_cells(joined(i, j) for i, j in pairs)
+        return result
+
+    def filter(self, callback: Union[Callable[[Row], Union[None, bool]], str, dict, Filter]) -> List[Row]:
+        if not callable(callback):
+            return self.query(callback)
         data_list = []
 
         for row in self.data_rows:
@@ -402,7 +2100,7 @@ class Sheet:
         return data_list
 
     def append_row(self, content: Union[Row, dict, List[Union[str, Cell]]]) -> None:
-        new_row = Row(self.fields)
+        new_row = Row(self.fields, self.schema)
         if isinstance(content, dict) or isinstance(content, Row):
             for field in self.fields:
                 if field in content:
@@ -424,7 +2122,12 @@ class Sheet:
                     new_row[self.fields[i]] = Cell('')
         else:
             raise TypeError('Expected Row, dict or list')
+        new_row.sheet = self
+        for index in self.indexes.values():
+            if index.is_valid(self.data_rows):
+                index.append(new_row)
         self.data_rows.append(new_row)
+        self._dirty = True
 
     def append_rows(self, rows: List[Union[dict, Row, List]]):
         for row in rows:
@@ -442,6 +2145,25 @@ class Sheet:
             result.append(row[col])
         return result
 
+    def get_col_values(self, col: str) -> Sequence:
+        if col not in self.fields:
+            raise NameError(f'field "{col}" does not exists')
+        return self._values(col, self.data_rows)
+
+    def _values(self, col: str, rows: Iterable[Row]) -> List[Any]:
+        """
+        values of a field in the given rows, read by position when the rows share the sheet schema
+        """
+        schema = self.schema
+        pos = schema.position(col)
+        values = []
+        append = values.append
+        for row in rows:
+            cells = row.cells
+            c = cells[pos] if row.schema is schema and pos < len(cells) else None
+            append(c.value if c is not None else row[col].value)
+        return values
+
     def append_col(self, col: str, default=''):
         if col in self.fields:
             raise ValueError('Duplicated col')
@@ -464,74 +2186,237 @@ class Sheet:
             row[c].style = style
 
     def remove_row(self, row: Row) -> None:
-        self.data_rows.remove(row)
+        valid = [index for index in self.indexes.values() if index.is_valid(self.data_rows)]
+        for i in range(len(self.data_rows)):
+            if self.data_rows[i] is row or self.data_rows[i] == row:
+                removed = self.data_rows.pop(i)
+                break
+        else:
+            raise ValueError('row not found')
+        for index in valid:
+            index.remove(removed)
+        self._dirty = True
 
-    def import_json(self, path: str) -> None:
-        with open(path, 'r') as f:
-            data = json.load(f)
-        if not isinstance(data, list):
-            raise ValueError('invalid file format')
-        for row in data:
+    def import_json(self, path: str, lines: bool = False,
+                    object_hook: Union[Callable[[dict], Any], None] = None) -> None:
+        """
+        append the rows of a json array or of a newline delimited json file, rows are read one at a time
+        :param path: path of the file
+        :param lines: the file has one json object per line
+        :param object_hook: called on every decoded object, for example to parse dates
+        """
+        for row in _iter_json_rows(path, lines, object_hook):
             self.append_row(row)
 
-    def to_csv(self, out: str = '') -> None:
+    def to_csv(self, out: str = '', rows: Union[Iterable[Union[Row, dict, list, tuple]], None] = None,
+               chunk_size: int = 10000, encoding: str = 'utf-8') -> None:
+        """
+        write the header and rows to a csv file in batches
+        :param out: path of the file, sheet name + .csv by default
+        :param rows: rows to write instead of the rows of the sheet, for example a generator
+        :param chunk_size: number of rows per writerows call
+        :param encoding: file encoding
+        """
         if out == '':
             out = self.name + '.csv'
-
-        with open(out, 'w') as f:
-            w = csv.DictWriter(f, self.fields)
-            v = {}
-            for r in self.data_rows:
-                for key in r:
-                    v[key] = r[key].value
-                w.writerow(v)
-
-    def to_json(self, out: str = '') -> None:
-        if out == '':
-            out = self.name + '.json'
-        data = []
-        for r in self.data_rows:
-            v = {}
-            for k in r:
-                v[k] = r[k].value
-            data.append(v)
+        if rows is None:
+            rows = self.data_rows
+        fields = self.fields
+
+        with open(out, 'w', newline='', encoding=encoding) as f:
+            w = csv.writer(f)
+            w.writerow(fields)
+            batch = []
+            for r in rows:
+                batch.append(_row_values(r, fields))
+                if len(batch) >= chunk_size:
+                    w.writerows(batch)
+                    batch = []
+            if len(batch) != 0:
+                w.writerows(batch)
+
+    def read_csv(self, path: str, chunk_size: int = 10000, infer_types: bool = True, encoding: str = 'utf-8',
+                 **fmtparams) -> None:
+        """
+        append the rows of a csv file having a header, the file is read in chunks
+        :param path: path of the file
+        :param chunk_size: number of rows converted at once
+        :param infer_types: convert columns of ints, floats, dates or datetimes. Types are decided on every value
+                            of a column, the file is read once more before loading it
+        :param encoding: file encoding
+        :param fmtparams: passed to csv.reader
+        """
+        with open(path, 'r', newline='', encoding=encoding) as f:
+            reader = csv.reader(f, **fmtparams)
+            try:
+                header = next(reader)
+            except StopIteration:
+                return
+            if len(self.fields) == 0:
+                self.fields = [*header]
+            aligned = header == self.fields
+
+            converters = [None] * len(header)
+            if infer_types:
+                converters = _infer_converters(reader, len(header))
+                f.seek(0)
+                reader = csv.reader(f, **fmtparams)
+                next(reader)
+            while True:
+                chunk = []
+                for r in reader:
+                    chunk.append(r)
+                    if len(chunk) >= chunk_size:
+                        break
+                if len(chunk) == 0:
+                    break
+                for r in chunk:
+                    values = []
+                    for i in range(len(header)):
+                        v = r[i] if i < len(r) else ''
+                        if v != '' and converters[i] is not None:
+                            v = converters[i](v)
+                        values.append(v)
+                    if aligned:
+                        self.append_row(values)
+                    else:
+                        self.append_row(dict(zip(header, values)))
+
+    def to_json(self, out: str = '', lines: bool = False, rows: Union[Iterable[Union[Row, dict, list, tuple]], None] = None,
+                default: Union[Callable[[Any], Any], None] = None) -> None:
+        """
+        write the rows to a json array, or one json object per line, without building the whole document
+        :param out: path of the file, sheet name + .json or .ndjson by default
+        :param lines: write newline delimited json
+        :param rows: rows to write instead of the rows of the sheet, for example a generator
+        :param default: converts values json can not serialize, dates and times are written in ISO format by default
+        """
+        if out == '':
+            out = self.name + ('.ndjson' if lines else '.json')
+        if rows is None:
+            rows = self.data_rows
         with open(out, 'w') as f:
-            json.dump(data, f)
+            _write_json_rows(f, rows, self.fields, lines, default)
 
-    def split_rows(path: str, row_count: int, name_by: str):
-        filenames = {}
+    def split_rows(self, path: str = '', row_count: int = 0, name_by: str = '', workers: int = 0) -> List[str]:
+        """
+        write the rows to several files, by value of a field and/or by number of rows
+        :param path: directory of the files
+        :param row_count: max number of rows per file, files are numbered
+        :param name_by: field whose values name the files, rows with the same value go to the same file
+        :param workers: number of processes writing files at the same time, 0 to write them one by one
+        :return: paths of the files
+        """
+        if row_count <= 0 and name_by == '':
+            raise ValueError('row_count or name_by is required')
+        if name_by != '':
+            groups = [(_file_part(k[0]), rows) for k, rows in self.group_by(name_by).items()]
+        else:
+            groups = [(_file_part(self.name), self.data_rows)]
 
-    def sort_by(self, by: str, desc=False):
-        copied: List[Row] = [*self.data_rows]
-        result: List[Row] = []
-        for i in range(len(self.data_rows)):
-            min = copied[0]
-            for j in range(len(copied)):
-                if desc:
-                    if copied[j][by].value > min[by].value:
-                        min = copied[j]
+        chunks = []
+        for part, rows in groups:
+            if row_count > 0:
+                chunks.extend((f'{part}_{i // row_count + 1}', rows[i:i + row_count])
+                              for i in range(0, len(rows), row_count))
+            else:
+                chunks.append((part, rows))
+        jobs = []
+        for name, (_, chunk) in zip(_unique_names([name for name, _ in chunks]), chunks):
+            jobs.append((os.path.join(path, name + '.xlsx'),
+                         [(self.name, [*self.fields], _sheet_cells(self, chunk, workers > 1), self.header_style)]))
+        return _write_files(jobs, workers)
+
+    def sort_by(self, by: Union[str, List[str]], desc: Union[bool, List[bool]] = False, chunk_size: int = 0):
+        """
+        stable sort of the rows, numbers < dates < times < strings, empty cells are always put last
+        :param by: field or list of fields to sort by
+        :param desc: direction of all fields, or a list with a direction per field
+        :param chunk_size: if set and the sheet is longer, sort keys are sorted in runs spilled to disk
+        """
+        if isinstance(by, str):
+            by = [by]
+        if isinstance(desc, bool):
+            desc = [desc] * len(by)
+        if len(desc) != len(by):
+            raise ValueError('desc should have the same length as by')
+        for field in by:
+            if field not in self.fields:
+                raise NameError(f'field {field} not found')
+
+        if chunk_size <= 0 or len(self.data_rows) <= chunk_size:
+            result = self.data_rows
+            # sort by the least significant field first, python's sort is stable
+            for field, d in reversed([*zip(by, desc)]):
+                result = sorted(result, key=lambda r: _sort_value(r[field].value, d), reverse=d)
+            self.data_rows = result
+            return
+
+        desc = tuple(desc)
+
+        def keys():
+            for i in range(len(self.data_rows)):
+                row = self.data_rows[i]
+                yield SortKey(tuple(_sort_value(row[f].value, d) for f, d in zip(by, desc)), desc), i
+
+        # position breaks ties, which keeps the sort stable
+        self.data_rows = [self.data_rows[i] for _, i in external_sort(keys(), chunk_size)]
+
+    def group_by(self, by: Union[str, List[str]],
+                 aggregations: Union[Dict[str, Tuple[str, Union[str, Callable[[Any, Any], Any]]]], None] = None
+                 ) -> Union[Dict[tuple, List[Row]], 'Sheet']:
+        """
+        group rows having the same values in one pass, groups keep the order in which they are first seen
+        :param by: field or list of fields to group by
+        :param aggregations: {new field: (field, aggregation)}, see Aggregation
+        :return: {values of by: rows} without aggregations, otherwise a new sheet with one row per group
+        """
+        if isinstance(by, str):
+            by = [by]
+        for field in by:
+            if field not in self.fields:
+                raise NameError(f'field {field} not found')
+
+        if aggregations is None:
+            groups: Dict[tuple, List[Row]] = {}
+            for row in self.data_rows:
+                k = tuple(row[f].value for f in by)
+                group = groups.get(k)
+                if group is None:
+                    groups[k] = [row]
                 else:
-                    if copied[j][by].value < min[by].value:
-                        min = copied[j]
-            copied.remove(min)
-            result.append(min)
-        self.data_rows = result
+                    group.append(row)
+            return groups
+
+        aggs = []
+        for name in aggregations:
+            field, how = aggregations[name]
+            if field not in self.fields:
+                raise NameError(f'field {field} not found')
+            aggs.append(Aggregation(field, how))
+
+        states: Dict[tuple, List[list]] = {}
+        for row in self.data_rows:
+            k = tuple(row[f].value for f in by)
+            state = states.get(k)
+            if state is None:
+                state = [agg.start() for agg in aggs]
+                states[k] = state
+            for i in range(len(aggs)):
+                aggs[i].step(state[i], row[aggs[i].field].value)
+
+        result = self.__class__(self.suppress_warning, self.name + '_grouped')
+        result.fields = [*by, *aggregations.keys()]
+        for k in states:
+            state = states[k]
+            result.append_row([*k, *[aggs[i].finish(state[i]) for i in range(len(aggs))]])
+        return result
 
     def beautify(self, by: str) -> List[Row]:
-        if isinstance(by, str):
-            grouped = []
-            ungrouped = copy(self.data_rows)
-            while ungrouped.__len__() > 0:
-                counter = 0
-                current = ungrouped[0][by].value
-                while counter < ungrouped.__len__():
-                    if ungrouped[counter][by].value == current:
-                        grouped.append(ungrouped[counter])
-                        ungrouped.remove(ungrouped[counter])
-                        counter -= 1
-
-                    counter += 1
-            return grouped
+        grouped = []
+        for rows in self.group_by(by).values():
+            grouped.extend(rows)
+        return grouped
 
     def __eq__(self, other):
         if self.name == other.name:
@@ -539,62 +2424,1885 @@ class Sheet:
         return False
 
 
+NAN = float('nan')
+
+
+def _column_kind(value: Any) -> Union[str, None]:
+    """
+    storage kind of a value, None for empty cells which fit in every column
+    """
+    if isinstance(value, str):
+        return None if value == '' else 'text'
+    if isinstance(value, bool):
+        return 'object'
+    if isinstance(value, float):
+        return 'object' if value != value else 'number'
+    if isinstance(value, int):
+        return 'number' if -2 ** 53 <= value <= 2 ** 53 else 'object'
+    if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+        return 'date'
+    return 'object'
+
+
+class Column(collections.abc.Sequence):
+    """
+    Typed storage of the values of one field: numbers and dates in arrays, strings dictionary encoded.
+    A column falls back to a plain list once it holds values of different kinds.
+    """
+
+    def __init__(self):
+        self.kind: Union[str, None] = None
+        self.data: Union[array, list, None] = None
+        self.length = 0
+        # strings of a text column, and their codes
+        self.dictionary: List[str] = []
+        self.lookup: Dict[str, int] = {}
+        # shared style of cells without their own style
+        self.style = DEFAULT_STYLE
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.get(j) for j in range(*i.indices(self.length))]
+        if i < 0:
+            i += self.length
+        if i < 0 or i >= self.length:
+            raise IndexError('column index out of range')
+        return self.get(i)
+
+    def _start(self, kind: str) -> None:
+        n = self.length
+        if kind == 'number':
+            self.data = array('d', [NAN]) * n
+        elif kind == 'date':
+            self.data = array('i', [0]) * n
+        elif kind == 'text':
+            self.dictionary = ['']
+            self.lookup = {'': 0}
+            self.data = array('i', [0]) * n
+        else:
+            self.data = [''] * n
+        self.kind = kind
+
+    def _to_object(self) -> None:
+        values = [self.get(i) for i in range(self.length)]
+        self.dictionary = []
+        self.lookup = {}
+        self.data = values
+        self.kind = 'object'
+
+    def _prepare(self, value: Any) -> bool:
+        """
+        make sure the column can hold the value
+        :return: False if the column has no storage yet and the value is empty
+        """
+        kind = _column_kind(value)
+        if self.kind is None:
+            if kind is None:
+                return False
+            self._start(kind)
+        elif kind is not None and kind != self.kind and self.kind != 'object':
+            self._to_object()
+        return True
+
+    def _encode(self, value: Any):
+        kind = self.kind
+        if kind == 'object':
+            return value
+        if kind == 'text':
+            code = self.lookup.get(value)
+            if code is None:
+                code = len(self.dictionary)
+                self.dictionary.append(value)
+                self.lookup[value] = code
+            return code
+        if isinstance(value, str):
+            # empty cell
+            return NAN if kind == 'number' else 0
+        if kind == 'number':
+            return float(value)
+        return value.toordinal()
+
+    def encode_filter(self, op: str, operand: Any) -> Union[Tuple[Sequence, str, Any, Union[Callable, None]], None]:
+        """
+        translate a filter test to the stored values: (data, operator, operand, extra test on stored values),
+        None when the values have to be decoded
+        """
+        kind = self.kind
+        if kind is None or kind == 'object':
+            return None
+        if op == 'null' or op == 'not null':
+            empty = {'number': lambda v: v != v, 'date': lambda v: v == 0, 'text': lambda v: v == 0}[kind]
+            # every value passes "not in ()", the guard does the test
+            return self.data, 'not in', (), empty if op == 'null' else (lambda v: not empty(v))
+        members = [operand] if op in COMPARISONS else [*operand]
+        if any(_is_empty(m) for m in members):
+            return None
+        if kind == 'text':
+            if op not in ('==', '!=', 'in', 'not in') or not all(isinstance(m, str) for m in members):
+                return None
+            codes = [self.lookup.get(m, -1) for m in members]
+            return self.data, op, codes[0] if op in COMPARISONS else codes, None
+        if kind == 'number':
+            if not all(isinstance(m, (int, float)) and not isinstance(m, bool) for m in members):
+                return None
+            return self.data, op, operand, None
+        if not all(isinstance(m, datetime.date) and not isinstance(m, datetime.datetime) for m in members):
+            return None
+        ordinals = [m.toordinal() for m in members]
+        encoded = ordinals[0] if op in COMPARISONS else ordinals
+        # empty dates are stored as 0
+        return self.data, op, encoded, (lambda v: v != 0) if op in ('<', '<=', 'between') else None
+
+    def get(self, i: int) -> Any:
+        kind = self.kind
+        if kind is None:
+            return ''
+        v = self.data[i]
+        if kind == 'text':
+            return self.dictionary[v]
+        if kind == 'number':
+            if v != v:
+                return ''
+            return int(v) if v % 1 == 0 else v
+        if kind == 'date':
+            return '' if v == 0 else datetime.date.fromordinal(v)
+        return v
+
+    def __copy__(self):
+        result = Column()
+        result.kind = self.kind
+        if isinstance(self.data, array):
+            result.data = array(self.data.typecode, self.data)
+        elif self.data is not None:
+            result.data = [*self.data]
+        result.length = self.length
+        result.dictionary = [*self.dictionary]
+        result.lookup = {**self.lookup}
+        result.style = self.style
+        return result
+
+    def memory_usage(self, sample: int = 1000) -> Dict[str, int]:
+        """
+        estimated bytes of the stored values and of the strings, see Sheet.memory_report
+        """
+        usage = {'values': 0, 'strings': 0}
+        if self.data is None:
+            return usage
+        usage['values'] = sys.getsizeof(self.data)
+        if isinstance(self.data, list) and len(self.data) != 0:
+            picked = _sample(self.data, sample)
+            for v in picked:
+                usage['strings' if isinstance(v, str) else 'values'] += sys.getsizeof(v) * len(self.data) // len(picked)
+        if len(self.dictionary) != 0:
+            usage['strings'] += sys.getsizeof(self.dictionary) + sys.getsizeof(self.lookup) \
+                + sum(sys.getsizeof(v) for v in self.dictionary)
+        return usage
+
+    def values(self) -> List[Any]:
+        """
+        every value decoded at once, like get
+        """
+        kind = self.kind
+        data = self.data
+        if kind is None:
+            return [''] * self.length
+        if kind == 'text':
+            dictionary = self.dictionary
+            return [dictionary[v] for v in data]
+        if kind == 'number':
+            return ['' if v != v else int(v) if v % 1 == 0 else v for v in data]
+        if kind == 'date':
+            fromordinal = datetime.date.fromordinal
+            return ['' if v == 0 else fromordinal(v) for v in data]
+        return [*data]
+
+    def append(self, value: Any) -> None:
+        if self._prepare(value):
+            self.data.append(self._encode(value))
+        self.length += 1
+
+    def set(self, i: int, value: Any) -> None:
+        if self._prepare(value):
+            self.data[i] = self._encode(value)
+
+    def pop(self, i: int) -> None:
+        if self.kind is not None:
+            self.data.pop(i)
+        self.length -= 1
+
+    def reorder(self, order: List[int]) -> None:
+        """
+        :param order: old position of every new position
+        """
+        if self.kind is None:
+            return
+        data = self.data
+        if isinstance(data, array):
+            self.data = array(data.typecode, [data[j] for j in order])
+        else:
+            self.data = [data[j] for j in order]
+
+
+class CellView(Cell):
+    """
+    Cell of a ColumnarSheet, reads and writes the column directly
+    """
+    __slots__ = ('owner', 'position', 'field')
+
+    def __init__(self, owner: 'ColumnarSheet', position: int, field: str):
+        self.owner = owner
+        self.position = position
+        self.field = field
+
+    @property
+    def value(self):
+        return self.owner.columns[self.field].get(self.position)
+
+    @value.setter
+    def value(self, value):
+        owner = self.owner
+        if owner._views is not None and len(owner.indexes) != 0:
+            old = self.value
+            owner._writable(self.field).set(self.position, value)
+            owner._value_changed(owner._views[self.position], self.field, old)
+        else:
+            owner._writable(self.field).set(self.position, value)
+        owner._dirty = True
+
+    @property
+    def style(self):
+        style = self.owner.styles.get((self.position, self.field))
+        if style is None:
+            # copy on write, like Cell
+            return _CellStyle(self, self.owner.columns[self.field].style)
+        return style
+
+    def _adopt_style(self, style: Style, shared: Style) -> None:
+        styles = self.owner.styles
+        key = (self.position, self.field)
+        if key not in styles and self.owner.columns[self.field].style is shared:
+            styles[key] = style
+        if styles.get(key) is style:
+            self.owner._dirty = True
+
+    @style.setter
+    def style(self, style: Style):
+        self.owner.styles[(self.position, self.field)] = style
+        self.owner._dirty = True
+
+    def _effective_style(self) -> Style:
+        style = self.owner.styles.get((self.position, self.field))
+        if style is None:
+            return self.owner.columns[self.field].style
+        return style
+
+
+class RowView(Row):
+    """
+    Row of a ColumnarSheet, a mapping of fields to CellViews created on access
+    """
+    __slots__ = ('position',)
+
+    def __init__(self, sheet: 'ColumnarSheet', position: int):
+        self.sheet = sheet
+        self.position = position
+
+    @property
+    def fields(self):
+        return self.sheet.fields
+
+    @property
+    def raw(self):
+        return {f: self[f] for f in self.sheet.fields}
+
+    def __getitem__(self, item):
+        sheet = self.sheet
+        if item not in sheet.fields:
+            raise KeyError(item)
+        special = sheet.cells.get((self.position, item))
+        if special is not None:
+            return special
+        sheet._column(item)
+        return CellView(sheet, self.position, item)
+
+    def __setitem__(self, key, value):
+        if key not in self.sheet.fields:
+            raise KeyError(key)
+        old = None
+        if len(self.sheet.indexes) != 0:
+            old = self[key]
+            if type(old) is CellView:
+                # the view would read the new value
+                old = Cell(old.value)
+        self.sheet._store(self.position, key, value, append=False)
+        self.sheet._changed(self, key, old)
+
+    def _cell_changed(self, cell: Cell, old: Any) -> None:
+        cells = self.sheet.cells
+        for f in self.sheet.fields:
+            if cells.get((self.position, f)) is cell:
+                self.sheet._value_changed(self, f, old)
+
+    def __delitem__(self, key):
+        self[key] = ''
+
+    def __len__(self):
+        return len(self.sheet.fields)
+
+    def __contains__(self, item):
+        return item in self.sheet.fields
+
+    def values(self):
+        return [self[f] for f in self.sheet.fields]
+
+
+# guards the columns shared between copies of columnar sheets
+_SHARED_COLUMNS_LOCK = threading.Lock()
+
+
+class ColumnarSheet(Sheet):
+    """
+    Sheet storing every field in a typed Column instead of a Row of Cells per row.
+    data_rows holds lightweight RowViews over the columns. Cells without their own style
+    share the style of their column, which is taken from the first non-empty cell.
+    """
+
+    def __init__(self, suppress_warning: bool = False, sheet: Union[xlrd.sheet.Sheet, str] = '',
+                 budget: Union[MemoryBudget, None] = None):
+        self.columns: Dict[str, Column] = {}
+        # sparse maps of (position, field) to own styles and to formula or image cells
+        self.styles: Dict[Tuple[int, str], Style] = {}
+        self.cells: Dict[Tuple[int, str], Cell] = {}
+        # fields whose column is shared with another sheet until it is written, see copy
+        self._shared = set()
+        self._length = 0
+        self._views: Union[List[RowView], None] = None
+        super().__init__(suppress_warning, sheet, budget)
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def data_rows(self) -> List[RowView]:
+        if self._views is None:
+            self._views = [RowView(self, i) for i in range(self._length)]
+        return self._views
+
+    @data_rows.setter
+    def data_rows(self, rows: List[Row]):
+        if len(rows) == self._length \
+                and all(isinstance(r, RowView) and r.sheet is self for r in rows) \
+                and len({r.position for r in rows}) == self._length:
+            self._reorder([r.position for r in rows])
+            for i in range(len(rows)):
+                rows[i].position = i
+            self._views = rows
+            return
+        materialized = [copy(r) for r in rows]
+        self.columns = {}
+        self._shared = set()
+        self.styles = {}
+        self.cells = {}
+        self._length = 0
+        self._views = None
+        for r in materialized:
+            self.append_row(r)
+
+    def _column(self, field: str) -> Column:
+        column = self.columns.get(field)
+        if column is None:
+            # fields may be assigned directly, create the column on first use
+            column = Column()
+            column.length = self._length
+            self.columns[field] = column
+        return column
+
+    def _writable(self, field: str) -> Column:
+        """
+        column of a field which can be changed, a shared column is copied first
+        """
+        if field in self._shared:
+            with _SHARED_COLUMNS_LOCK:
+                if field in self._shared:
+                    self._shared.discard(field)
+                    self.columns[field] = copy(self.columns[field])
+        return self._column(field)
+
+    def _store(self, position: int, field: str, value: Any, append: bool) -> None:
+        self._dirty = True
+        column = self._writable(field)
+        key = (position, field)
+        style = None
+        if isinstance(value, Cell):
+            if isinstance(value, (FormulaCell, ImageCell)):
+                self.cells[key] = value
+            else:
+                self.cells.pop(key, None)
+            style = value._effective_style()
+            value = value.value
+        else:
+            self.cells.pop(key, None)
+        if append:
+            if column.kind is None and style is not None and _column_kind(value) is not None:
+                column.style = Style.shared(style)
+            column.append(value)
+        else:
+            column.set(position, value)
+        if style is None or style is column.style or style.key() == column.style.key():
+            self.styles.pop(key, None)
+        else:
+            self.styles[key] = style
+
+    def _init_data(self, sheet: xlrd.sheet.Sheet, budget: Union[MemoryBudget, None] = None):
+        for cells in self._read_cells(sheet, budget):
+            self.append_row(cells)
+
+    def _append_cells(self, rows: Iterable[List[Cell]]) -> None:
+        for cells in rows:
+            self.append_row(cells)
+
+    def _reorder(self, order: List[int]) -> None:
+        self._dirty = True
+        for field in [*self.columns]:
+            self._writable(field).reorder(order)
+        new_position = {order[i]: i for i in range(len(order))}
+        self.styles = {(new_position[p], f): v for (p, f), v in self.styles.items()}
+        self.cells = {(new_position[p], f): v for (p, f), v in self.cells.items()}
+
+    def append_row(self, content: Union[Row, dict, List[Union[str, Cell]]]) -> None:
+        if isinstance(content, dict) or isinstance(content, Row):
+            values = [content[f] if f in content else '' for f in self.fields]
+        elif isinstance(content, list):
+            values = [content[i] if i < len(content) else '' for i in range(len(self.fields))]
+        else:
+            raise TypeError('Expected Row, dict or list')
+        position = self._length
+        for field, value in zip(self.fields, values):
+            self._store(position, field, value, append=True)
+        self._length += 1
+        if self._views is not None:
+            valid = [index for index in self.indexes.values() if index.is_valid(self._views)]
+            view = RowView(self, position)
+            self._views.append(view)
+            for index in valid:
+                index.append(view)
+
+    def remove_row(self, row: Row) -> None:
+        rows = self.data_rows
+        if isinstance(row, RowView) and row.sheet is self:
+            position = row.position
+        else:
+            for position in range(len(rows)):
+                if rows[position] == row:
+                    break
+            else:
+                raise ValueError('row not found')
+        removed = rows[position]
+        for index in self.indexes.values():
+            if index.is_valid(rows):
+                index.remove(removed)
+        self._dirty = True
+        for field in [*self.columns]:
+            self._writable(field).pop(position)
+        self.styles = {(p - (p > position), f): v for (p, f), v in self.styles.items() if p != position}
+        self.cells = {(p - (p > position), f): v for (p, f), v in self.cells.items() if p != position}
+        self._length -= 1
+        del rows[position]
+        for i in range(position, len(rows)):
+            rows[i].position = i
+
+    def append_col(self, col: str, default=''):
+        if col in self.fields:
+            raise ValueError('Duplicated col')
+        self.fields.append(col)
+        column = self._writable(col)
+        column.length = 0
+        for i in range(self._length):
+            self._store(i, col, default, append=True)
+
+    def get_col_values(self, col: str) -> Sequence:
+        if col not in self.fields:
+            raise NameError(f'field "{col}" does not exists')
+        return self._column(col)
+
+    def _values(self, col: str, rows: Iterable[Row]) -> List[Any]:
+        return [row[col].value for row in rows]
+
+    def _snapshot(self) -> tuple:
+        return self._length, tuple(self.fields), self.header_style.key()
+
+    def _cells_modified(self) -> bool:
+        # values and styles of the columns mark the sheet directly, only formula and image cells are objects
+        return any(c._modified for c in self.cells.values())
+
+    def _own_styles(self) -> Iterator[Style]:
+        for style in [*(column.style for column in self.columns.values()), *self.styles.values(),
+                      *(c._style for c in self.cells.values())]:
+            if not style.frozen:
+                yield style
+
+    def mark_clean(self) -> None:
+        for c in self.cells.values():
+            c._modified = False
+        self._clean_state()
+
+    def to_sheet(self) -> Sheet:
+        """
+        convert to a sheet holding Rows of Cells
+        """
+        result = Sheet(self.suppress_warning, self.name)
+        result.fields = [*self.fields]
+        result.header_style = self.header_style
+        fields = result.fields
+        columns = [self._column(f) for f in fields]
+        values = [column.values() for column in columns]
+        styles = [column.style for column in columns]
+        width = range(len(fields))
+        rows = result.data_rows
+        for i in range(self._length):
+            row = Row(fields, result.schema)
+            row.cells = [Cell(values[j][i], styles[j]) for j in width]
+            row.sheet = result
+            rows.append(row)
+        positions = {f: j for j, f in enumerate(fields)}
+        for (i, field), style in self.styles.items():
+            if field in positions:
+                rows[i].cells[positions[field]]._style = style
+        for (i, field), cell in self.cells.items():
+            if field in positions:
+                rows[i].cells[positions[field]] = cell
+        return result
+
+    def copy(self) -> 'ColumnarSheet':
+        """
+        copy sharing the columns, a column is copied when one of the sheets changes it
+        """
+        result = ColumnarSheet(self.suppress_warning, self.name)
+        result.fields = [*self.fields]
+        result.header_style = copy(self.header_style)
+        # both sheets copy a column before writing it, threads may copy the same sheet
+        with _SHARED_COLUMNS_LOCK:
+            result.columns = {**self.columns}
+            result._shared = set(self.columns)
+            self._shared.update(self.columns)
+        result.styles = {k: v if v.frozen else copy(v) for k, v in self.styles.items()}
+        result.cells = {k: _copy_cell(c) for k, c in self.cells.items()}
+        result._length = self._length
+        result._views = None
+        return result
+
+    def memory_report(self, sample: int = 1000) -> dict:
+        # columns shared with a copy are counted by every sheet using them
+        columns = {f: {'cells': 0, 'strings': 0, 'values': 0, 'styles': 0} for f in self.fields}
+        for field, usage in columns.items():
+            if field in self.columns:
+                usage.update(self.columns[field].memory_usage(sample))
+                usage['styles'] += sys.getsizeof(self.columns[field].style)
+        for (_, field), style in self.styles.items():
+            if field in columns:
+                columns[field]['styles'] += sys.getsizeof(style)
+        for (_, field), c in self.cells.items():
+            if field in columns:
+                columns[field]['cells'] += sys.getsizeof(c) + sys.getsizeof(c._value)
+        rows = sys.getsizeof(self.styles) + sys.getsizeof(self.cells)
+        if self._views is not None:
+            rows += sys.getsizeof(self._views) + len(self._views) * sys.getsizeof(RowView(self, 0))
+        return _memory_report(self._length, rows, columns, sys.getsizeof(self.header_style), self._index_memory())
+
+    @staticmethod
+    def from_sheet(sheet: Sheet) -> 'ColumnarSheet':
+        """
+        convert a sheet holding Rows of Cells
+        """
+        result = ColumnarSheet(sheet.suppress_warning, sheet.name)
+        result.fields = [*sheet.fields]
+        result.header_style = sheet.header_style
+        for row in sheet.data_rows:
+            result.append_row(row)
+        return result
+
+    def __getstate__(self):
+        state = {**self.__dict__}
+        # views and indexes are rebuilt on demand
+        state['_views'] = None
+        state['indexes'] = {k: Index(k) for k in self.indexes}
+        return state
+
+
+def _worksheet_parts(zip: zipfile.ZipFile) -> List[Tuple[str, str]]:
+    """
+    names and xml parts of the worksheets in sheet order, resolved through the workbook relationships
+    """
+    workbook = ElementTree.fromstring(zip.read('xl/workbook.xml'))
+    rels = ElementTree.fromstring(zip.read('xl/_rels/workbook.xml.rels'))
+    targets = {}
+    for rel in rels.iter(f'{{{PACKAGE_RELATIONSHIP_NS}}}Relationship'):
+        target = rel.get('Target')
+        if target.startswith('/'):
+            target = target[1:]
+        else:
+            target = 'xl/' + target
+        targets[rel.get('Id')] = target
+    return [(e.get('name'), targets[e.get(f'{{{RELATIONSHIP_NS}}}id')])
+            for e in workbook.iter(f'{{{SPREADSHEET_NS}}}sheet')]
+
+
+class _XlsxBook:
+    """
+    xlsx workbook read by xlrd one sheet at a time. xlrd ignores on_demand for xlsx files and parses every
+    sheet when they are opened, here only the workbook, styles and shared strings are read up front and
+    a sheet is parsed when it is asked, then belongs to the caller.
+    """
+    on_demand = True
+
+    def __init__(self, path: str, parsed: Union[tuple, None] = None):
+        """
+        :param parsed: parts of a book of the same file already read, see parsed
+        """
+        xlsx = xlrd.xlsx
+        xlsx.ensure_elementtree_imported(0, sys.stdout)
+        self.path = path
+        self.zip = zipfile.ZipFile(path)
+        self.parts = {xlsx.X12Book.convert_filename(name): name for name in self.zip.namelist()}
+        book = xlrd.book.Book()
+        book.logfile = sys.stdout
+        book.verbosity = 0
+        book.formatting_info = 0
+        book.use_mmap = False
+        book.on_demand = False
+        book.ragged_rows = 0
+        if parsed is None:
+            x12book = xlsx.X12Book(book, sys.stdout, 0)
+            with self.zip.open(self.parts['xl/_rels/workbook.xml.rels']) as f:
+                x12book.process_rels(f)
+            with self.zip.open(self.parts['xl/workbook.xml']) as f:
+                x12book.process_stream(f, 'Workbook')
+            if 'xl/styles.xml' in self.parts:
+                with self.zip.open(self.parts['xl/styles.xml']) as f:
+                    xlsx.X12Styles(book, sys.stdout, 0).process_stream(f, 'styles')
+            if 'xl/sharedstrings.xml' in self.parts:
+                with self.zip.open(self.parts['xl/sharedstrings.xml']) as f:
+                    xlsx.X12SST(book, sys.stdout, 0).process_stream(f, 'SST')
+            self.targets: List[str] = x12book.sheet_targets
+        else:
+            book._sharedstrings, book._xf_index_to_xl_type_map, book.datemode, book._sheet_names, \
+                book._sheet_visibility, self.targets = parsed
+            book.nsheets = len(book._sheet_names)
+        # the sheets created by xlrd while reading the workbook are never filled
+        book._sheet_list = [None] * book.nsheets
+        self.book = book
+        self.nsheets = book.nsheets
+        self.datemode = book.datemode
+
+    @property
+    def parsed(self) -> tuple:
+        """
+        shared strings, cell types of the styles, datemode, sheet names, visibilities and parts, enough for
+        another process to open the file without reading them again
+        """
+        book = self.book
+        return book._sharedstrings, book._xf_index_to_xl_type_map, book.datemode, book._sheet_names, \
+            book._sheet_visibility, self.targets
+
+    def sheet_names(self) -> List[str]:
+        return self.book.sheet_names()
+
+    def sheet_by_index(self, index: int) -> xlrd.sheet.Sheet:
+        book = self.book
+        sheet = xlrd.sheet.Sheet(book, position=None, name=book._sheet_names[index], number=index)
+        sheet.utter_max_rows = xlrd.xlsx.X12_MAX_ROWS
+        sheet.utter_max_cols = xlrd.xlsx.X12_MAX_COLS
+        with self.zip.open(self.parts[self.targets[index]]) as f:
+            xlrd.xlsx.X12Sheet(sheet, sys.stdout, 0).process_stream(f)
+        sheet.tidy_dimensions()
+        return sheet
+
+    def has_cells(self, index: int) -> bool:
+        """
+        whether xlrd would find a cell in a sheet, the sheet is only read up to its first cell
+        """
+        cell_tag = f'{{{SPREADSHEET_NS}}}c'
+        value_tag = f'{{{SPREADSHEET_NS}}}v'
+        row_tag = f'{{{SPREADSHEET_NS}}}row'
+        with self.zip.open(self.parts[self.targets[index]]) as f:
+            for _, e in ElementTree.iterparse(f):
+                if e.tag == cell_tag:
+                    # numbers and shared strings without a value are blank cells, skipped by xlrd
+                    if e.get('t', 'n') not in ('n', 's'):
+                        return True
+                    value = e.find(value_tag)
+                    if value is not None and value.text:
+                        return True
+                elif e.tag == row_tag:
+                    e.clear()
+        return False
+
+    def unload_sheet(self, sheet: Union[int, str]) -> None:
+        # parsed sheets are not kept
+        pass
+
+    def release_resources(self) -> None:
+        self.zip.close()
+
+
+def _open_book(path: str) -> Union[xlrd.Book, _XlsxBook]:
+    """
+    open a workbook whose sheets are parsed when they are asked
+    """
+    with open(path, 'rb') as f:
+        zipped = f.read(4) == b'PK\x03\x04'
+    if zipped:
+        return _XlsxBook(path)
+    return xlrd.open_workbook(path, on_demand=True)
+
+
+def _cell_position(ref: str) -> Tuple[int, int]:
+    """
+    convert cell notation to (row, col) tuple
+    """
+    i = 0
+    while i < len(ref) and ref[i].isalpha():
+        i += 1
+    return int(ref[i:]) - 1, _column_index(ref)
+
+
+def _set_formula(loaded_sheet: Sheet, row_number: int, col_number: int, formula: str) -> None:
+    # first row holds the fields
+    if row_number < 1 or row_number > len(loaded_sheet) or col_number >= len(loaded_sheet.fields):
+        return
+    row = loaded_sheet.data_rows[row_number - 1]
+    field = loaded_sheet.fields[col_number]
+    old = row[field]
+    row[field] = FormulaCell(formula=formula, value=old.value, style=old._effective_style())
+
+
+def _capture_formulas(filename: str, index: int, loaded_sheet: Sheet) -> None:
+    """
+    replace cells having a formula with FormulaCell, the sheet xml is scanned once without loading it
+    :param filename: xlsx file
+    :param index: index of the sheet in the file
+    :param loaded_sheet: converted sheet
+    """
+    if not zipfile.is_zipfile(filename):
+        return
+    row_tag = f'{{{SPREADSHEET_NS}}}row'
+    cell_tag = f'{{{SPREADSHEET_NS}}}c'
+    formula_tag = f'{{{SPREADSHEET_NS}}}f'
+    sheet_data_tag = f'{{{SPREADSHEET_NS}}}sheetData'
+    with zipfile.ZipFile(filename) as zip:
+        part = _worksheet_parts(zip)[index][1]
+        with zip.open(part) as f:
+            sheet_data = None
+            row_number = 0
+            col_number = -1
+            for event, elem in ElementTree.iterparse(f, events=('start', 'end')):
+                tag = elem.tag
+                if event == 'start':
+                    if tag == row_tag:
+                        r = elem.get('r')
+                        row_number = int(r) - 1 if r is not None else row_number + 1
+                        col_number = -1
+                    elif tag == sheet_data_tag:
+                        sheet_data = elem
+                    continue
+
+                if tag == cell_tag:
+                    r = elem.get('r')
+                    if r is not None:
+                        row_number, col_number = _cell_position(r)
+                    else:
+                        col_number += 1
+                    formula = elem.find(formula_tag)
+                    # shared formulas only hold their text in the first cell
+                    if formula is not None and formula.text:
+                        _set_formula(loaded_sheet, row_number, col_number, formula.text)
+                elif tag == row_tag and sheet_data is not None:
+                    # drop parsed rows, memory stays bounded by one row
+                    sheet_data.clear()
+
+
+# workbook read by the parent process, given to the workers of a parallel load
+_worker_book: Union['_XlsxBook', None] = None
+
+
+def _init_load_worker(path: str, parsed: tuple) -> None:
+    global _worker_book
+    # opened again, a forked worker would share the file position of the parent
+    _worker_book = _XlsxBook(path, parsed)
+
+
+def _load_sheet_payload(index: int, columnar: bool, catch_formulas: bool, suppress_warning: bool) \
+        -> Union['Sheet', None]:
+    """
+    parse and convert one sheet in a worker process, like Dataset._load does
+    :param columnar: the dataset is columnar
+    :return: the sheet, or None if it has no cells
+    """
+    sheet = _worker_book.sheet_by_index(index)
+    if sheet.nrows == 0:
+        return None
+    if columnar or len(set(sheet.row_values(0))) == sheet.ncols:
+        # much cheaper to send back than rows of cells, the parent converts it to rows
+        result = ColumnarSheet(suppress_warning, sheet)
+    else:
+        # fields with the same name would share one column
+        result = Sheet(suppress_warning, sheet)
+    if catch_formulas:
+        _capture_formulas(_worker_book.path, index, result)
+    return result
+
+
+def _file_part(value: Any) -> str:
+    """
+    file name made of a cell value
+    """
+    result = re.sub(r'[\\/:*?"<>|\x00-\x1f]', '_', str(value)).strip()
+    return result if result != '' else '_'
+
+
+def _unique_names(names: List[str]) -> List[str]:
+    """
+    file names made unique ignoring case, different values may give the same name and some file systems
+    do not tell 'A' from 'a'. Repeated names get a number, like 'a_b (2)'
+    """
+    taken = {name.lower() for name in names}
+    seen = set()
+    result = []
+    for name in names:
+        if name.lower() in seen:
+            i = 2
+            while f'{name} ({i})'.lower() in taken:
+                i += 1
+            name = f'{name} ({i})'
+            taken.add(name.lower())
+        seen.add(name.lower())
+        result.append(name)
+    return result
+
+
+def _sheet_cells(table: Sheet, rows: List[Row], detach: bool = False) -> Iterable[List[Cell]]:
+    """
+    cells of rows in field order
+    :param detach: copy cells into a list that can be sent to another process
+    """
+    fields = table.fields
+    if not detach:
+        return ([row[f] for f in fields] for row in rows)
+    result = []
+    for row in rows:
+        cells = []
+        for f in fields:
+            c = row[f]
+            if isinstance(c, CellView):
+                c = Cell(c.value, c._effective_style())
+            cells.append(c)
+        result.append(cells)
+    return result
+
+
+def _write_sheet(workbook: xlsxwriter.Workbook, formats: FormatCache, name: str, fields: List[str],
+                 rows: Iterable[List[Cell]], header_style: Style, row_height=0, col_width=0,
+                 timer: Union[Timer, None] = None) -> None:
+    """
+    write a sheet with xlsxwriter, with a timer the write phase of the sheet is followed by
+    the formats and images phases, which are part of it
+    """
+    format_count = len(formats.formats)
+    format_seconds = formats.seconds
+    images = 0
+    image_seconds = 0.0
+    with timer.phase('write', name) if timer is not None else _UNTIMED as record:
+        sheet: xlsxwriter.workbook.Worksheet = workbook.add_worksheet(name)
+        pointer = Pointer(0, 0)
+        header_format = formats.get(header_style)
+        for field in fields:
+            sheet.write(pointer.row, pointer.col, field, header_format)
+            pointer.next_col()
+        pointer.next_row()
+        for cells in rows:
+            for data in cells:
+                cell_format = formats.get(data._effective_style())
+                if isinstance(data.value, datetime.date) \
+                        or isinstance(data.value, datetime.time) \
+                        or isinstance(data.value, datetime.datetime):
+
+                    if isinstance(data.value, datetime.date):
+                        sheet.write(pointer.row, pointer.col, str(data.value.isoformat()), cell_format)
+                    elif isinstance(data.value, datetime.time):
+                        sheet.write(pointer.row, pointer.col, str(data.value.isoformat()), cell_format)
+                    else:
+                        sheet.write(pointer.row, pointer.col, str(data.value), cell_format)
+
+                else:
+
+                    if isinstance(data, ImageCell):
+                        start = time.perf_counter()
+                        source, (width, height) = formats.images.get(data.data)
+                        images += 1
+                        image_seconds += time.perf_counter() - start
+                        if isinstance(source, str):
+                            sheet.insert_image(pointer.row, pointer.col, source,
+                                               {'y_offset': 10, 'x_offset': 10})
+                        else:
+                            source.seek(0)
+                            sheet.insert_image(pointer.row, pointer.col, data.value,
+                                               {'image_data': source, 'y_offset': 10, 'x_offset': 10})
+                        if row_height == 0:
+                            sheet.set_row(pointer.row, height)
+                        else:
+                            sheet.set_row(pointer.row, row_height)
+                        if col_width != 0:
+                            sheet.set_column(pointer.col, pointer.col, (col_width / 8))
+                        else:
+                            sheet.set_column(pointer.col, pointer.col, (width / 8))
+                        sheet.write(pointer.row, pointer.col, '', cell_format)
+                    elif isinstance(data, FormulaCell):
+                        sheet.write_formula(pointer.row, pointer.col, data.formula, cell_format)
+                    else:
+                        sheet.write(pointer.row, pointer.col, data.value, cell_format)
+                pointer.next_col()
+            pointer.next_row()
+        record.rows = pointer.row - 1
+        record.cells = record.rows * len(fields)
+    if timer is not None:
+        timer.add(Phase('formats', name, formats.seconds - format_seconds, cells=len(formats.formats) - format_count))
+        if images != 0:
+            timer.add(Phase('images', name, image_seconds, cells=images))
+
+
+def _write_file(filename: str, sheets: List[Tuple[str, List[str], Iterable[List[Cell]], Style]],
+                constant_memory=True, row_height=0, col_width=0, timer: Union[Timer, None] = None,
+                images: Iterable[Union[BytesIO, str]] = (), image_workers: int = 0) -> str:
+    """
+    write sheets given as (name, fields, rows of cells, header style) to a new file
+    :param images: data of the image cells, probed beforehand in image_workers threads if more than 1
+    """
+    workbook = xlsxwriter.Workbook(filename, {'default_date_format': 'yyyy/mm/dd',
+                                              'constant_memory'    : constant_memory})
+    formats = FormatCache(workbook, timer)
+    if image_workers > 1:
+        with timer.phase('images probe') if timer is not None else _UNTIMED:
+            formats.images.probe(images, image_workers)
+    for name, fields, rows, header_style in sheets:
+        _write_sheet(workbook, formats, name, fields, rows, header_style, row_height, col_width, timer)
+    # xlsxwriter assembles the file on close
+    with timer.phase('close') if timer is not None else _UNTIMED:
+        workbook.close()
+    return filename
+
+
+def _write_files(jobs: List[Tuple[str, list]], workers: int = 0) -> List[str]:
+    """
+    write (filename, sheets) jobs, in a process pool if workers > 1
+    """
+    if workers <= 1:
+        return [_write_file(filename, sheets) for filename, sheets in jobs]
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(_write_file, filename, sheets) for filename, sheets in jobs]
+        return [f.result() for f in futures]
+
+
+def _row_values(row: Union[Row, dict, list, tuple], fields: List[str]) -> list:
+    """
+    plain values of a row in field order
+    """
+    if isinstance(row, (list, tuple)):
+        return [v.value if isinstance(v, Cell) else v for v in row]
+    result = []
+    for f in fields:
+        v = row[f] if f in row else ''
+        result.append(v.value if isinstance(v, Cell) else v)
+    return result
+
+
+def _parse_date(s: str) -> datetime.date:
+    if len(s) != 10:
+        raise ValueError(s)
+    return datetime.date.fromisoformat(s)
+
+
+def _parse_datetime(s: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(s)
+
+
+# patterns every value of a csv column must match to be converted, tried in order. Numbers with leading
+# zeros, like identifiers, and other spellings python accepts, like 1_000 or nan, stay strings
+_CSV_TYPES = ((re.compile(r'0|-?[1-9]\d*'), int),
+              (re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d*)?(?:[eE][-+]?\d+)?|-?\.\d+(?:[eE][-+]?\d+)?'), float),
+              (re.compile(r'\d{4}-\d{2}-\d{2}'), _parse_date),
+              (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:\.\d{1,6})?)?(?:[+-]\d{2}:\d{2})?'),
+               _parse_datetime))
+
+
+def _infer_converters(rows: Iterable[List[str]], width: int) -> List[Union[Callable[[str], Any], None]]:
+    """
+    first converter of every column accepting all its non empty values, None to keep strings
+    """
+    candidates = [[*_CSV_TYPES] for _ in range(width)]
+    found = [False] * width
+    for r in rows:
+        for i in range(min(width, len(r))):
+            v = r[i]
+            if v == '' or len(candidates[i]) == 0:
+                continue
+            found[i] = True
+            kept = []
+            for pattern, converter in candidates[i]:
+                if pattern.fullmatch(v) is None:
+                    continue
+                try:
+                    # dates may match the pattern and still be invalid
+                    converter(v)
+                except ValueError:
+                    continue
+                kept.append((pattern, converter))
+            candidates[i] = kept
+    return [c[0][1] if found[i] and len(c) != 0 else None for i, c in enumerate(candidates)]
+
+
+def _json_default(value: Any) -> Any:
+    """
+    serialize dates and times as ISO strings
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _write_json_rows(f, rows: Iterable[Union[Row, dict, list, tuple]], fields: List[str], lines: bool,
+                     default: Union[Callable[[Any], Any], None]) -> None:
+    """
+    write rows one at a time as a json array or as newline delimited json
+    """
+    if default is None:
+        default = _json_default
+    encoder = json.JSONEncoder(default=default)
+    if lines:
+        for r in rows:
+            f.write(encoder.encode(dict(zip(fields, _row_values(r, fields)))))
+            f.write('\n')
+        return
+    f.write('[')
+    for i, r in enumerate(rows):
+        if i != 0:
+            f.write(', ')
+        f.write(encoder.encode(dict(zip(fields, _row_values(r, fields)))))
+    f.write(']')
+
+
+class _JsonStream:
+    """
+    incremental reader for the structure of a json document, values are decoded one at a time
+    """
+
+    def __init__(self, f, object_hook: Union[Callable[[dict], Any], None] = None, size: int = 1 << 16):
+        self.f = f
+        self.size = size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder(object_hook=object_hook)
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.f.read(self.size)
+        if chunk == '':
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, chars: str) -> str:
+        c = self.peek()
+        if c == '' or c not in chars:
+            raise ValueError('invalid format')
+        self.pos += 1
+        return c
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise ValueError('invalid format')
+            # a number or literal may continue in the next chunk
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def array(self) -> Iterator[Any]:
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def _apply_object_hook(value: Any, object_hook: Callable[[dict], Any]) -> Any:
+    """
+    call object_hook on every object of a decoded value, inner ones first like json does
+    """
+    if isinstance(value, dict):
+        return object_hook({k: _apply_object_hook(v, object_hook) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_apply_object_hook(v, object_hook) for v in value]
+    return value
+
+
+def _iter_json_rows(path: str, lines: bool = False,
+                    object_hook: Union[Callable[[dict], Any], None] = None) -> Iterator[Any]:
+    """
+    read the items of a json array, or the lines of a newline delimited json file, one at a time
+    """
+    with open(path, 'r') as f:
+        if lines:
+            decoder = json.JSONDecoder(object_hook=object_hook)
+            for line in f:
+                if line.strip() != '':
+                    yield decoder.decode(line)
+            return
+        yield from _JsonStream(f, object_hook).array()
+
+
+NAMED_COLORS = {'black': '000000', 'blue': '0000FF', 'brown': '800000', 'cyan': '00FFFF', 'gray': '808080',
+                'green': '008000', 'lime': '00FF00', 'magenta': 'FF00FF', 'navy': '000080', 'orange': 'FF6600',
+                'pink': 'FF00FF', 'purple': '800080', 'red': 'FF0000', 'silver': 'C0C0C0', 'white': 'FFFFFF',
+                'yellow': 'FFFF00'}
+# xlsxwriter alignment names which differ from the xml ones
+_HORIZONTAL_ALIGNMENTS = {'center_across': 'centerContinuous'}
+_VERTICAL_ALIGNMENTS = {'vcenter': 'center', 'vjustify': 'justify', 'vdistributed': 'distributed'}
+_CONTROL_CHARACTERS = re.compile('[\x00-\x08\x0b-\x1f]')
+
+
+class _Unsupported(Exception):
+    """
+    raised when a sheet can not be written into the original file, which is then written from scratch
+    """
+
+
+def _xml_text(text: str) -> str:
+    text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return _CONTROL_CHARACTERS.sub(lambda m: f'_x{ord(m.group()):04X}_', text)
+
+
+def _xml_attribute(text: Any) -> str:
+    return _xml_text(str(text)).replace('"', '&quot;')
+
+
+def _argb(color: str) -> Union[str, None]:
+    color = NAMED_COLORS.get(str(color).lower(), str(color)).lstrip('#')
+    if re.fullmatch('[0-9A-Fa-f]{6}', color) is None:
+        return None
+    return 'FF' + color.upper()
+
+
+class _StyleTable:
+    """
+    Formats of rewritten worksheets, appended to the styles part of the original file
+    """
+
+    def __init__(self, xml: str):
+        root = ElementTree.fromstring(xml)
+        if root.tag != f'{{{SPREADSHEET_NS}}}styleSheet':
+            raise _Unsupported('unknown styles part')
+        self.xml = xml
+        self.prefix = re.search(r'<(\w+:)?styleSheet\b', xml).group(1) or ''
+        self.counts: Dict[str, int] = {}
+        for tag in ('numFmts', 'fonts', 'fills', 'borders', 'cellXfs'):
+            e = root.find(f'{{{SPREADSHEET_NS}}}{tag}')
+            if e is None and tag != 'numFmts':
+                raise _Unsupported(f'no {tag} in styles part')
+            self.counts[tag] = 0 if e is None else len(e)
+        if self.counts['borders'] == 0:
+            raise _Unsupported('no borders in styles part')
+        self.added: Dict[str, List[str]] = {'numFmts': [], 'fonts': [], 'fills': [], 'cellXfs': []}
+        # ids of number formats by code, of other records by xml, formats written by an earlier save are reused
+        self.ids: Dict[str, Dict[str, int]] = {'numFmts': {}, 'fonts': {}, 'fills': {}, 'cellXfs': {}}
+        for e in root.iter(f'{{{SPREADSHEET_NS}}}numFmt'):
+            self.ids['numFmts'].setdefault(e.get('formatCode'), int(e.get('numFmtId')))
+        # custom number formats start at 164
+        self.next_format = max([163, *self.ids['numFmts'].values()]) + 1
+        p = self.prefix
+        for tag, item in (('fonts', 'font'), ('fills', 'fill'), ('cellXfs', 'xf')):
+            m = re.search(rf'<{p}{tag}\b[^>]*?>(.*?)</{p}{tag}>', xml, re.S)
+            if m is not None:
+                records = re.findall(rf'<{p}{item}\b[^>]*?(?:/>|>.*?</{p}{item}>)', m.group(1), re.S)
+                for i, record in enumerate(records):
+                    self.ids[tag].setdefault(record, i)
+        self.keys: Dict[tuple, int] = {}
+        # styles seen by identity, kept alive so their ids are not reused
+        self.seen: Dict[int, Tuple[Style, int]] = {}
+
+    def _add(self, tag: str, key: Any, xml: str) -> int:
+        i = self.ids[tag].get(key)
+        if i is None:
+            i = self.counts[tag] + len(self.added[tag])
+            self.ids[tag][key] = i
+            self.added[tag].append(xml)
+        return i
+
+    def index(self, style: Style) -> int:
+        """
+        index of the cell format of a style
+        """
+        seen = self.seen.get(id(style))
+        if seen is not None and seen[0] is style:
+            return seen[1]
+        key = style.key()
+        i = self.keys.get(key)
+        if i is None:
+            xf = self._xf(style)
+            i = self.keys[key] = self._add('cellXfs', xf, xf)
+        self.seen[id(style)] = (style, i)
+        return i
+
+    def _xf(self, style: Style) -> str:
+        p = self.prefix
+        color = _argb(style.font_color)
+        font = f'<{p}font>' + (f'<{p}b/>' if style.bold else '') + (f'<{p}u/>' if style.underline else '') \
+            + f'<{p}sz val="{_xml_attribute(style.font_size)}"/>' \
+            + (f'<{p}color rgb="{color}"/>' if color is not None else '') \
+            + f'<{p}name val="{_xml_attribute(style.font_name)}"/></{p}font>'
+        font_id = self._add('fonts', font, font)
+
+        fill_id = 0
+        fill_color = _argb(style.fill_color) if style.fill_color != '' else None
+        if fill_color is not None:
+            fill = f'<{p}fill><{p}patternFill patternType="solid"><{p}fgColor rgb="{fill_color}"/>' \
+                   f'<{p}bgColor indexed="64"/></{p}patternFill></{p}fill>'
+            fill_id = self._add('fills', fill, fill)
+
+        format_id = 0
+        if style.num_format != '':
+            format_id = self.ids['numFmts'].get(style.num_format)
+            if format_id is None:
+                format_id = self.next_format
+                self.next_format += 1
+                self.ids['numFmts'][style.num_format] = format_id
+                self.added['numFmts'].append(
+                    f'<{p}numFmt numFmtId="{format_id}" formatCode="{_xml_attribute(style.num_format)}"/>')
+
+        horizontal = _HORIZONTAL_ALIGNMENTS.get(style.horizontal_alignment, style.horizontal_alignment)
+        vertical = _VERTICAL_ALIGNMENTS.get(style.vertical_alignment, style.vertical_alignment)
+        return f'<{p}xf numFmtId="{format_id}" fontId="{font_id}" fillId="{fill_id}" borderId="0" xfId="0"' \
+               f' applyNumberFormat="1" applyFont="1" applyFill="1" applyAlignment="1">' \
+               f'<{p}alignment horizontal="{_xml_attribute(horizontal)}" vertical="{_xml_attribute(vertical)}"/>' \
+               f'</{p}xf>'
+
+    def render(self) -> str:
+        """
+        the styles part including the added formats
+        """
+        xml = self.xml
+        p = self.prefix
+        for tag in ('numFmts', 'fonts', 'fills', 'cellXfs'):
+            items = ''.join(self.added[tag])
+            if items == '':
+                continue
+            count = self.counts[tag] + len(self.added[tag])
+            m = re.search(rf'<{p}{tag}\b([^>]*?)(/?)>', xml)
+            if m is None:
+                # numFmts is optional and comes first
+                root = re.search(rf'<{p}styleSheet\b[^>]*>', xml)
+                xml = xml[:root.end()] + f'<{p}{tag} count="{count}">{items}</{p}{tag}>' + xml[root.end():]
+                continue
+            attributes = re.sub(r'\s*\bcount="[^"]*"', '', m.group(1))
+            start = f'<{p}{tag} count="{count}"{attributes}>'
+            if m.group(2) == '/':
+                xml = xml[:m.start()] + start + items + f'</{p}{tag}>' + xml[m.end():]
+            else:
+                end = xml.index(f'</{p}{tag}>', m.end())
+                xml = xml[:m.start()] + start + xml[m.end():end] + items + xml[end:]
+        return xml
+
+
+def _value_xml(ref: str, style: int, value: Any) -> str:
+    """
+    xml of a cell written like xlsxwriter's write() would, strings are written inline
+    """
+    if value is None or (isinstance(value, str) and value == ''):
+        return f'<c r="{ref}" s="{style}"/>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}" s="{style}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (datetime.date, datetime.time)):
+        value = value.isoformat()
+    if isinstance(value, str):
+        if value.startswith('='):
+            return f'<c r="{ref}" s="{style}"><f>{_xml_text(value[1:])}</f><v>0</v></c>'
+        if len(value) > 32767:
+            raise _Unsupported('string too long')
+        space = ' xml:space="preserve"' if value != value.strip() else ''
+        return f'<c r="{ref}" s="{style}" t="inlineStr"><is><t{space}>{_xml_text(value)}</t></is></c>'
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise _Unsupported(f'can not write {type(value).__name__}')
+    if number != number or number in (float('inf'), float('-inf')):
+        raise _Unsupported('NAN and INF can not be written')
+    return f'<c r="{ref}" s="{style}"><v>{value if isinstance(value, int) else repr(number)}</v></c>'
+
+
+def _cell_xml(ref: str, style: int, cell: Cell) -> str:
+    if isinstance(cell, ImageCell):
+        raise _Unsupported('images need drawing parts')
+    if isinstance(cell, FormulaCell):
+        value = cell.value
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value == value:
+            cached = f'<v>{value}</v>'
+        elif isinstance(value, str) and value != '':
+            return f'<c r="{ref}" s="{style}" t="str"><f>{_xml_text(cell.formula.lstrip("="))}</f>' \
+                   f'<v>{_xml_text(value)}</v></c>'
+        else:
+            cached = '<v>0</v>'
+        return f'<c r="{ref}" s="{style}"><f>{_xml_text(cell.formula.lstrip("="))}</f>{cached}</c>'
+    return _value_xml(ref, style, cell.value)
+
+
+def _write_worksheet_xml(f, fields: List[str], rows: Iterable[List[Cell]], header_style: Style,
+                         styles: _StyleTable) -> None:
+    """
+    write a worksheet part like _write_sheet, with formats taken from the styles of the original file
+    """
+    letters = [xl_col_to_name(i) for i in range(len(fields))]
+    f.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<worksheet xmlns="{SPREADSHEET_NS}" xmlns:r="{RELATIONSHIP_NS}"><sheetData>')
+    header = styles.index(header_style)
+    f.write('<row r="1">' + ''.join(_value_xml(f'{letter}1', header, field)
+                                    for letter, field in zip(letters, fields)) + '</row>')
+    for number, cells in enumerate(rows, 2):
+        parts = [f'<row r="{number}">']
+        for letter, cell in zip(letters, cells):
+            parts.append(_cell_xml(f'{letter}{number}', styles.index(cell._effective_style()), cell))
+        parts.append('</row>')
+        f.write(''.join(parts))
+    f.write('</sheetData></worksheet>')
+
+
+def _workbook_part(zip: zipfile.ZipFile, kind: str) -> Union[str, None]:
+    """
+    part of the workbook relationship of a type, like styles or calcChain
+    """
+    rels = ElementTree.fromstring(zip.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels.iter(f'{{{PACKAGE_RELATIONSHIP_NS}}}Relationship'):
+        if rel.get('Type', '').endswith('/' + kind):
+            target = rel.get('Target')
+            return target[1:] if target.startswith('/') else 'xl/' + target
+    return None
+
+
+def _part_rels(part: str) -> str:
+    directory, name = os.path.split(part)
+    return f'{directory}/_rels/{name}.rels'
+
+
+def _part_relationships(zip: zipfile.ZipFile) -> Dict[str, List[str]]:
+    """
+    parts of the file targeted by the relationships of every part, the package itself is ''
+    """
+    result = {}
+    for name in zip.namelist():
+        directory, rels = posixpath.split(name)
+        if posixpath.basename(directory) != '_rels' or not rels.endswith('.rels'):
+            continue
+        base = posixpath.dirname(directory)
+        targets = []
+        for rel in ElementTree.fromstring(zip.read(name)).iter(f'{{{PACKAGE_RELATIONSHIP_NS}}}Relationship'):
+            if rel.get('TargetMode') == 'External':
+                continue
+            target = rel.get('Target', '')
+            targets.append(target[1:] if target.startswith('/') else posixpath.normpath(posixpath.join(base, target)))
+        result[posixpath.join(base, rels[:-len('.rels')])] = targets
+    return result
+
+
+def _orphaned_parts(relationships: Dict[str, List[str]], rewritten: Iterable[str]) -> set:
+    """
+    parts only reachable through the relationships of rewritten parts, like their drawings and images
+    """
+    rewritten = set(rewritten)
+
+    def reach(starts: List[str]) -> set:
+        seen = set()
+        while len(starts) != 0:
+            part = starts.pop()
+            if part not in seen:
+                seen.add(part)
+                if part not in rewritten:
+                    starts.extend(relationships.get(part, ()))
+        return seen
+
+    kept = reach([''])
+    return reach([t for part in rewritten for t in relationships.get(part, ())]) - kept
+
+
+def _copy_zip_member(source: zipfile.ZipFile, target: zipfile.ZipFile, info: zipfile.ZipInfo) -> None:
+    """
+    copy a member keeping its name, date, compression and attributes
+    """
+    member = zipfile.ZipInfo(info.filename, info.date_time)
+    member.compress_type = info.compress_type
+    member.external_attr = info.external_attr
+    member.comment = info.comment
+    # decides whether the member needs zip64
+    member.file_size = info.file_size
+    with source.open(info) as src, target.open(member, 'w') as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+
+
+def _quote_identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1 << 20)
+            if len(chunk) == 0:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class WorkbookCache:
+    """
+    On disk cache of parsed sheets, one file per workbook and loading options holding a small header
+    and the pickled sheets. An entry is used while the size and modification time of the workbook are
+    unchanged, or when its content hash still matches. Entries not used for max_age seconds are removed,
+    and the least recently used ones once the cache is larger than max_size bytes.
+    Reading an entry may run code put in it, the directory must belong to the user and only be accessible
+    by its owner (mode 700), it is created so. This is not checked where there are no file owners, like on windows.
+    """
+    MAGIC = b'EXMC'
+    # bumped when pickled sheets of older versions can not be used
+    VERSION = 1
+
+    def __init__(self, directory: str = '', max_size: int = 2 << 30, max_age: float = 7 * 24 * 3600):
+        if directory == '':
+            base = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+            directory = os.path.join(base, 'excel_magic')
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def _entry(self, path: str, options: dict) -> str:
+        key = json.dumps([os.path.abspath(path), options, WorkbookCache.VERSION], sort_keys=True)
+        return os.path.join(self.directory, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '.xmc')
+
+    @staticmethod
+    def _check_owner(stat: os.stat_result, name: str) -> None:
+        if hasattr(os, 'getuid') and (stat.st_uid != os.getuid() or stat.st_mode & 0o077 != 0):
+            raise ValueError(f'{name} must belong to the current user and only be accessible by them')
+
+    def _check_directory(self) -> None:
+        self._check_owner(os.stat(self.directory), f'cache directory {self.directory}')
+
+    def load(self, path: str, options: dict) -> Union[List[Sheet], None]:
+        """
+        sheets cached for the workbook, None if there are none or the workbook changed
+        """
+        if not os.path.isdir(self.directory):
+            return None
+        self._check_directory()
+        entry = self._entry(path, options)
+        try:
+            with open(entry, 'rb') as f:
+                self._check_owner(os.fstat(f.fileno()), f'cache entry {entry}')
+                if f.read(4) != WorkbookCache.MAGIC:
+                    raise ValueError('not a cache entry')
+                size = struct.unpack('<I', f.read(4))[0]
+                header = json.loads(f.read(size).decode())
+                stat = os.stat(path)
+                if header['size'] != stat.st_size:
+                    return None
+                touched = header['mtime'] != stat.st_mtime_ns
+                # touched but maybe not changed
+                if touched and header['hash'] != _file_hash(path):
+                    return None
+                sheets = pickle.load(f)
+                if touched:
+                    # the next load compares the new time instead of hashing the workbook again
+                    header['mtime'] = stat.st_mtime_ns
+                    f.seek(8 + size)
+                    self._write(entry, header, lambda target: shutil.copyfileobj(f, target, 1 << 20))
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # unreadable or written by another version
+            self._remove(entry)
+            return None
+        os.utime(entry)
+        return sheets
+
+    def _write(self, entry: str, header: dict, write_sheets: Callable[[Any], None]) -> None:
+        header = json.dumps(header).encode()
+        fd, temp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(WorkbookCache.MAGIC + struct.pack('<I', len(header)) + header)
+                write_sheets(f)
+            # readers see the old entry or the new one
+            os.replace(temp, entry)
+        except BaseException:
+            self._remove(temp)
+            raise
+
+    def store(self, path: str, options: dict, sheets: List[Sheet]) -> None:
+        """
+        cache the sheets of a workbook and evict old entries
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        self._check_directory()
+        stat = os.stat(path)
+        header = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                  'hash': _file_hash(path)}
+        self._write(self._entry(path, options), header, lambda f: pickle.dump(sheets, f, pickle.HIGHEST_PROTOCOL))
+        self.evict()
+
+    @staticmethod
+    def _remove(entry: str) -> None:
+        try:
+            os.remove(entry)
+        except OSError:
+            pass
+
+    def evict(self) -> None:
+        """
+        remove entries older than max_age, then the least recently used ones until the cache fits in max_size
+        """
+        if not os.path.isdir(self.directory):
+            return
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.xmc'):
+                continue
+            entry = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(entry)
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(entry)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            self._remove(entry)
+            total -= size
+
+    def clear(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.xmc'):
+                self._remove(os.path.join(self.directory, name))
+
+
+class LazySheet:
+    """
+    Placeholder of a sheet that is not loaded yet, the real sheet is created on first use
+    and can be unloaded again. Changes to a loaded sheet are lost when it is unloaded.
+    Once loaded, the dataset lists the real sheet instead of the placeholder until it is unloaded.
+    """
+    # attributes of the placeholder, the others are the ones of the sheet
+    _OWN = ('index', 'dataset', 'sheet')
+
+    def __init__(self, dataset: 'Dataset', name: str, index: int):
+        object.__setattr__(self, 'name', name)
+        self.index = index
+        self.dataset = dataset
+        self.sheet: Union[Sheet, None] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.sheet is not None
+
+    def load(self) -> Sheet:
+        if self.sheet is None:
+            self.sheet = self.dataset._load_sheet(self.name, self.index)
+            self.dataset._lazy_loaded(self)
+        return self.sheet
+
+    def unload(self) -> None:
+        if self.sheet is not None:
+            object.__setattr__(self, 'name', self.sheet.name)
+        self.sheet = None
+
+    def __getattr__(self, item):
+        # only called for attributes the placeholder does not have
+        if item.startswith('__') or item in ('sheet', 'dataset'):
+            raise AttributeError(item)
+        return getattr(self.load(), item)
+
+    def __setattr__(self, key, value):
+        if key in LazySheet._OWN:
+            object.__setattr__(self, key, value)
+            return
+        if key == 'name':
+            # the placeholder is found by the name of its sheet
+            object.__setattr__(self, key, value)
+        setattr(self.load(), key, value)
+
+    def __len__(self):
+        return self.load().__len__()
+
+    def __eq__(self, other):
+        return self.name == other.name
+
+
+# PRAGMAs to_sqlite accepts, their values are pasted into the statement
+SQLITE_PRAGMAS = {'journal_mode', 'synchronous', 'cache_size', 'temp_store', 'locking_mode', 'page_size',
+                  'mmap_size', 'foreign_keys', 'auto_vacuum', 'busy_timeout'}
+_SQLITE_PRAGMA_VALUE = re.compile(r'-?\d+|[A-Za-z_][A-Za-z0-9_]*')
+
+
 class Dataset:
 
-    def __init__(self, path: str, catch_formulas=False, suppress_warning=False):
+    def __init__(self, path: str, catch_formulas=False, suppress_warning=False, lazy=False, columnar=False,
+                 workers: int = 0, cache: Union[bool, str, WorkbookCache] = False, timer: Union[Timer, None] = None,
+                 memory_budget: Union[int, MemoryBudget, None] = None):
         if not os.path.exists(path):
             wb = xlsxwriter.Workbook(path)
             wb.close()
-        self.workbook = xlrd.open_workbook(path, on_demand=True)
         self.sheets = []
         self.filename = os.path.basename(path)
         self.backup_name = self.filename + '.bak'
         self.path = os.path.dirname(path)
         self.suppress_warning = suppress_warning
+        self.catch_formulas = catch_formulas
+        self.sheet_class = ColumnarSheet if columnar else Sheet
+        # opened while sheets wait to be loaded
+        self.workbook: Union[xlrd.Book, _XlsxBook, None] = None
+        # dataset whose sheets are copied on first use, see copy
+        self._source: Union[Dataset, None] = None
+        # records the phases of loading and saving, see timed
+        self.timer = timer
+        if isinstance(memory_budget, int):
+            memory_budget = MemoryBudget(memory_budget)
+        self.memory_budget: Union[MemoryBudget, None] = memory_budget
+
+        # placeholders of the sheets opened in lazy mode, loaded or not
+        self._lazy_sheets: List[LazySheet] = []
+
+        if lazy and cache is not False:
+            raise ValueError('lazy sheets can not be cached')
+        if lazy:
+            with self._phase('open'):
+                self.workbook = _open_book(path)
+            # sheets without cells are skipped, like when every sheet is loaded
+            for i, name in enumerate(self.workbook.sheet_names()):
+                if self._has_cells(i):
+                    self._lazy_sheets.append(LazySheet(self, name, i))
+            self.sheets.extend(self._lazy_sheets)
+            self._release_workbook()
+            return
+
+        if cache is not False:
+            if not isinstance(cache, WorkbookCache):
+                cache = WorkbookCache(cache if isinstance(cache, str) else '')
+            options = {'catch_formulas': catch_formulas, 'columnar': columnar}
+            with self._phase('cache load'):
+                sheets = cache.load(path, options)
+            if sheets is not None:
+                for loaded_sheet in sheets:
+                    loaded_sheet.suppress_warning = suppress_warning
+                    if not columnar:
+                        loaded_sheet = loaded_sheet.to_sheet()
+                    loaded_sheet._clean_state()
+                    self.sheets.append(loaded_sheet)
+                return
+            self._load(path, catch_formulas, workers)
+            # columns are much smaller and faster to read back than rows of cells
+            with self._phase('cache store'):
+                cache.store(path, options, [t if isinstance(t, ColumnarSheet) else ColumnarSheet.from_sheet(t)
+                                            for t in self.sheets])
+            return
+
+        self._load(path, catch_formulas, workers)
+
+    def _load(self, path: str, catch_formulas: bool, workers: int) -> None:
+        """
+        convert every sheet of the file
+        """
+        if workers > 1 and zipfile.is_zipfile(path):
+            self._load_parallel(path, workers)
+            return
+
+        with self._phase('open'):
+            self.workbook = _open_book(path)
+        if self.memory_budget is not None:
+            self.memory_budget.check(f'opening {self.filename}')
         sheet: xlrd.sheet.Sheet
-        for sheet in self.workbook.sheets():
+        for i in range(self.workbook.nsheets):
+            with self._phase('parse') as record:
+                sheet = self.workbook.sheet_by_index(i)
+                record.sheet = sheet.name
             try:
                 sheet.row(0)
             except IndexError:
                 continue
-            self.sheets.append(Sheet(self.suppress_warning, sheet))
+            loaded_sheet = self._convert(sheet)
             self.workbook.unload_sheet(sheet.name)
+            if catch_formulas:
+                self._catch_formulas(loaded_sheet, i)
+            loaded_sheet._clean_state()
+            self.sheets.append(loaded_sheet)
         self.workbook.release_resources()
+        self.workbook = None
+
+    def _phase(self, name: str, sheet: str = ''):
+        """
+        context manager timing a phase with the timer of the dataset, if it has one
+        """
+        if self.timer is None:
+            return _UNTIMED
+        return self.timer.phase(name, sheet)
+
+    def _convert(self, sheet: xlrd.sheet.Sheet) -> Sheet:
+        with self._phase('convert', sheet.name) as record:
+            loaded_sheet = self.sheet_class(self.suppress_warning, sheet, self.memory_budget)
+            record.rows = len(loaded_sheet)
+            record.cells = record.rows * len(loaded_sheet.fields)
+        return loaded_sheet
+
+    @contextlib.contextmanager
+    def timed(self, callback: Union[Callable[[Phase], None], None] = None, profile: bool = False) -> Iterator[Timer]:
+        """
+        record the phases of loading and saving inside a with statement
+        :param callback: called with every finished phase
+        :param profile: also run the phases under cProfile, see Timer.stats
+        """
+        previous = self.timer
+        self.timer = Timer(callback, profile)
+        try:
+            yield self.timer
+        finally:
+            self.timer = previous
+
+    def _load_parallel(self, path: str, workers: int) -> None:
+        """
+        parse and convert the sheets in a process pool. The workbook, styles and shared strings are read once
+        here and sent to the workers, each worker parses its sheets with xlrd and converts them like _load
+        """
+        with self._phase('open'):
+            book = _XlsxBook(path)
+        if self.memory_budget is not None:
+            self.memory_budget.check(f'opening {self.filename}')
+        try:
+            with concurrent.futures.ProcessPoolExecutor(min(workers, max(book.nsheets, 1)),
+                                                        initializer=_init_load_worker,
+                                                        initargs=(path, book.parsed)) as pool:
+                columnar = self.sheet_class is ColumnarSheet
+                futures = [pool.submit(_load_sheet_payload, i, columnar, self.catch_formulas, self.suppress_warning)
+                           for i in range(book.nsheets)]
+                for future in futures:
+                    # parsing and converting happen in the workers, only the wait is seen here
+                    with self._phase('parallel load') as record:
+                        loaded_sheet = future.result()
+                        if loaded_sheet is not None:
+                            record.sheet = loaded_sheet.name
+                            record.rows = len(loaded_sheet)
+                    if loaded_sheet is None:
+                        continue
+                    if not columnar and isinstance(loaded_sheet, ColumnarSheet):
+                        loaded_sheet = loaded_sheet.to_sheet()
+                    loaded_sheet._clean_state()
+                    self.sheets.append(loaded_sheet)
+        finally:
+            book.release_resources()
+
+    def _has_cells(self, index: int) -> bool:
+        """
+        whether a sheet of the workbook has cells, without converting it
+        """
+        if isinstance(self.workbook, _XlsxBook):
+            return self.workbook.has_cells(index)
+        # xls sheets are parsed on demand and unloaded again
+        empty = self.workbook.sheet_by_index(index).nrows == 0
+        self.workbook.unload_sheet(index)
+        return not empty
+
+    def _lazy_loaded(self, placeholder: LazySheet) -> None:
+        """
+        list the sheet a placeholder loaded instead of the placeholder
+        """
+        for i, t in enumerate(self.sheets):
+            if t is placeholder:
+                self.sheets[i] = placeholder.sheet
+        self._release_workbook()
+
+    def _release_workbook(self) -> None:
+        """
+        close the workbook once no lazy sheet is waiting to be loaded, it is opened again if a sheet is unloaded
+        """
+        if self.workbook is not None \
+                and all(t.loaded for t in self.sheets if isinstance(t, LazySheet)):
+            self.workbook.release_resources()
+            self.workbook = None
 
-        # Catch Formula
-        if catch_formulas and len(self.sheets) != 0:
-            sheets_xml = []
-            with open(path, 'rb') as f:
-                zip = zipfile.ZipFile(f, compression=zipfile.ZIP_DEFLATED)
-                for i in range(self.workbook.nsheets):
-                    xml_content = zip.read(f'xl/worksheets/sheet{i + 1}.xml')
-                    sheets_xml.append(xml_content)
-
-            # MAGIC! DO NOT TOUCH
-            cell_pattern = re.compile(r'<c [A-z\": =0-9]*>[<>A-z0-9/.+\-*\u4e00-\u9fa5!:@#$%^&\[\]{}?\';\"(),]*</c>')
-            cell_notation_pattern = re.compile(r'r=\"([A-Z0-9]*)\"')
-            function_pattern = re.compile(r'(?<=<f>)([\s\S]*)(?=</f>)')
-            sheet_counter = 0
-            for xml in sheets_xml:
-                loaded_sheet = self.sheets[sheet_counter]
-                xml = xml.decode()
-
-                cells = cell_pattern.findall(xml)
-                formula_cells = []
-                for c in cells:
-                    if '<f>' in c:
-                        formula_cells.append(c)
-                cells.clear()
-
-                for c in formula_cells:
-                    pos = self._resolve_cell_notation(cell_notation_pattern.search(c).group(1))
-                    formula = function_pattern.search(c).group(1)
-
-                    row = loaded_sheet.data_rows[pos[0] - 1]
-                    cell_value = row[loaded_sheet.fields[pos[1]]].value
-                    row[loaded_sheet.fields[pos[1]]] = FormulaCell(formula=formula, value=cell_value)
-
-                sheet_counter += 1
+    def _load_sheet(self, name: str, index: int) -> Sheet:
+        """
+        convert a single sheet of the file, used by LazySheet
+        """
+        if self._source is not None:
+            source = self._source.get_sheet_by_index(index)
+            loaded_sheet = source.copy()
+            loaded_sheet.suppress_warning = self.suppress_warning
+            if not source.is_dirty():
+                loaded_sheet._clean_state()
+            return loaded_sheet
+        if self.workbook is None:
+            with self._phase('open'):
+                self.workbook = _open_book(os.path.join(self.path, self.filename))
+        with self._phase('parse', name):
+            sheet: xlrd.sheet.Sheet = self.workbook.sheet_by_index(index)
+        try:
+            sheet.row(0)
+        except IndexError:
+            loaded_sheet = self.sheet_class(self.suppress_warning, name)
+            loaded_sheet._clean_state()
+            return loaded_sheet
+        loaded_sheet = self._convert(sheet)
+        if self.workbook.on_demand:
+            self.workbook.unload_sheet(index)
+        if self.catch_formulas:
+            self._catch_formulas(loaded_sheet, index)
+        loaded_sheet._clean_state()
+        return loaded_sheet
+
+    def _catch_formulas(self, loaded_sheet: Sheet, index: int) -> None:
+        """
+        replace cells having a formula with FormulaCell
+        :param loaded_sheet: converted sheet
+        :param index: index of the sheet in the file
+        """
+        with self._phase('formulas', loaded_sheet.name):
+            _capture_formulas(os.path.join(self.path, self.filename), index, loaded_sheet)
 
     def _resolve_cell_notation(self, s: str) -> Tuple[int, int]:
         """
@@ -602,33 +4310,39 @@ class Dataset:
         :param s: Cell Notation
         :return: (row, col)
         """
-        letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-        col: str = ''
-        row: Union[str, int]
-        i = 0
-        for i in range(len(s)):
-            if s[i].isalpha():
-                col += s[i]
-        row = s[i:]
-        row = int(row)
-        real_col = 0
-        # resolve col
-        for i in range(len(col)):
-            real_col += 26 ** (len(col) - 1 - i) * (letters.index(col[i]) + 1)
-
-        return row - 1, real_col - 1
+        return _cell_position(s)
 
     def get_sheet_by_index(self, index: int) -> Sheet:
-        return self.sheets[index]
+        t = self.sheets[index]
+        if isinstance(t, LazySheet):
+            return t.load()
+        return t
 
     def get_sheet_by_name(self, name: str) -> Union[Sheet, None]:
         t: Sheet
         for t in self.sheets:
             if t.name.lower() == name.lower():
+                if isinstance(t, LazySheet):
+                    return t.load()
                 return t
         else:
             return None
 
+    def unload_sheet(self, name: str) -> None:
+        """
+        release a sheet opened in lazy mode, it will be loaded again from the file on next access
+        """
+        for t in self._lazy_sheets:
+            if (t.sheet.name if t.loaded else t.name).lower() == name.lower():
+                if t.loaded:
+                    self.sheets = [t if s is t.sheet else s for s in self.sheets]
+                t.unload()
+                return
+        for t in self.sheets:
+            if t.name.lower() == name.lower():
+                raise ValueError(f'sheet {name} was not opened in lazy mode')
+        raise NameError(f'{name} does not exist')
+
     def does_exist(self, name: str) -> bool:
         for t in self.sheets:
             if t.name == name:
@@ -661,74 +4375,245 @@ class Dataset:
     def add_sheet(self, name: str, fields: List[str]) -> Sheet:
         if self.does_exist(name):
             raise Exception('Sheet already exists')
-        table = Sheet(self.suppress_warning, name)
+        table = self.sheet_class(self.suppress_warning, name)
         table.fields = fields
         self.sheets.append(table)
         return table
 
-    def create_sheet_by_json(self, name: str, data: Union[str, list, dict]) -> Sheet:
+    def create_sheet_by_json(self, name: str, data: Union[str, Iterable[dict], dict], lines: bool = False,
+                             object_hook: Union[Callable[[dict], Any], None] = None) -> Sheet:
+        """
+        create a sheet whose fields are the keys of the first row
+        :param name: name of the sheet
+        :param data: path of a json or ndjson file, rows, or a dict of fields
+        :param lines: the file has one json object per line
+        :param object_hook: called on every decoded object of a file
+        """
         if isinstance(data, str):
-            with open(data, 'r') as f:
-                data: Union[list, dict] = json.load(f)
+            data = _iter_json_rows(data, lines, object_hook)
 
-        if isinstance(data, list):
-            header = data[0].keys()
-        elif isinstance(data, dict):
-            header = data.keys()
-        else:
+        if isinstance(data, dict):
+            return self.add_sheet(name, [*data.keys()])
+        if not isinstance(data, Iterable):
+            raise ValueError('corrupted file')
+        rows = iter(data)
+        first = next(rows, None)
+        if first is None:
             raise ValueError('corrupted file')
-        sheet = self.add_sheet(name, header)
-        if isinstance(data, list):
-            for d in data:
-                sheet.append_row(d)
+        sheet = self.add_sheet(name, [*first.keys()])
+        sheet.append_row(first)
+        for d in rows:
+            sheet.append_row(d)
         return sheet
 
-    def import_json(self, path: str) -> None:
-        with open(path, 'r') as f:
-            data = json.load(f)
-        if not isinstance(data, dict):
-            raise ValueError('invalid format')
+    def import_csv(self, path: str, name: str = '', **kwargs) -> Sheet:
+        """
+        create a sheet from a csv file, see Sheet.read_csv
+        :param path: path of the file
+        :param name: name of the sheet, file name without extension by default
+        """
+        if name == '':
+            name = os.path.splitext(os.path.basename(path))[0]
+        sheet = self.add_sheet(name, [])
+        sheet.read_csv(path, **kwargs)
+        return sheet
+
+    def import_json(self, path: str, lines: bool = False,
+                    object_hook: Union[Callable[[dict], Any], None] = None) -> None:
+        """
+        create sheets from a file written by export_json, rows are read one at a time
+        :param path: path of the file
+        :param lines: the file has one {"sheet": name, "row": row} object per line
+        :param object_hook: called on every decoded object of the sheets, like with Sheet.import_json
+        """
+        if lines:
+            sheet = None
+            for item in _iter_json_rows(path, True):
+                if not isinstance(item, dict) or 'sheet' not in item or 'row' not in item:
+                    raise ValueError('invalid format')
+                row = item['row'] if object_hook is None else _apply_object_hook(item['row'], object_hook)
+                if sheet is None or sheet.name != item['sheet']:
+                    if self.does_exist(item['sheet']):
+                        sheet = self.get_sheet_by_name(item['sheet'])
+                    else:
+                        sheet = self.add_sheet(item['sheet'], [*row.keys()])
+                sheet.append_row(row)
+            return
 
-        for key in data:
-            self.create_sheet_by_json(key, data[key])
+        with open(path, 'r') as f:
+            stream = _JsonStream(f, object_hook)
+            stream.expect('{')
+            if stream.peek() == '}':
+                return
+            while True:
+                key = stream.value()
+                stream.expect(':')
+                # a dict of fields makes a sheet without rows
+                self.create_sheet_by_json(key, stream.array() if stream.peek() == '[' else stream.value())
+                if stream.expect(',}') == '}':
+                    break
 
-    def export_json(self, out: str):
-        json_sheets = {}
-        for sheet in self.sheets:
-            data = []
-            for r in sheet.data_rows:
-                v = {}
-                for k in r:
-                    v[k] = r[k].value
-                data.append(v)
-            json_sheets[sheet.name] = data
+    def export_json(self, out: str, lines: bool = False, default: Union[Callable[[Any], Any], None] = None):
+        """
+        write every sheet to one json file without building the whole document
+        :param out: path of the file
+        :param lines: write one {"sheet": name, "row": row} object per line instead of {name: [rows]}
+        :param default: converts values json can not serialize, dates and times are written in ISO format by default
+        """
+        if default is None:
+            default = _json_default
         with open(out, 'w') as f:
-            json.dump(json_sheets, f)
-
-    def to_sqlite(self, out: str):
-        conn = sqlite3.connect(out)
+            if lines:
+                for sheet in self.sheets:
+                    name = json.dumps(sheet.name)
+                    fields = sheet.fields
+                    for r in sheet.data_rows:
+                        row = json.dumps(dict(zip(fields, _row_values(r, fields))), default=default)
+                        f.write(f'{{"sheet": {name}, "row": {row}}}\n')
+                return
+            f.write('{')
+            for i, sheet in enumerate(self.sheets):
+                if i != 0:
+                    f.write(', ')
+                f.write(json.dumps(sheet.name) + ': ')
+                _write_json_rows(f, sheet.data_rows, sheet.fields, False, default)
+            f.write('}')
+
+    def to_sqlite(self, out: str, indexes: Union[Dict[str, List[Union[str, List[str]]]], None] = None,
+                  chunk_size: int = 10000, pragmas: Union[Dict[str, str], None] = None):
+        """
+        export every sheet to a table, rows are inserted in batches within one transaction per sheet
+        :param out: path of the database
+        :param indexes: {sheet name: [field, or list of fields for a composite index]}
+        :param chunk_size: number of rows inserted per executemany
+        :param pragmas: PRAGMAs set before exporting, defaults to bulk load settings. Names are taken from
+                        SQLITE_PRAGMAS and values are integers or keywords
+        """
+        if pragmas is None:
+            pragmas = {'journal_mode': 'MEMORY', 'synchronous': 'OFF'}
+        for key, value in pragmas.items():
+            if key not in SQLITE_PRAGMAS:
+                raise ValueError(f'unsupported PRAGMA {key}')
+            if not isinstance(value, (int, str)) or _SQLITE_PRAGMA_VALUE.fullmatch(str(value)) is None:
+                raise ValueError(f'invalid value {value!r} of PRAGMA {key}')
+        if indexes is None:
+            indexes = {}
+        conn = sqlite3.connect(out, isolation_level=None)
         cur = conn.cursor()
-        for sheet in self.sheets:
-            current_table = sheet.name
-            cmd = f"CREATE TABLE '{current_table}' ({','.join(sheet.fields)})"
-            cur.execute(cmd)
-            conn.commit()
+        for key in pragmas:
+            cur.execute(f'PRAGMA {key} = {pragmas[key]}')
+        try:
+            for sheet in self.sheets:
+                self._sheet_to_sqlite(cur, sheet, indexes.get(sheet.name, []), chunk_size)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _sqlite_value(value: Any) -> Any:
+        if value == '':
+            return None
+        if isinstance(value, (datetime.date, datetime.time)):
+            return value.isoformat()
+        return value
+
+    @staticmethod
+    def _sqlite_affinity(values: Iterable) -> str:
+        """
+        column affinity fitting all non empty values
+        """
+        affinity = ''
+        for value in values:
+            if value == '' or value is None:
+                continue
+            if isinstance(value, (bool, int)):
+                current = 'INTEGER'
+            elif isinstance(value, float):
+                current = 'REAL'
+            elif isinstance(value, bytes):
+                current = 'BLOB'
+            else:
+                return 'TEXT'
+            if affinity == '' or affinity == current:
+                affinity = current
+            elif {affinity, current} == {'INTEGER', 'REAL'}:
+                affinity = 'REAL'
+            else:
+                return 'TEXT'
+        return affinity if affinity != '' else 'TEXT'
+
+    def _sheet_to_sqlite(self, cur: sqlite3.Cursor, sheet: Sheet, indexes: List[Union[str, List[str]]],
+                         chunk_size: int):
+        table = _quote_identifier(sheet.name)
+        columns = []
+        for field in sheet.fields:
+            affinity = self._sqlite_affinity(sheet.get_col_values(field))
+            columns.append(f'{_quote_identifier(field)} {affinity}')
+        placeholders = ','.join(['?'] * len(sheet.fields))
+        insert = f'INSERT INTO {table} VALUES ({placeholders})'
+
+        cur.execute('BEGIN')
+        try:
+            cur.execute(f'CREATE TABLE {table} ({",".join(columns)})')
+            batch = []
             for row in sheet.data_rows:
-                values = ''
-                for cell in row.values():
-                    if isinstance(cell.value, float):
-                        values += str(cell.value)
-                    else:
-                        values += '"' + cell.value + '"'
-                    values += ','
-                values = values[: -1]
-                cmd = f"INSERT INTO {current_table} VALUES ({values})"
-                cur.execute(cmd)
-        conn.commit()
-        conn.close()
+                batch.append(tuple(self._sqlite_value(row[f].value) for f in sheet.fields))
+                if len(batch) >= chunk_size:
+                    cur.executemany(insert, batch)
+                    batch = []
+            if len(batch) != 0:
+                cur.executemany(insert, batch)
+            for fields in indexes:
+                if isinstance(fields, str):
+                    fields = [fields]
+                name = _quote_identifier(f'idx_{sheet.name}_{"_".join(fields)}')
+                cur.execute(f'CREATE INDEX {name} ON {table} ({",".join(_quote_identifier(f) for f in fields)})')
+            cur.execute('COMMIT')
+        except BaseException:
+            cur.execute('ROLLBACK')
+            raise
+
+    def from_sqlite(self, path: str, tables: Union[List[str], None] = None,
+                    queries: Union[Dict[str, str], None] = None, chunk_size: int = 10000) -> List[Sheet]:
+        """
+        import tables or query results as new sheets, rows are fetched in chunks
+        :param path: path of the database
+        :param tables: tables to import, all tables if neither tables nor queries are given
+        :param queries: {sheet name: SELECT statement}
+        :param chunk_size: number of rows fetched at once
+        :return: created sheets
+        """
+        conn = sqlite3.connect(path)
+        cur = conn.cursor()
+        try:
+            if queries is None:
+                queries = {}
+            else:
+                queries = {**queries}
+            if tables is None and len(queries) == 0:
+                cur.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'")
+                tables = [r[0] for r in cur.fetchall()]
+            for table in tables or []:
+                queries[table] = f'SELECT * FROM {_quote_identifier(table)}'
+
+            result = []
+            for name in queries:
+                cur.execute(queries[name])
+                sheet = self.add_sheet(name, [d[0] for d in cur.description])
+                while True:
+                    rows = cur.fetchmany(chunk_size)
+                    if len(rows) == 0:
+                        break
+                    for r in rows:
+                        sheet.append_row(['' if v is None else v for v in r])
+                result.append(sheet)
+            return result
+        finally:
+            conn.close()
 
     def merge_file(self, path: str, force: bool = False) -> None:
         workbook = xlrd.open_workbook(path)
+        if self.memory_budget is not None:
+            self.memory_budget.check(f'opening {path}')
         sheet: xlrd.sheet.Sheet
         for sheet in workbook.sheets():
             tbl = self.get_sheet_by_name(sheet.name)
@@ -743,7 +4628,7 @@ class Dataset:
                     tbl.fields.extend(headers_to_merge)
                 self._merge_table(sheet, tbl)
             else:
-                tbl = Sheet(self.suppress_warning, sheet.name)
+                tbl = self.sheet_class(self.suppress_warning, sheet.name)
                 try:
                     headers = sheet.row(0)
                 except IndexError:
@@ -755,24 +4640,32 @@ class Dataset:
 
     def _merge_table(self, sheet, tbl):
         flg_first_row = True
-        for row in sheet.get_rows():
+        budget = self.memory_budget
+        for number, row in enumerate(sheet.get_rows()):
             # Skip header
             if flg_first_row:
                 flg_first_row = False
                 continue
+            if budget is not None and number % budget.every == 0:
+                budget.check(f'merging sheet {sheet.name}')
 
             new_row = []
             for cell in row:
                 new_row.append(cell.value)
             tbl.append_row(new_row)
 
-    def split_sheets_to_file(self):
+    def split_sheets_to_file(self, path: str = '', workers: int = 0) -> List[str]:
+        """
+        write every sheet to its own file named after the sheet
+        :param path: directory of the files
+        :param workers: number of processes writing files at the same time, 0 to write them one by one
+        :return: paths of the files
+        """
+        jobs = []
         for s in self.sheets:
-            doc = open_file(s.name + '.xlsx')
-            doc.add_sheet(s.name, s.fields)
-            for row in s.data_rows:
-                doc.append_row(s.name, row)
-            doc.save(backup=False)
+            jobs.append((os.path.join(path, s.name + '.xlsx'),
+                         [(s.name, [*s.fields], _sheet_cells(s, s.data_rows, workers > 1), s.header_style)]))
+        return _write_files(jobs, workers)
 
     def remove_sheet(self, sheet: Sheet) -> None:
         self.sheets.remove(sheet)
@@ -780,68 +4673,138 @@ class Dataset:
     def remove_sheet_by_index(self, index: int):
         pass
 
-    def save(self, *, backup=True, row_height=0, col_width=0):
-        # make backup & delete
-        if os.path.exists(os.path.join(self.path, self.filename)) and backup:
-            shutil.copy(os.path.join(self.path, self.filename), os.path.join(self.path, self.backup_name))
-            os.remove(os.path.join(self.path, self.filename))
+    def copy(self) -> 'Dataset':
+        """
+        independent copy of the dataset, its sheets are copied when they are first used
+        """
+        result = copy(self)
+        result._source = self
+        result.workbook = None
+        result._lazy_sheets = [LazySheet(result, t.name, i) for i, t in enumerate(self.sheets)]
+        result.sheets = [*result._lazy_sheets]
+        return result
 
-        # open new file
-        filename = os.path.join(self.path, self.filename)
-        workbook = xlsxwriter.Workbook(filename, {'default_date_format':
-                                                      'yyyy/mm/dd'})
-        for table in self.sheets:
-            sheet: xlsxwriter.workbook.Worksheet = workbook.add_worksheet(table.name)
-            pointer = Pointer(0, 0)
-            for field in table.fields:
-                sheet.write(pointer.row, pointer.col, field, workbook.add_format(table.header_style.attr()))
-                pointer.next_col()
-            pointer.next_row()
-            for data_row in table.data_rows:
-                for col in table.fields:
-                    data = data_row[col]
-                    if isinstance(data.value, datetime.date) \
-                            or isinstance(data.value, datetime.time) \
-                            or isinstance(data.value, datetime.datetime):
-
-                        if isinstance(data.value, datetime.date):
-                            sheet.write(pointer.row, pointer.col, str(data.value.isoformat()),
-                                        workbook.add_format(data.attr()))
-                        elif isinstance(data.value, datetime.time):
-                            sheet.write(pointer.row, pointer.col, str(data.value.isoformat()),
-                                        workbook.add_format(data.attr()))
-                        else:
-                            sheet.write(pointer.row, pointer.col, str(data.value), workbook.add_format(data.attr()))
+    def memory_report(self, sample: int = 1000) -> dict:
+        """
+        estimated memory used by the loaded sheets, see Sheet.memory_report
+        :return: {'total': bytes, 'sheets': {sheet name: report of the sheet}}
+        """
+        sheets = {t.name: t.memory_report(sample) for t in self._loaded_sheets()}
+        return {'total': sum(report['total'] for report in sheets.values()), 'sheets': sheets}
 
-                    else:
+    def _loaded_sheets(self) -> List[Sheet]:
+        return [t.sheet if isinstance(t, LazySheet) else t for t in self.sheets
+                if not isinstance(t, LazySheet) or t.loaded]
+
+    def _save_incremental(self, filename: str, backup: bool) -> bool:
+        """
+        rewrite only the worksheets which changed, the other parts of the file are copied as they are
+        :return: False if the file has to be written from scratch
+        """
+        if not zipfile.is_zipfile(filename):
+            return False
+        with zipfile.ZipFile(filename) as source:
+            parts = _worksheet_parts(source)
+            if [name for name, _ in parts] != [t.name for t in self.sheets]:
+                # sheets were added, removed, renamed or moved
+                return False
+            dirty: Dict[str, Sheet] = {}
+            for table, (_, part) in zip(self.sheets, parts):
+                if isinstance(table, LazySheet):
+                    if not table.loaded:
+                        continue
+                    table = table.sheet
+                if table.is_dirty():
+                    dirty[part] = table
+            if len(dirty) == 0:
+                if backup:
+                    shutil.copy(filename, os.path.join(self.path, self.backup_name))
+                return True
+            styles_part = _workbook_part(source, 'styles')
+            calc_chain = _workbook_part(source, 'calcChain')
+            if styles_part is None:
+                return False
 
-                        if isinstance(data, ImageCell):
-                            if isinstance(data.data, str):
-                                sheet.insert_image(pointer.row, pointer.col, data.data,
-                                                   {'y_offset': 10, 'x_offset': 10})
-                            else:
-                                data.data.seek(0)
-                                sheet.insert_image(pointer.row, pointer.col, data.value,
-                                                   {'image_data': data.data, 'y_offset': 10, 'x_offset': 10})
-                            img: Image.Image = Image.open(data.data)
-                            width, height = img.size
-                            if row_height == 0:
-                                sheet.set_row(pointer.row, height)
-                            else:
-                                sheet.set_row(pointer.row, row_height)
-                            if col_width != 0:
-                                sheet.set_column(pointer.col, pointer.col, (col_width / 8))
-                            else:
-                                sheet.set_column(pointer.col, pointer.col, (width / 8))
-                            sheet.write(pointer.row, pointer.col, '', workbook.add_format(data.attr()))
-                        elif isinstance(data, FormulaCell):
-                            sheet.write_formula(pointer.row, pointer.col, data.formula,
-                                                workbook.add_format(data.attr()))
+            fd, temp = tempfile.mkstemp(suffix='.xlsx', dir=self.path if self.path != '' else None)
+            os.close(fd)
+            try:
+                styles = _StyleTable(source.read(styles_part).decode('utf-8'))
+                # drawings, comments and images of the rewritten sheets go with their relationships
+                removed = _orphaned_parts(_part_relationships(source), dirty)
+                # the calculation chain lists formula cells of the rewritten sheets, excel rebuilds it
+                if calc_chain is not None:
+                    removed.add(calc_chain)
+                skipped = {*dirty, *(_part_rels(part) for part in [*dirty, *removed]), *removed, styles_part}
+                with zipfile.ZipFile(temp, 'w', zipfile.ZIP_DEFLATED) as target:
+                    for info in source.infolist():
+                        if info.filename in skipped:
+                            continue
+                        if len(removed) != 0 and info.filename == '[Content_Types].xml':
+                            xml = source.read(info.filename).decode('utf-8')
+                            for part in removed:
+                                xml = re.sub(rf'<Override\b[^>]*PartName="/{re.escape(part)}"[^>]*/>', '', xml)
+                            target.writestr(info.filename, xml)
+                        elif calc_chain is not None and info.filename == 'xl/_rels/workbook.xml.rels':
+                            xml = source.read(info.filename).decode('utf-8')
+                            target.writestr(info.filename, re.sub(
+                                r'<Relationship\b[^>]*Type="[^"]*/calcChain"[^>]*/>', '', xml))
                         else:
-                            sheet.write(pointer.row, pointer.col, data.value, workbook.add_format(data.attr()))
-                    pointer.next_col()
-                pointer.next_row()
-        workbook.close()
+                            _copy_zip_member(source, target, info)
+                    for part, table in dirty.items():
+                        with self._phase('write', table.name) as record, \
+                                TextIOWrapper(target.open(part, 'w', force_zip64=True), 'utf-8') as f:
+                            _write_worksheet_xml(f, table.fields, _sheet_cells(table, table.data_rows),
+                                                 table.header_style, styles)
+                            record.rows = len(table)
+                            record.cells = record.rows * len(table.fields)
+                    target.writestr(styles_part, styles.render())
+            except _Unsupported:
+                os.remove(temp)
+                return False
+            except BaseException:
+                os.remove(temp)
+                raise
+
+        if backup:
+            os.replace(filename, os.path.join(self.path, self.backup_name))
+        os.replace(temp, filename)
+        for table in dirty.values():
+            table.mark_clean()
+        return True
+
+    def save(self, *, backup=True, row_height=0, col_width=0, constant_memory=False, incremental=False,
+             image_workers: int = 0):
+        """
+        write all sheets to the file
+        :param backup: keep a copy of the old file as .bak
+        :param row_height: height of rows containing images, 0 to fit the image
+        :param col_width: width of cols containing images, 0 to fit the image
+        :param constant_memory: flush every row to disk once it is written instead of keeping the whole sheet in memory
+        :param incremental: only rewrite the sheets which changed when the sheets of the file are unchanged
+        :param image_workers: threads probing the distinct images before writing, for many different images
+        """
+        filename = os.path.join(self.path, self.filename)
+        if incremental:
+            with self._phase('incremental save'):
+                saved = self._save_incremental(filename, backup)
+            if saved:
+                return
+
+        # make backup & delete
+        if os.path.exists(filename) and backup:
+            shutil.copy(filename, os.path.join(self.path, self.backup_name))
+            os.remove(filename)
+
+        # open new file
+        with self._phase('save'):
+            images = [c.data for table in self._loaded_sheets() for c in _image_cells(table)] \
+                if image_workers > 1 else []
+            _write_file(filename,
+                        [(table.name, table.fields, _sheet_cells(table, table.data_rows), table.header_style)
+                         for table in self.sheets],
+                        constant_memory, row_height, col_width, self.timer, images, image_workers)
+        for table in self._loaded_sheets():
+            table.mark_clean()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.save()
@@ -850,5 +4813,295 @@ class Dataset:
         return self
 
 
-def open_file(path: str, catch_formulas=False, suppress_warning=False) -> Dataset:
-    return Dataset(path, catch_formulas=catch_formulas, suppress_warning=suppress_warning)
+def open_file(path: str, catch_formulas=False, suppress_warning=False, lazy=False, columnar=False,
+              workers: int = 0, cache: Union[bool, str, WorkbookCache] = False,
+              timer: Union[Timer, None] = None, memory_budget: Union[int, MemoryBudget, None] = None) -> Dataset:
+    return Dataset(path, catch_formulas=catch_formulas, suppress_warning=suppress_warning, lazy=lazy,
+                   columnar=columnar, workers=workers, cache=cache, timer=timer, memory_budget=memory_budget)
+
+
+class DatasetCache:
+    """
+    Opened datasets kept in memory and shared by the threads of a process. Every open returns a copy
+    whose sheets are copied on first use, columns of columnar sheets only when they are changed.
+    A dataset is loaded again when its file changes, and the least recently used ones are dropped
+    once their estimated size is above max_memory bytes.
+    """
+
+    def __init__(self, max_memory: int = 512 << 20):
+        self.max_memory = max_memory
+        # key: (dataset, (size, mtime) of the file, estimated size), least recently used first
+        self.entries: 'collections.OrderedDict[tuple, Tuple[Dataset, tuple, int]]' = collections.OrderedDict()
+        self.lock = threading.Lock()
+        # key: [lock of the file being loaded, threads waiting for it], removed once they are done
+        self.loading: Dict[tuple, list] = {}
+
+    @property
+    def memory(self) -> int:
+        with self.lock:
+            return sum(size for _, _, size in self.entries.values())
+
+    def _get(self, key: tuple, stamp: tuple) -> Union[Dataset, None]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] != stamp:
+                # the file changed
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def open(self, path: str, catch_formulas=False, suppress_warning=False, columnar=False) -> Dataset:
+        key = (os.path.abspath(path), catch_formulas, columnar)
+        stat = os.stat(path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        dataset = self._get(key, stamp)
+        if dataset is None:
+            with self.lock:
+                loading = self.loading.setdefault(key, [threading.Lock(), 0])
+                loading[1] += 1
+            try:
+                # one thread loads a file, the others wait for it
+                with loading[0]:
+                    dataset = self._get(key, stamp)
+                    if dataset is None:
+                        dataset = Dataset(path, catch_formulas=catch_formulas, suppress_warning=True,
+                                          columnar=columnar)
+                        self._put(key, dataset, stamp)
+            finally:
+                with self.lock:
+                    loading[1] -= 1
+                    if loading[1] == 0:
+                        del self.loading[key]
+        result = dataset.copy()
+        result.suppress_warning = suppress_warning
+        return result
+
+    def _put(self, key: tuple, dataset: Dataset, stamp: tuple) -> None:
+        size = dataset.memory_report(sample=100)['total']
+        with self.lock:
+            self.entries[key] = (dataset, stamp, size)
+            total = sum(s for _, _, s in self.entries.values())
+            while total > self.max_memory and len(self.entries) != 0:
+                _, (_, _, s) = self.entries.popitem(last=False)
+                total -= s
+
+    def invalidate(self, path: str) -> None:
+        path = os.path.abspath(path)
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == path]:
+                del self.entries[key]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+
+_shared_datasets: Union[DatasetCache, None] = None
+
+
+def open_shared(path: str, catch_formulas=False, suppress_warning=False, columnar=False) -> Dataset:
+    """
+    open a file through the DatasetCache of the process, the returned dataset can be changed freely
+    """
+    global _shared_datasets
+    if _shared_datasets is None:
+        _shared_datasets = DatasetCache()
+    return _shared_datasets.open(path, catch_formulas=catch_formulas, suppress_warning=suppress_warning,
+                                 columnar=columnar)
+
+
+# excel builtin number formats showing dates or times
+BUILTIN_DATE_FORMATS = {14, 15, 16, 17, 18, 19, 20, 21, 22, 45, 46, 47}
+
+
+def _column_index(ref: str) -> int:
+    col = 0
+    for c in ref:
+        if not c.isalpha():
+            break
+        col = col * 26 + ord(c.upper()) - 64
+    return col - 1
+
+
+def _is_date_format(code: str) -> bool:
+    # ignore quoted text, escaped characters, colors and locales
+    code = re.sub(r'"[^"]*"|\\.|\[[^\]]*\]', '', code).lower()
+    for c in 'ymdhs':
+        if c in code:
+            return True
+    return False
+
+
+def _string_item_text(si: ElementTree.Element) -> str:
+    """
+    text of a shared or inline string, rich text runs are concatenated and phonetic hints ignored
+    """
+    text = ''
+    for child in si:
+        if child.tag == f'{{{SPREADSHEET_NS}}}t':
+            text += child.text or ''
+        elif child.tag == f'{{{SPREADSHEET_NS}}}r':
+            t = child.find(f'{{{SPREADSHEET_NS}}}t')
+            if t is not None:
+                text += t.text or ''
+    return text
+
+
+def _read_shared_strings(zip: zipfile.ZipFile) -> List[str]:
+    result = []
+    # parts are found through the workbook relationships, their names vary between producers
+    part = _workbook_part(zip, 'sharedStrings')
+    if part is None or part not in zip.namelist():
+        return result
+    with zip.open(part) as f:
+        for event, elem in ElementTree.iterparse(f):
+            if elem.tag == f'{{{SPREADSHEET_NS}}}si':
+                result.append(_string_item_text(elem))
+                elem.clear()
+    return result
+
+
+def _read_date_styles(zip: zipfile.ZipFile) -> List[bool]:
+    """
+    whether each cell style of the workbook shows a date
+    """
+    result = []
+    part = _workbook_part(zip, 'styles')
+    if part is None or part not in zip.namelist():
+        return result
+    root = ElementTree.fromstring(zip.read(part))
+    formats = {}
+    for fmt in root.iter(f'{{{SPREADSHEET_NS}}}numFmt'):
+        formats[int(fmt.get('numFmtId'))] = fmt.get('formatCode', '')
+    cell_xfs = root.find(f'{{{SPREADSHEET_NS}}}cellXfs')
+    if cell_xfs is None:
+        return result
+    for xf in cell_xfs:
+        fmt_id = int(xf.get('numFmtId', 0))
+        result.append(fmt_id in BUILTIN_DATE_FORMATS or (fmt_id in formats and _is_date_format(formats[fmt_id])))
+    return result
+
+
+def _read_datemode(zip: zipfile.ZipFile) -> int:
+    root = ElementTree.fromstring(zip.read('xl/workbook.xml'))
+    pr = root.find(f'{{{SPREADSHEET_NS}}}workbookPr')
+    if pr is not None and pr.get('date1904', '').lower() in ('1', 'true'):
+        return 1
+    return 0
+
+
+def _iter_sheet_values(f, strings: List[str], date_styles: List[bool], datemode: int) -> Iterator[List[Any]]:
+    """
+    parse a worksheet xml one row at a time, missing rows are yielded as empty lists
+    """
+    row_tag = f'{{{SPREADSHEET_NS}}}row'
+    cell_tag = f'{{{SPREADSHEET_NS}}}c'
+    value_tag = f'{{{SPREADSHEET_NS}}}v'
+    inline_tag = f'{{{SPREADSHEET_NS}}}is'
+    sheet_data_tag = f'{{{SPREADSHEET_NS}}}sheetData'
+    sheet_data = None
+    expected_row = 0
+    row_number = 0
+    values = []
+    col = -1
+    for event, elem in ElementTree.iterparse(f, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == row_tag:
+                r = elem.get('r')
+                row_number = int(r) - 1 if r is not None else expected_row
+                while expected_row < row_number:
+                    yield []
+                    expected_row += 1
+                values = []
+                col = -1
+            elif tag == sheet_data_tag:
+                sheet_data = elem
+            continue
+
+        if tag == cell_tag:
+            ref = elem.get('r')
+            col = _column_index(ref) if ref is not None else col + 1
+            t = elem.get('t', 'n')
+            value: Any = ''
+            if t == 'inlineStr':
+                si = elem.find(inline_tag)
+                if si is not None:
+                    value = _string_item_text(si)
+            else:
+                v = elem.find(value_tag)
+                if v is not None and v.text is not None:
+                    if t == 's':
+                        value = strings[int(v.text)]
+                    elif t == 'str' or t == 'e':
+                        value = v.text
+                    elif t == 'b':
+                        value = int(v.text)
+                    else:
+                        value = float(v.text)
+                        style = int(elem.get('s', 0))
+                        if style < len(date_styles) and date_styles[style]:
+                            value = _convert_date(value, datemode)
+            if col >= len(values):
+                values.extend([''] * (col + 1 - len(values)))
+            values[col] = value
+        elif tag == row_tag:
+            yield values
+            expected_row = row_number + 1
+            if sheet_data is not None:
+                # drop parsed rows, memory stays bounded by one row
+                sheet_data.clear()
+
+
+def iter_rows(path: str, sheet: Union[str, int] = 0, fields: Union[List[str], None] = None,
+              as_tuples: bool = False) -> Iterator[Union[Row, tuple]]:
+    """
+    read the data rows of a sheet one at a time straight from a xlsx file, without building a Dataset.
+    Only the shared strings of the workbook are kept in memory.
+    :param path: xlsx file
+    :param sheet: sheet name or index
+    :param fields: fields to read, all fields of the first row if None
+    :param as_tuples: yield tuples of values instead of Rows
+    :return: iterator of Rows or tuples
+    """
+    with zipfile.ZipFile(path) as zip:
+        parts = _worksheet_parts(zip)
+        if isinstance(sheet, int):
+            part = parts[sheet][1]
+        else:
+            for name, part in parts:
+                if name.lower() == sheet.lower():
+                    break
+            else:
+                raise NameError(f'{sheet} does not exist')
+        strings = _read_shared_strings(zip)
+        date_styles = _read_date_styles(zip)
+        datemode = _read_datemode(zip)
+
+        positions = None
+        schema = None
+        with zip.open(part) as f:
+            for values in _iter_sheet_values(f, strings, date_styles, datemode):
+                if positions is None:
+                    header = values
+                    if fields is None:
+                        fields = [*header]
+                    positions = []
+                    for field in fields:
+                        if field not in header:
+                            raise NameError(f'field {field} not found')
+                        positions.append(header.index(field))
+                    schema = Schema(fields)
+                    continue
+
+                picked = [values[p] if p < len(values) else '' for p in positions]
+                if as_tuples:
+                    yield tuple(int(v) if isinstance(v, float) and v % 1 == 0 else v for v in picked)
+                    continue
+                row = Row(fields, schema)
+                row.cells = [Cell(v, DATE_STYLE) if isinstance(v, (datetime.date, datetime.time)) else Cell(v)
+                             for v in picked]
+                yield row
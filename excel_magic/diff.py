@@ -1,4 +1,4 @@
-from typing import List, Tuple, Union
+from typing import List, Tuple, Union, Dict
 
 from excel_magic.dataset import Sheet, Row
 
@@ -7,6 +7,8 @@ class DiffSet:
     def __init__(self):
         self.not_found_in_a: Sheet = None
         self.not_found_in_b: Sheet = None
+        # rows having the same key but different values, only set by keyed diff
+        self.changed: Union['StrictDiffSet', None] = None
 
     def get_notfound(self, in_sheet: str):
         if in_sheet == 'a':
@@ -17,9 +19,13 @@ class DiffSet:
             raise ValueError(f'There is no sheet {in_sheet}!')
 
     def __str__(self):
-        return f'Summary: {self.not_found_in_b.__len__() + self.not_found_in_a.__len__()} differences in total.' \
-               f'\nnot found in a: {self.not_found_in_a.__len__()}' \
-               f'\nnot found in b: {self.not_found_in_b.__len__()}'
+        changed = 0 if self.changed is None else self.changed.diff.__len__()
+        result = f'Summary: {self.not_found_in_b.__len__() + self.not_found_in_a.__len__() + changed} differences in total.' \
+                 f'\nnot found in a: {self.not_found_in_a.__len__()}' \
+                 f'\nnot found in b: {self.not_found_in_b.__len__()}'
+        if self.changed is not None:
+            result += f'\nchanged: {changed}'
+        return result
 
 
 class StrictDiffRow:
@@ -45,27 +51,45 @@ class StrictDiffSet:
         self.diff.append(row)
 
 
-def diff(sheet_a: Sheet, sheet_b: Sheet) -> DiffSet:
+def _row_key(row: Row, fields: List[str]) -> tuple:
+    return tuple(row[f].value for f in fields)
+
+
+def diff(sheet_a: Sheet, sheet_b: Sheet, key: Union[List[str], None] = None) -> DiffSet:
     """
     This will search every row from sheet a in sheet b
     :param sheet_a: sheet a, rows to search
     :param sheet_b: sheet b, where rows are searched in
+    :param key: fields identifying a row, if given rows with the same key but different values are reported as changed
     :return: DiffSet containing rows in sheet a that are not found in sheet b and reversed
     """
+    if key is not None:
+        return _keyed_diff(sheet_a, sheet_b, key)
+    for field in sheet_a.fields:
+        if field not in sheet_b.fields:
+            raise NameError(f'field {field} not found')
+
     result = DiffSet()
 
     not_found_in_b: Sheet = Sheet(sheet='diff_b')
     not_found_in_b.fields = [*sheet_a.fields]
     not_found_in_a: Sheet = Sheet(sheet='diff_a')
     not_found_in_a.fields = [*sheet_a.fields]
+
+    fields = sheet_a.fields
+    keys_a = set()
+    for row in sheet_a.data_rows:
+        keys_a.add(_row_key(row, fields))
+    keys_b = set()
+    for row in sheet_b.data_rows:
+        keys_b.add(_row_key(row, fields))
+
     for row in sheet_a.get_rows():
-        r = sheet_b.find(**row, none_if_not_found=True)
-        if r is None:
+        if _row_key(row, fields) not in keys_b:
             not_found_in_b.append_row(row)
 
     for row in sheet_b.get_rows():
-        r = sheet_a.find(**row, none_if_not_found=True)
-        if r is None:
+        if _row_key(row, fields) not in keys_a:
             not_found_in_a.append_row(row)
 
     result.not_found_in_a = not_found_in_a
@@ -74,6 +98,63 @@ def diff(sheet_a: Sheet, sheet_b: Sheet) -> DiffSet:
     return result
 
 
+def _keyed_diff(sheet_a: Sheet, sheet_b: Sheet, key: List[str]) -> DiffSet:
+    """
+    match rows of both sheets by key, rows sharing a key are paired in order of appearance
+    """
+    for field in key:
+        if field not in sheet_a.fields or field not in sheet_b.fields:
+            raise NameError(f'field {field} not found')
+    compared = [f for f in sheet_a.fields if f in sheet_b.fields and f not in key]
+
+    result = DiffSet()
+    not_found_in_b: Sheet = Sheet(sheet='diff_b')
+    not_found_in_b.fields = [*sheet_a.fields]
+    not_found_in_a: Sheet = Sheet(sheet='diff_a')
+    not_found_in_a.fields = [*sheet_b.fields]
+    changed = StrictDiffSet()
+
+    rows_b: Dict[tuple, List[Row]] = {}
+    for row in sheet_b.data_rows:
+        k = _row_key(row, key)
+        if k in rows_b:
+            rows_b[k].append(row)
+        else:
+            rows_b[k] = [row]
+
+    # position of the next unmatched row of b for every key
+    matched: Dict[tuple, int] = {}
+    for i in range(sheet_a.data_rows.__len__()):
+        row_a = sheet_a.data_rows[i]
+        k = _row_key(row_a, key)
+        candidates = rows_b.get(k, [])
+        n = matched.get(k, 0)
+        if n >= candidates.__len__():
+            not_found_in_b.append_row(row_a)
+            continue
+        matched[k] = n + 1
+        row_b = candidates[n]
+        diff_cols = []
+        for col in compared:
+            if row_a[col].value != row_b[col].value:
+                diff_cols.append(col)
+        if diff_cols.__len__() != 0:
+            changed.append(StrictDiffRow(row_a, row_b, diff_cols, i))
+
+    unmatched_b = set()
+    for k in rows_b:
+        for row_b in rows_b[k][matched.get(k, 0):]:
+            unmatched_b.add(id(row_b))
+    for row_b in sheet_b.data_rows:
+        if id(row_b) in unmatched_b:
+            not_found_in_a.append_row(row_b)
+
+    result.not_found_in_a = not_found_in_a
+    result.not_found_in_b = not_found_in_b
+    result.changed = changed
+    return result
+
+
 def strict_diff(sheet_a: Sheet, sheet_b: Sheet) -> StrictDiffSet:
     result = StrictDiffSet()
     if sheet_a.fields != sheet_b.fields:
@@ -4,12 +4,12 @@ from setuptools import setup
 setup(
         name='excelmagic',
         version='1.3.7',
-        packages=setuptools.find_packages(),
+        packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*', 'tests', 'tests.*']),
         url='https://github.com/guo40020/excel-magic',
         license='MIT',
         author='Kelly',
         author_email='',
         description='',
-        install_requires=['xlrd', 'XlsxWriter', 'Pillow'],
+        install_requires=['xlrd>=1.2.0,<2', 'XlsxWriter', 'Pillow'],
         python_requires='>3.7'
 )
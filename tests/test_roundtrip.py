@@ -0,0 +1,213 @@
+import datetime
+import json
+import os
+import pickle
+import re
+import zipfile
+from xml.etree import ElementTree
+
+import pytest
+import xlsxwriter
+
+from excel_magic.dataset import Dataset, Sheet, Style, _sheet_cells, open_file
+
+NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+@pytest.fixture
+def workbook(tmp_path) -> str:
+    """
+    two sheets with every kind of value, an empty sheet and a ragged row
+    """
+    path = str(tmp_path / 'book.xlsx')
+    wb = xlsxwriter.Workbook(path)
+    date = wb.add_format({'num_format': 'yyyy/mm/dd'})
+    people = wb.add_worksheet('People')
+    people.write_row(0, 0, ['Id', 'Name', 'Score', 'Born', 'Member'])
+    for i in range(1, 301):
+        people.write_row(i, 0, [i, f'name{i % 50}', i * 1.5, None, i % 2 == 0])
+        people.write_datetime(i, 3, datetime.datetime(2000, 1, 1) + datetime.timedelta(days=i), date)
+    wb.add_worksheet('Empty')
+    other = wb.add_worksheet('Other')
+    other.write_row(0, 0, ['A', 'B'])
+    other.write_row(1, 0, ['x', 1])
+    other.write_row(2, 0, ['y'])
+    wb.close()
+    return path
+
+
+def _content(dataset: Dataset, saved: bool = False) -> list:
+    """
+    names, fields, values and number formats of the sheets. Saved dates are read back as ISO strings
+    without format, compare them so with saved
+    """
+    result = []
+    for i in range(len(dataset.sheets)):
+        sheet = dataset.get_sheet_by_index(i)
+        rows = []
+        for r in sheet.data_rows:
+            cells = []
+            for f in sheet.fields:
+                if f not in r:
+                    cells.append(None)
+                elif saved and isinstance(r[f].value, datetime.date):
+                    cells.append((r[f].value.isoformat(), ''))
+                else:
+                    cells.append((r[f].value, '' if saved else r[f].style.num_format))
+            rows.append(cells)
+        result.append((sheet.name, [*sheet.fields], rows))
+    return result
+
+
+def test_lazy_and_columnar_load_like_eager(workbook):
+    eager = _content(Dataset(workbook, suppress_warning=True))
+    assert [name for name, _, _ in eager] == ['People', 'Other']
+    assert eager[0][2][0][3] == (datetime.date(2000, 1, 2), 'yyyy/mm/dd')
+    assert _content(Dataset(workbook, suppress_warning=True, lazy=True)) == eager
+    assert _content(Dataset(workbook, suppress_warning=True, columnar=True)) == eager
+
+
+def test_lazy_sheets_are_listed_once_loaded(workbook):
+    dataset = Dataset(workbook, suppress_warning=True, lazy=True)
+    dataset.sheets[0].name = 'Renamed'
+    assert isinstance(dataset.sheets[0], Sheet)
+    dataset.get_sheet_by_index(1)
+    assert dataset.workbook is None
+    dataset.save()
+    assert [t.name for t in Dataset(workbook, suppress_warning=True).sheets] == ['Renamed', 'Other']
+
+
+def test_parallel_load_with_index(workbook):
+    eager = Dataset(workbook, suppress_warning=True)
+    parallel = Dataset(workbook, suppress_warning=True, workers=2)
+    assert _content(parallel) == _content(eager)
+    sheet = parallel.get_sheet_by_name('People')
+    sheet.create_index('Name')
+    assert sheet.find(Name='name7') == [r for r in sheet.data_rows if r['Name'].value == 'name7']
+    sheet.data_rows[0]['Name'].value = 'name7'
+    assert sheet.find(Name='name7') == [r for r in sheet.data_rows if r['Name'].value == 'name7']
+
+
+def test_split_jobs_do_not_carry_indexed_sheet(workbook, tmp_path):
+    sheet = Dataset(workbook, suppress_warning=True).get_sheet_by_name('People')
+    before = len(pickle.dumps(_sheet_cells(sheet, sheet.data_rows[:40], True)))
+    sheet.create_index('Id')
+    sheet.find(Id=5)
+    assert len(pickle.dumps(_sheet_cells(sheet, sheet.data_rows[:40], True))) == before
+    os.makedirs(tmp_path / 'serial')
+    os.makedirs(tmp_path / 'parallel')
+    serial = sheet.split_rows(str(tmp_path / 'serial'), row_count=100)
+    parallel = sheet.split_rows(str(tmp_path / 'parallel'), row_count=100, workers=2)
+    assert len(serial) == 3
+    assert [_content(Dataset(p, suppress_warning=True)) for p in serial] == \
+           [_content(Dataset(p, suppress_warning=True)) for p in parallel]
+
+
+def _cell_font(path: str, part: str, ref: str) -> ElementTree.Element:
+    with zipfile.ZipFile(path) as z:
+        sheet = ElementTree.fromstring(z.read(part))
+        styles = ElementTree.fromstring(z.read('xl/styles.xml'))
+    cell = next(c for c in sheet.iter(f'{NS}c') if c.get('r') == ref)
+    xf = styles.find(f'{NS}cellXfs')[int(cell.get('s', 0))]
+    return styles.find(f'{NS}fonts')[int(xf.get('fontId', 0))]
+
+
+def test_incremental_save_after_style_edit(workbook):
+    dataset = Dataset(workbook, suppress_warning=True)
+    style = Style()
+    dataset.get_sheet_by_name('People').set_row_style(0, style)
+    # the empty sheet is gone, the whole file is written
+    dataset.save(incremental=True)
+    with zipfile.ZipFile(workbook) as z:
+        other = z.read('xl/worksheets/sheet2.xml')
+    assert [t.is_dirty() for t in dataset.sheets] == [False, False]
+    style.bold = True
+    assert [t.is_dirty() for t in dataset.sheets] == [True, False]
+    dataset.save(incremental=True)
+    assert _cell_font(workbook, 'xl/worksheets/sheet1.xml', 'A2').find(f'{NS}b') is not None
+    assert _cell_font(workbook, 'xl/worksheets/sheet1.xml', 'A3').find(f'{NS}b') is None
+    with zipfile.ZipFile(workbook) as z:
+        assert z.read('xl/worksheets/sheet2.xml') == other
+        assert z.testzip() is None
+    assert os.path.exists(workbook + '.bak')
+    assert _content(Dataset(workbook, suppress_warning=True), True) == _content(dataset, True)
+
+
+def test_incremental_save_drops_drawings_of_rewritten_sheet(workbook, tmp_path):
+    path = str(tmp_path / 'images.xlsx')
+    wb = xlsxwriter.Workbook(path)
+    for name in ('A', 'B'):
+        sheet = wb.add_worksheet(name)
+        sheet.write_row(0, 0, ['x'])
+        sheet.write_row(1, 0, [1])
+        sheet.write_comment('A2', 'note')
+    wb.close()
+    dataset = Dataset(path, suppress_warning=True)
+    dataset.get_sheet_by_name('A').data_rows[0]['x'].value = 2
+    dataset.save(incremental=True)
+    with zipfile.ZipFile(path) as z:
+        names = set(z.namelist())
+        content_types = z.read('[Content_Types].xml').decode()
+    assert 'xl/comments1.xml' not in names and 'xl/comments2.xml' in names
+    assert all(part in names for part in re.findall(r'PartName="/([^"]+)"', content_types))
+
+
+def _write_json(path: str, data) -> str:
+    with open(path, 'w') as f:
+        json.dump(data, f)
+    return path
+
+
+def test_import_json_formats(tmp_path):
+    rows = [{'d': '2020-01-02', 'n': 1}, {'d': '2020-01-03', 'n': 2}]
+    # a dict of fields makes a sheet without rows
+    path = _write_json(str(tmp_path / 'a.json'), {'A': rows, 'B': {'f1': None, 'f2': None}})
+    dataset = Dataset(str(tmp_path / 'b.xlsx'))
+    dataset.import_json(path)
+    assert [(t.name, t.fields, len(t.data_rows)) for t in dataset.sheets] == [('A', ['d', 'n'], 2),
+                                                                            ('B', ['f1', 'f2'], 0)]
+
+    def parse_dates(o: dict) -> dict:
+        return {k: datetime.date.fromisoformat(v) if k == 'd' else v for k, v in o.items()}
+
+    out = str(tmp_path / 'out.ndjson')
+    dataset.export_json(out, lines=True)
+    lines = Dataset(str(tmp_path / 'c.xlsx'))
+    lines.import_json(out, lines=True, object_hook=parse_dates)
+    assert lines.sheets[0].data_rows[1]['d'].value == datetime.date(2020, 1, 3)
+
+    nested_rows = [{'d': '2020-01-02', 'inner': {'d': '2020-01-04'}}]
+    nested = _write_json(str(tmp_path / 'n.json'), nested_rows)
+    seen = []
+
+    def hook(o: dict) -> dict:
+        seen.append(sorted(o))
+        return o
+
+    sheet = Sheet(sheet='S')
+    sheet.import_json(nested, object_hook=hook)
+    from_sheet = [*seen]
+    seen.clear()
+    dataset = Dataset(str(tmp_path / 'd.xlsx'))
+    dataset.import_json(_write_json(str(tmp_path / 'm.json'), {'S': nested_rows}), object_hook=hook)
+    assert seen == from_sheet == [['d'], ['d', 'inner']]
+
+
+def test_csv_types_are_decided_on_every_value(tmp_path):
+    path = str(tmp_path / 'a.csv')
+    with open(path, 'w') as f:
+        f.write('id,n,x\n007,1,1_000\n1,2.5,2\n')
+        for i in range(3, 30):
+            f.write(f'{i},{i},{i}\n')
+        f.write('99,3,abc\n')
+    sheet = Sheet(sheet='S')
+    sheet.read_csv(path, chunk_size=10)
+    assert [sheet.data_rows[0][f].value for f in sheet.fields] == ['007', 1.0, '1_000']
+    assert sheet.data_rows[-2]['x'].value == '29'
+
+
+def test_open_file_round_trip(workbook, tmp_path):
+    dataset = open_file(workbook, suppress_warning=True)
+    dataset.get_sheet_by_name('Other').append_row(['z', 3])
+    dataset.save()
+    assert _content(Dataset(workbook, suppress_warning=True), True) == _content(dataset, True)